@@ -0,0 +1,31 @@
+import argparse
+import sys
+
+from benchmarks.suite import benchmarks, run, compare, save, load
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Time the sova hot paths')
+    parser.add_argument('-k', '--filter', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('-o', '--output', help='write results to this JSON file')
+    parser.add_argument('-b', '--baseline', help='compare with results saved earlier with --output')
+    parser.add_argument('-t', '--tolerance', type=float, default=.2,
+                        help='allowed slowdown against the baseline as a fraction, default 0.2')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = run([b for b in benchmarks if args.filter in b.name], repeat=args.repeat)
+    if args.output:
+        save(results, args.output)
+
+    if args.baseline:
+        regressions = compare(results, load(args.baseline), args.tolerance)
+        for name, ratio in regressions.items():
+            print(f'REGRESSION {name}: {ratio:.2f}x slower than baseline')
+        if regressions:
+            sys.exit(1)
+        print('No regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
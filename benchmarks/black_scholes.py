@@ -0,0 +1,53 @@
+import time
+from typing import Dict
+
+import numpy as np
+
+from sova.black_scholes import OptionType, black_scholes_greeks, black_scholes_price, black_scholes_delta
+
+sizes = [int(1e3), int(1e5), int(1e7)]
+per_call_limit = int(1e4)
+
+
+def make_inputs(n: int, seed: int = 0) -> Dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return {
+        'sign': np.where(rng.uniform(size=n) > .5, 1., -1.),
+        's_0': rng.uniform(.5, 1.5, n),
+        'k': rng.uniform(.5, 1.5, n),
+        't': rng.uniform(.01, 2, n),
+        'r': np.full(n, .01),
+        'sigma': rng.uniform(.05, .5, n),
+    }
+
+
+def time_per_call(inputs: Dict[str, np.ndarray]) -> float:
+    # Scalar API prices and deltas one option per call, as asset.StockOption does today
+    types = [OptionType.CALL if s > 0 else OptionType.PUT for s in inputs['sign']]
+    rows = list(zip(types, inputs['s_0'], inputs['k'], inputs['t'], inputs['r'], inputs['sigma']))
+    start = time.perf_counter()
+    for row in rows:
+        black_scholes_price(*row)
+        black_scholes_delta(*row)
+    return time.perf_counter() - start
+
+
+def time_batched(inputs: Dict[str, np.ndarray]) -> float:
+    start = time.perf_counter()
+    black_scholes_greeks(**inputs)
+    return time.perf_counter() - start
+
+
+def main():
+    print(f'{"n_options":>10} {"per-call opt/s":>16} {"batched opt/s":>16} {"speedup":>9}')
+    for n in sizes:
+        inputs = make_inputs(n)
+        batched = n / time_batched(inputs)
+        # Per-call throughput is extrapolated from a capped sample, 1e7 scalar calls would take hours
+        sample = {k: v[:per_call_limit] for k, v in inputs.items()}
+        per_call = len(sample['s_0']) / time_per_call(sample)
+        print(f'{n:>10} {per_call:>16.0f} {batched:>16.0f} {batched / per_call:>8.0f}x')
+
+
+if __name__ == '__main__':
+    main()
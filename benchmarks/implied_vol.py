@@ -0,0 +1,58 @@
+import time
+
+import numpy as np
+from scipy.optimize import brentq
+
+from benchmarks.black_scholes import make_inputs
+from sova.black_scholes import OptionType, black_scholes_greeks, black_scholes_price
+from sova.implied_vol import implied_vol
+
+sizes = [int(1e3), int(1e5), int(1e6)]
+per_call_limit = int(2e3)
+
+
+def make_chain(n: int, seed: int = 0):
+    inputs = make_inputs(n, seed)
+    sigma = inputs.pop('sigma')
+    price = black_scholes_greeks(sigma=sigma, **inputs).price
+    return price, inputs, sigma
+
+
+def time_brentq(price: np.ndarray, inputs) -> float:
+    # One scipy.optimize.brentq root search per option on the scalar pricer
+    start = time.perf_counter()
+    for i in range(len(price)):
+        option_type = OptionType.CALL if inputs['sign'][i] > 0 else OptionType.PUT
+        args = (option_type, inputs['s_0'][i], inputs['k'][i], inputs['t'][i], inputs['r'][i])
+        try:
+            brentq(lambda sigma: black_scholes_price(*args, sigma) - price[i], 1e-6, 10., xtol=1e-12)
+        except ValueError:
+            pass
+    return time.perf_counter() - start
+
+
+def time_vectorized(price: np.ndarray, inputs, initial_sigma=None):
+    start = time.perf_counter()
+    result = implied_vol(price, initial_sigma=initial_sigma, **inputs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    # iters is the median number of Newton or bisection steps per option
+    print(f'{"n_options":>10} {"brentq opt/s":>14} {"cold opt/s":>14} {"iters":>6} {"warm opt/s":>14} {"iters":>6}')
+    for n in sizes:
+        price, inputs, sigma = make_chain(n)
+        cold_time, cold = time_vectorized(price, inputs)
+        # Next tick: spot and vols move a little, the previous solution is the starting point
+        inputs = dict(inputs, s_0=inputs['s_0'] * 1.001)
+        next_price = black_scholes_greeks(sigma=sigma * 1.01, **inputs).price
+        warm_time, warm = time_vectorized(next_price, inputs, cold.sigma)
+        # brentq throughput is extrapolated from a capped sample
+        sample = slice(0, per_call_limit)
+        brent = min(n, per_call_limit) / time_brentq(next_price[sample], {k: v[sample] for k, v in inputs.items()})
+        print(f'{n:>10} {brent:>14.0f} {n / cold_time:>14.0f} {np.median(cold.iterations):>6.0f} '
+              f'{n / warm_time:>14.0f} {np.median(warm.iterations):>6.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import datetime as dt
+import json
+import os
+import platform
+import statistics
+import timeit
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from sova.asset import StockOption, Stock, Deposit
+from sova.batch_simulation import BatchHedgeSimulation
+from sova.black_scholes import OptionType, black_scholes_price, black_scholes_delta, black_scholes_greeks
+from sova.implied_vol import implied_vol
+from sova.lattice import american_greeks
+from sova.market_data import generate_market_data, generate_market_paths
+from sova.portfolio import Portfolio, Trade
+from sova.simulation import HedgeSimulation
+
+
+simulation_data_path = os.path.join(os.path.dirname(__file__), os.pardir, 'simulation_data.pickle')
+
+
+class Benchmark(NamedTuple):
+    name: str
+    # Builds the state once and returns the callable being timed
+    setup: Callable[[], Callable[[], object]]
+
+
+def _scalar_price():
+    return lambda: black_scholes_price(OptionType.CALL, 1., 1.05, .5, .01, .2)
+
+
+def _scalar_delta():
+    return lambda: black_scholes_delta(OptionType.PUT, 1., 1.05, .5, .01, .2)
+
+
+def _batched_greeks(n: int):
+    def setup():
+        rng = np.random.default_rng(0)
+        s = rng.uniform(.5, 1.5, n)
+        return lambda: black_scholes_greeks(1., s, 1., .5, .01, .2)
+    return setup
+
+
+def _implied_vol(n: int, warm: bool):
+    def setup():
+        rng = np.random.default_rng(0)
+        s = rng.uniform(.5, 1.5, n)
+        sigma = rng.uniform(.05, .5, n)
+        price = black_scholes_greeks(1., s, 1., .5, .01, sigma).price
+        initial_sigma = sigma * 1.01 if warm else None
+        return lambda: implied_vol(price, 1., s, 1., .5, .01, initial_sigma=initial_sigma)
+    return setup
+
+
+def _american_greeks(n: int):
+    # A book of puts revalued once per simulated day: price, delta and gamma from one lattice
+    def setup():
+        rng = np.random.default_rng(0)
+        k = rng.uniform(.8, 1.2, n)
+        t = rng.uniform(.05, 2., n)
+        return lambda: american_greeks(-1., 1., k, t, .01, .2, vega_rho=False)
+    return setup
+
+
+def _market_data(n_obs: int):
+    return lambda: lambda: generate_market_data(1e-5, np.array([.01]), np.array([.02]), n_obs=n_obs, seed=0)
+
+
+def _portfolio_delta(n_trades: int):
+    def setup():
+        market_time = dt.datetime(2020, 1, 1)
+        opt = StockOption(1, dt.datetime(2021, 1, 1), strike=1., sigma=.1)
+        portfolio = Portfolio([Trade(market_time, 1., opt)])
+        for i in range(n_trades - 1):
+            portfolio.trade(market_time + dt.timedelta(minutes=i), 1., Stock(.1) if i % 2 else Deposit(-.1))
+        end = market_time + dt.timedelta(days=30)
+        return lambda: portfolio.current_delta(1., end)
+    return setup
+
+
+def _hedge_simulation():
+    market_data = pd.read_pickle(simulation_data_path)
+
+    def run():
+        opt = StockOption(amount=1, expiry=market_data.index[-1].to_pydatetime(),
+                          strike=1.05 * market_data.asset_price.iloc[0], sigma=.1)
+        portfolio = Portfolio([Trade(market_data.index[0].to_pydatetime(), market_data.asset_price.iloc[0], opt)],
+                              .05)
+        return HedgeSimulation(portfolio).run_simulation(market_data)
+    return run
+
+
+def _batch_simulation(n_paths: int):
+    def setup():
+        paths = generate_market_paths(1e-5, np.array([.01]), np.array([.002]), n_paths=n_paths, n_obs=366, seed=0)
+        return lambda: BatchHedgeSimulation().run_simulation(paths)
+    return setup
+
+
+benchmarks = [
+    Benchmark('black_scholes_price', _scalar_price),
+    Benchmark('black_scholes_delta', _scalar_delta),
+    Benchmark('black_scholes_greeks[n=100000]', _batched_greeks(100000)),
+    Benchmark('implied_vol[n=100000]', _implied_vol(100000, warm=False)),
+    Benchmark('implied_vol_warm_start[n=100000]', _implied_vol(100000, warm=True)),
+    Benchmark('american_greeks[n=300]', _american_greeks(300)),
+    *[Benchmark(f'generate_market_data[n_obs={n}]', _market_data(n)) for n in [1000, 10000, 100000]],
+    *[Benchmark(f'portfolio_current_delta[n_trades={n}]', _portfolio_delta(n)) for n in [10, 1000, 100000]],
+    Benchmark('hedge_simulation[simulation_data]', _hedge_simulation),
+    Benchmark('batch_hedge_simulation[n_paths=1000]', _batch_simulation(1000)),
+]
+
+
+def run(selected: Optional[List[Benchmark]] = None, repeat: int = 5, min_time: float = .2) -> Dict:
+    results = {}
+    for benchmark in selected if selected is not None else benchmarks:
+        timer = timeit.Timer(benchmark.setup())
+        number = 1
+        while True:
+            elapsed = timer.timeit(number)
+            if elapsed >= min_time or number >= 1e6:
+                break
+            number *= 10
+        times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+        results[benchmark.name] = {'best': min(times), 'median': statistics.median(times), 'number': number,
+                                   'repeat': repeat}
+        print(f'{benchmark.name:<45} {min(times) * 1e3:>12.4f} ms')
+
+    return {
+        'meta': {
+            'created': dt.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float = .2) -> Dict[str, float]:
+    # Benchmarks whose best time grew by more than tolerance (as a fraction) against the baseline, with their ratio
+    regressions = {}
+    for name, result in current['results'].items():
+        if name in baseline['results']:
+            ratio = result['best'] / baseline['results'][name]['best']
+            if ratio > 1 + tolerance:
+                regressions[name] = ratio
+    return regressions
+
+
+def save(results: Dict, path: str):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
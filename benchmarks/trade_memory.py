@@ -0,0 +1,47 @@
+import datetime as dt
+import tracemalloc
+
+from sova.asset import Deposit, Stock, StockOption
+from sova.portfolio import Trade, TradeBlotter
+
+n_trades = 100000
+start = dt.datetime(2020, 1, 1)
+expiry = dt.datetime(2021, 1, 1)
+
+
+def make_asset(i: int):
+    # A rebalancing book: mostly deposit/stock hedge pairs with an option every tenth trade
+    if i % 10 == 0:
+        return StockOption(amount=1, expiry=expiry, strike=1. + i % 7 / 100, sigma=.1)
+    return Deposit(.5 * i) if i % 2 else Stock(-.5)
+
+
+def bytes_per_trade_objects() -> float:
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    trades = [Trade(start + dt.timedelta(minutes=i), 1. + i / n_trades, make_asset(i)) for i in range(n_trades)]
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del trades
+    return used / n_trades
+
+
+def bytes_per_trade_blotter() -> float:
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    blotter = TradeBlotter()
+    for i in range(n_trades):
+        blotter.append(start + dt.timedelta(minutes=i), 1. + i / n_trades, make_asset(i))
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return used / n_trades
+
+
+def main():
+    print(f'List of Trade objects: {bytes_per_trade_objects():.0f} bytes per trade')
+    print(f'TradeBlotter: {bytes_per_trade_blotter():.0f} bytes per trade '
+          f'({TradeBlotter.dtype.itemsize} per row, the rest is unused capacity)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import time
+
+import numpy as np
+
+from sova.asset import StockOption
+from sova.batch_simulation import BatchHedgeSimulation
+from sova.market_data import generate_market_paths, sampling_methods
+from sova.monte_carlo import hedge_pnl_estimate
+from sova.portfolio import Portfolio, Trade
+
+n_paths = 4096
+delta_thresholds = [.3, .05]
+
+
+def make_simulation(paths, delta_threshold: float) -> BatchHedgeSimulation:
+    # offset=1 starts every path at the same price, so one strike gives the same moneyness everywhere
+    opt = StockOption(amount=1, expiry=paths.market_time[-1].to_pydatetime(), strike=1.05 * paths.asset_price[0, 0],
+                      sigma=.1)
+    return BatchHedgeSimulation(Portfolio([Trade(paths.market_time[0].to_pydatetime(), 1., opt)], delta_threshold))
+
+
+def main():
+    # paths x is the plain Monte Carlo path count needed for the stderr of each scheme, as a multiple of n_paths
+    print(f'{"threshold":>9} {"sampling":>10} {"controls":>8} {"pnl mean":>10} {"stderr":>10} {"paths x":>8} '
+          f'{"seconds":>8}')
+    for delta_threshold in delta_thresholds:
+        plain = None
+        for sampling in sampling_methods:
+            start = time.perf_counter()
+            paths = generate_market_paths(1e-5, np.array([.001]), np.array([.002]), n_paths=n_paths, n_obs=366,
+                                          offset=1, seed=0, sampling=sampling, n_scrambles=32)
+            simulation = make_simulation(paths, delta_threshold)
+            result = simulation.run_simulation(paths)
+            elapsed = time.perf_counter() - start
+            for use_controls in [False, True]:
+                estimate = hedge_pnl_estimate(simulation, paths, result, use_controls)
+                plain = plain or estimate
+                print(f'{delta_threshold:>9} {sampling:>10} {str(use_controls):>8} {estimate.mean:>10.5f} '
+                      f'{estimate.stderr:>10.2e} {plain.paths_for_stderr(estimate.stderr) / n_paths:>8.1f} '
+                      f'{elapsed:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,15 @@
+import copy
 import datetime as dt
+import sys
 from abc import ABC, abstractmethod
+from typing import Hashable, Optional, Callable, Tuple
 
-from sova.black_scholes import black_scholes_delta, black_scholes_price, OptionType
+from sova import instrumentation
+from sova.black_scholes import Greeks, black_scholes_delta, black_scholes_greeks, black_scholes_price, \
+    black_scholes_price_delta, option_sign, OptionType
+from sova.cache import ValuationCache
+from sova.lattice import american_greeks
+from sova.market_time import MarketTime, seconds_in_year, to_ns, year_fraction
 
 
 class AbstractAsset(ABC):
@@ -10,13 +18,13 @@ class AbstractAsset(ABC):
 
     @abstractmethod
     def current_price(self, stock_price: float,
-                      market_time: dt.datetime,
+                      market_time: MarketTime,
                       risk_free_rate: float) -> float:
         raise NotImplementedError
 
     @abstractmethod
     def current_delta(self, stock_price: float,
-                      market_time: dt.datetime,
+                      market_time: MarketTime,
                       risk_free_rate: float) -> float:
         raise NotImplementedError
 
@@ -24,6 +32,32 @@ class AbstractAsset(ABC):
     def __add__(self, other):
         raise NotImplementedError
 
+    def current_price_delta(self, stock_price: float,
+                            market_time: MarketTime,
+                            risk_free_rate: float = .01) -> Tuple[float, float]:
+        return (self.current_price(stock_price, market_time, risk_free_rate),
+                self.current_delta(stock_price, market_time, risk_free_rate))
+
+    def risk(self, stock_price: float,
+             market_time: MarketTime,
+             risk_free_rate: float = .01) -> Greeks:
+        # Price and all the greeks of the position at once; assets without a volatility or rate exposure only
+        # need price and delta
+        return Greeks(self.current_price(stock_price, market_time, risk_free_rate),
+                      self.current_delta(stock_price, market_time, risk_free_rate),
+                      0., 0., 0., 0.)
+
+    @property
+    def contract_key(self) -> Hashable:
+        # Positions with equal keys are the same contract and may be netted by amount.
+        # Unknown assets are never netted with anything else.
+        return type(self).__name__, id(self)
+
+    def unit(self) -> 'AbstractAsset':
+        unit_asset = copy.copy(self)
+        unit_asset.amount = 1
+        return unit_asset
+
     def __str__(self):
         return f'{str(type(self).__name__)}(amount={self.amount})'
 
@@ -32,13 +66,17 @@ class AbstractAsset(ABC):
 
 
 class Deposit(AbstractAsset):
+    @property
+    def contract_key(self) -> Hashable:
+        return type(self).__name__,
+
     def current_price(self, stock_price: float,
-                      market_time: dt.datetime,
+                      market_time: MarketTime,
                       risk_free_rate=.01) -> float:
         return self.amount
 
     def current_delta(self, stock_price: float,
-                      market_time: dt.datetime,
+                      market_time: MarketTime,
                       risk_free_rate=.01) -> float:
         return 0
 
@@ -50,48 +88,89 @@ class Deposit(AbstractAsset):
 
 
 class Stock(AbstractAsset):
+    # underlying names the stock in multi-underlying books; None is the single underlying of a plain book
+    def __init__(self, amount, underlying: Hashable = None):
+        super().__init__(amount)
+        self.underlying = underlying
+
+    @property
+    def contract_key(self) -> Hashable:
+        return type(self).__name__, self.underlying
+
     def current_price(self,
                       stock_price: float,
-                      market_time: dt.datetime,
+                      market_time: MarketTime,
                       risk_free_rate=.01) -> float:
         return self.amount * stock_price
 
     def current_delta(self, stock_price: float,
-                      market_time: dt.datetime,
+                      market_time: MarketTime,
                       risk_free_rate=.01) -> float:
         return self.amount
 
     def __add__(self, other):
-        if isinstance(other, Stock):
-            return Stock(self.amount + other.amount)
+        if isinstance(other, Stock) and other.underlying == self.underlying:
+            return Stock(self.amount + other.amount, self.underlying)
+        elif isinstance(other, Stock):
+            raise NotImplementedError('Stocks on different underlyings could not be added')
         else:
             raise NotImplementedError('Stock could be added only to stock')
 
 
 class StockOption(AbstractAsset):
-    seconds_in_year = 60 * 60 * 24 * 365
+    seconds_in_year = seconds_in_year
 
     def __init__(self,
                  amount: float,
                  expiry: dt.datetime,
                  strike: float = 100.,
                  sigma: float = 0.2,
-                 option_type: OptionType = OptionType.CALL):
+                 option_type: OptionType = OptionType.CALL,
+                 cache: Optional[ValuationCache] = None,
+                 underlying: Hashable = None):
         super().__init__(amount)
         self.expiry = expiry
         self.strike = strike
         self.sigma = sigma
         self.option_type = option_type
+        self.cache = cache
+        self.underlying = underlying
 
-    def _convert_time_to_bs(self, market_time: dt.datetime):
-        return (self.expiry - market_time).total_seconds() / self.seconds_in_year
+    @property
+    def expiry(self) -> dt.datetime:
+        return self._expiry
+
+    @expiry.setter
+    def expiry(self, expiry: dt.datetime):
+        self._expiry = expiry
+        self.expiry_ns = to_ns(expiry)
+
+    @property
+    def contract_key(self) -> Hashable:
+        return type(self).__name__, self.expiry_ns, self.strike, self.sigma, self.option_type.value, self.underlying
+
+    def _convert_time_to_bs(self, market_time: MarketTime):
+        return year_fraction(to_ns(market_time), self.expiry_ns)
+
+    def _unit_value(self,
+                    name: str,
+                    stock_price: float,
+                    market_time: MarketTime,
+                    risk_free_rate: float,
+                    f: Callable[[], float]) -> float:
+        if self.cache is None:
+            return f()
+        return self.cache.get((stock_price, market_time, risk_free_rate), (self.contract_key, name), f)
 
     def current_price(self,
                       stock_price: float,
-                      market_time: dt.datetime,
+                      market_time: MarketTime,
                       risk_free_rate: float = 0.01) -> float:
-        if self.expiry < market_time:
+        if self.expiry_ns < to_ns(market_time):
             return 0
+        elif self.cache is not None:
+            # Price and delta share one cache entry per tick
+            return self.current_price_delta(stock_price, market_time, risk_free_rate)[0]
         else:
             return self.amount * black_scholes_price(payoff=self.option_type,
                                                      s_0=stock_price,
@@ -102,11 +181,13 @@ class StockOption(AbstractAsset):
 
     def current_delta(self,
                       stock_price: float,
-                      market_time: dt.datetime,
+                      market_time: MarketTime,
                       risk_free_rate: float = 0.01) -> float:
-        if self.expiry < market_time:
+        if self.expiry_ns < to_ns(market_time):
             return 0
-        elif self.expiry < market_time:
+        elif self.cache is not None:
+            return self.current_price_delta(stock_price, market_time, risk_free_rate)[1]
+        elif self.expiry_ns < to_ns(market_time):
             if self.option_type == OptionType.CALL:
                 return self.amount if self.strike < stock_price else 0
             else:
@@ -119,5 +200,94 @@ class StockOption(AbstractAsset):
                                                      r=risk_free_rate,
                                                      sigma=self.sigma)
 
+    def current_price_delta(self,
+                            stock_price: float,
+                            market_time: MarketTime,
+                            risk_free_rate: float = 0.01) -> Tuple[float, float]:
+        if self.expiry_ns < to_ns(market_time):
+            return 0, 0
+        price, delta = self._unit_value('price_delta', stock_price, market_time, risk_free_rate,
+                                        lambda: black_scholes_price_delta(payoff=self.option_type,
+                                                                          s_0=stock_price,
+                                                                          k=self.strike,
+                                                                          t=self._convert_time_to_bs(market_time),
+                                                                          r=risk_free_rate,
+                                                                          sigma=self.sigma))
+        return self.amount * price, self.amount * delta
+
+    def risk(self,
+             stock_price: float,
+             market_time: MarketTime,
+             risk_free_rate: float = 0.01) -> Greeks:
+        if self.expiry_ns < to_ns(market_time):
+            return Greeks(0., 0., 0., 0., 0., 0.)
+        greeks = self._unit_value('risk', stock_price, market_time, risk_free_rate,
+                                  lambda: black_scholes_greeks(sign=option_sign(self.option_type),
+                                                               s_0=stock_price,
+                                                               k=self.strike,
+                                                               t=self._convert_time_to_bs(market_time),
+                                                               r=risk_free_rate,
+                                                               sigma=self.sigma))
+        return Greeks(*(self.amount * float(g) for g in greeks))
+
     def __add__(self, other):
         raise NotImplementedError('Add operation is not supported for options')
+
+
+class AmericanStockOption(StockOption):
+    # Exercisable at any time up to expiry and valued on the binomial lattice of sova.lattice. Price, delta and gamma
+    # come from a single tree, so they share one cache entry per tick.
+    def _lattice(self,
+                 stock_price: float,
+                 market_time: MarketTime,
+                 risk_free_rate: float,
+                 vega_rho: bool = False) -> Greeks:
+        return self._unit_value('risk' if vega_rho else 'lattice', stock_price, market_time, risk_free_rate,
+                                lambda: Greeks(*(float(g) for g in american_greeks(
+                                    sign=option_sign(self.option_type),
+                                    s_0=stock_price,
+                                    k=self.strike,
+                                    t=self._convert_time_to_bs(market_time),
+                                    r=risk_free_rate,
+                                    sigma=self.sigma,
+                                    vega_rho=vega_rho))))
+
+    def current_price(self,
+                      stock_price: float,
+                      market_time: MarketTime,
+                      risk_free_rate: float = 0.01) -> float:
+        if self.expiry_ns < to_ns(market_time):
+            return 0
+        return self.amount * self._lattice(stock_price, market_time, risk_free_rate).price
+
+    def current_delta(self,
+                      stock_price: float,
+                      market_time: MarketTime,
+                      risk_free_rate: float = 0.01) -> float:
+        if self.expiry_ns < to_ns(market_time):
+            return 0
+        return self.amount * self._lattice(stock_price, market_time, risk_free_rate).delta
+
+    def current_price_delta(self,
+                            stock_price: float,
+                            market_time: MarketTime,
+                            risk_free_rate: float = 0.01) -> Tuple[float, float]:
+        if self.expiry_ns < to_ns(market_time):
+            return 0, 0
+        greeks = self._lattice(stock_price, market_time, risk_free_rate)
+        return self.amount * greeks.price, self.amount * greeks.delta
+
+    def risk(self,
+             stock_price: float,
+             market_time: MarketTime,
+             risk_free_rate: float = 0.01) -> Greeks:
+        if self.expiry_ns < to_ns(market_time):
+            return Greeks(0., 0., 0., 0., 0., 0.)
+        greeks = self._lattice(stock_price, market_time, risk_free_rate, vega_rho=True)
+        return Greeks(*(self.amount * g for g in greeks))
+
+
+instrumentation.register(sys.modules[__name__], 'black_scholes_price', 'pricing')
+instrumentation.register(sys.modules[__name__], 'black_scholes_delta', 'pricing')
+instrumentation.register(sys.modules[__name__], 'black_scholes_price_delta', 'pricing')
+instrumentation.register(sys.modules[__name__], 'american_greeks', 'pricing')
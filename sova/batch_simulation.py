@@ -0,0 +1,246 @@
+import sys
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from sova import instrumentation
+from sova.asset import StockOption, Deposit, Stock
+from sova.black_scholes import black_scholes_greeks, option_sign
+from sova.hedge_policy import HedgePolicy
+from sova.market_data import MarketPaths, generate_market_paths
+from sova.market_time import TimeGrid, to_ns, year_fraction
+from sova.pnl_explain import PnlExplainStats, explain_columns, explain_step, first_step_explain
+from sova.portfolio import Portfolio
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@dataclass
+class BatchSimulationResult:
+    market_time: 'pd.DatetimeIndex'
+    columns: Dict[str, np.ndarray]
+
+    @property
+    def n_paths(self) -> int:
+        return self.columns['asset_price'].shape[0]
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def path(self, i: int) -> 'pd.DataFrame':
+        import pandas as pd
+
+        return pd.DataFrame(data={c: v[i] for c, v in self.columns.items()}, index=self.market_time)
+
+
+@dataclass
+class _OptionLine:
+    sign: float
+    amount: float
+    expiry_ns: int
+    strike: Union[float, np.ndarray]
+    sigma: float
+    start_step: int
+
+
+class BatchHedgeSimulation:
+    def __init__(self,
+                 portfolio: Optional[Portfolio] = None,
+                 hedge_policy: Optional[HedgePolicy] = None,
+                 explain: bool = False):
+        # hedge_policy overrides the policy of the portfolio (or of the default book). With explain the result also
+        # has the per-step P&L explain columns of sova.pnl_explain.
+        self.portfolio = portfolio
+        self.hedge_policy = hedge_policy
+        self.explain = explain
+
+    def _default_book(self,
+                      asset_price: np.ndarray,
+                      time_ns: np.ndarray,
+                      risk_free_rate: np.ndarray) -> Tuple[List[_OptionLine], np.ndarray, np.ndarray, HedgePolicy]:
+        # Mirrors HedgeSimulation: one at-the-money-forward call per path expiring at the last market time
+        strike = asset_price[:, 0] / np.exp(-risk_free_rate[:, 0])
+        option = _OptionLine(sign=1., amount=1., expiry_ns=int(time_ns[-1]), strike=strike[:, None], sigma=.2,
+                             start_step=0)
+        no_trades = np.zeros(len(time_ns))
+        return [option], no_trades, no_trades, Portfolio([]).hedge_policy
+
+    def _portfolio_book(self, time_ns: np.ndarray) -> Tuple[List[_OptionLine], np.ndarray, np.ndarray, HedgePolicy]:
+        options = []
+        stock_trades = np.zeros(len(time_ns))
+        deposit_trades = np.zeros(len(time_ns))
+        for trade in self.portfolio.trades:
+            start_step = int(np.searchsorted(time_ns, to_ns(trade.trade_time), side='left'))
+            if start_step >= len(time_ns):
+                continue
+            asset = trade.asset
+            if getattr(asset, 'underlying', None) is not None:
+                raise NotImplementedError('Batch simulation runs books on a single underlying')
+            if type(asset) is StockOption:
+                options.append(_OptionLine(sign=float(option_sign(asset.option_type)),
+                                           amount=asset.amount,
+                                           expiry_ns=asset.expiry_ns,
+                                           strike=asset.strike,
+                                           sigma=asset.sigma,
+                                           start_step=start_step))
+            elif isinstance(asset, Stock):
+                stock_trades[start_step] += asset.amount
+            elif isinstance(asset, Deposit):
+                deposit_trades[start_step] += asset.amount
+            else:
+                raise NotImplementedError(f'{type(asset).__name__} is not supported by batch simulation')
+        return options, stock_trades, deposit_trades, self.portfolio.hedge_policy
+
+    def _book(self,
+              asset_price: np.ndarray,
+              time_ns: np.ndarray,
+              risk_free_rate: np.ndarray) -> Tuple[List[_OptionLine], np.ndarray, np.ndarray, HedgePolicy]:
+        if self.portfolio is None:
+            return self._default_book(asset_price, time_ns, risk_free_rate)
+        return self._portfolio_book(time_ns)
+
+    @staticmethod
+    def _option_legs(options: List[_OptionLine],
+                     asset_price: np.ndarray,
+                     time_grid: TimeGrid,
+                     risk_free_rate: np.ndarray,
+                     needs_gamma: bool,
+                     needs_theta: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # Option legs do not depend on hedging decisions, so they are valued for all paths and steps in one go
+        n_steps = asset_price.shape[1]
+        options_pv = np.zeros(asset_price.shape)
+        options_delta = np.zeros(asset_price.shape)
+        options_gamma = np.zeros(asset_price.shape)
+        options_theta = np.zeros(asset_price.shape)
+        for line in options:
+            t = time_grid.time_to_maturity(line.expiry_ns)
+            greeks = black_scholes_greeks(line.sign, asset_price, line.strike, t, risk_free_rate, line.sigma)
+            live = np.zeros(n_steps, dtype=bool)
+            live[line.start_step:] = True
+            live &= t >= 0
+            options_pv += np.where(live, line.amount * greeks.price, 0.)
+            options_delta += np.where(live, line.amount * greeks.delta, 0.)
+            if needs_gamma:
+                options_gamma += np.where(live, line.amount * greeks.gamma, 0.)
+            if needs_theta:
+                options_theta += np.where(live, line.amount * greeks.theta, 0.)
+        return options_pv, options_delta, options_gamma, options_theta
+
+    def option_delta_gamma(self,
+                           asset_price: np.ndarray,
+                           market_time: 'pd.DatetimeIndex',
+                           risk_free_rate: Union[float, np.ndarray] = .01) -> Tuple[np.ndarray, np.ndarray]:
+        # Black-Scholes delta and gamma of the unhedged option legs, (n_paths, n_steps) like the simulate columns
+        asset_price = np.atleast_2d(np.asarray(asset_price, dtype=float))
+        time_grid = TimeGrid(market_time)
+        risk_free_rate = np.broadcast_to(np.asarray(risk_free_rate, dtype=float), asset_price.shape)
+        options = self._book(asset_price, time_grid.ns, risk_free_rate)[0]
+        return self._option_legs(options, asset_price, time_grid, risk_free_rate, True)[1:3]
+
+    def simulate(self,
+                 asset_price: np.ndarray,
+                 market_time: 'pd.DatetimeIndex',
+                 risk_free_rate: Union[float, np.ndarray] = .01) -> BatchSimulationResult:
+        return self._simulate(asset_price, market_time, risk_free_rate, self.explain)
+
+    def _simulate(self,
+                  asset_price: np.ndarray,
+                  market_time: 'pd.DatetimeIndex',
+                  risk_free_rate: Union[float, np.ndarray],
+                  explain: bool) -> BatchSimulationResult:
+        import pandas as pd
+
+        asset_price = np.atleast_2d(np.asarray(asset_price, dtype=float))
+        n_paths, n_steps = asset_price.shape
+        time_grid = TimeGrid(market_time)
+        time_ns = time_grid.ns
+        risk_free_rate = np.broadcast_to(np.asarray(risk_free_rate, dtype=float), (n_paths, n_steps))
+
+        options, stock_trades, deposit_trades, policy = self._book(asset_price, time_ns, risk_free_rate)
+        policy = self.hedge_policy if self.hedge_policy is not None else policy
+        options_pv, options_delta, options_gamma, options_theta = self._option_legs(
+            options, asset_price, time_grid, risk_free_rate, policy.needs_gamma or explain, explain)
+
+        # The hedge policy makes the stock leg path dependent, so the walk is over steps with all paths at once
+        portfolio_pv = np.empty((n_paths, n_steps))
+        portfolio_delta = np.empty((n_paths, n_steps))
+        hedged_delta = np.empty((n_paths, n_steps))
+        hedge_asset_amount = np.empty((n_paths, n_steps))
+        hedge_deposit_amount = np.empty((n_paths, n_steps))
+        hedge_cost_amount = np.empty((n_paths, n_steps))
+        deposit_amount = np.empty((n_paths, n_steps))
+        stock = np.zeros(n_paths)
+        deposit = np.zeros(n_paths)
+        last_hedge_ns = np.zeros(n_paths, dtype=np.int64)
+        hedged_before = np.zeros(n_paths, dtype=bool)
+        for j in range(n_steps):
+            stock += stock_trades[j]
+            deposit += deposit_trades[j]
+            delta = options_delta[:, j] + stock
+            since_hedge = np.where(hedged_before, year_fraction(last_hedge_ns, time_ns[j]), np.inf)
+            hedge_asset = policy.rebalance(delta, options_gamma[:, j], asset_price[:, j], since_hedge)
+            hedge = hedge_asset != 0
+            hedge_cost = policy.cost(hedge_asset, asset_price[:, j])
+            hedge_deposit = np.where(hedge, -hedge_asset * asset_price[:, j] - hedge_cost, 0.)
+            last_hedge_ns[hedge] = time_ns[j]
+            hedged_before |= hedge
+
+            portfolio_pv[:, j] = options_pv[:, j] + stock * asset_price[:, j] + deposit
+            portfolio_delta[:, j] = delta
+            stock += hedge_asset
+            deposit += hedge_deposit
+            hedged_delta[:, j] = options_delta[:, j] + stock
+            hedge_asset_amount[:, j] = hedge_asset
+            hedge_deposit_amount[:, j] = hedge_deposit
+            hedge_cost_amount[:, j] = hedge_cost
+            deposit_amount[:, j] = deposit
+
+        columns = {
+            'asset_price': asset_price,
+            'porfolio_pv': portfolio_pv,
+            'portfolio_delta': portfolio_delta,
+            'portfolio_hedged_delta': hedged_delta,
+            'hedge_asset_amount': hedge_asset_amount,
+            'hedge_deposit_amount': hedge_deposit_amount
+        }
+        if explain:
+            # Everything the explain needs was kept per step, so it is one vectorized pass over all steps
+            explained = np.empty((len(explain_columns), n_paths, n_steps))
+            explained[:, :, 0] = first_step_explain(hedge_cost_amount[:, 0])
+            explained[:, :, 1:] = explain_step(portfolio_pv[:, 1:],
+                                               hedge_cost_amount[:, 1:],
+                                               np.diff(asset_price, axis=1),
+                                               year_fraction(time_ns[:-1], time_ns[1:]),
+                                               portfolio_pv[:, :-1] - hedge_cost_amount[:, :-1],
+                                               hedged_delta[:, :-1],
+                                               options_gamma[:, :-1],
+                                               options_theta[:, :-1],
+                                               deposit_amount[:, :-1],
+                                               risk_free_rate[:, :-1])
+            columns.update(zip(explain_columns, explained))
+        return BatchSimulationResult(market_time=pd.DatetimeIndex(market_time), columns=columns)
+
+    def run_simulation(self, market_paths: Optional[MarketPaths] = None) -> BatchSimulationResult:
+        market_paths = market_paths if market_paths is not None else generate_market_paths(a0=1e-4,
+                                                                                           p_arr=np.array([.01]),
+                                                                                           q_arr=np.array([.02]),
+                                                                                           n_paths=1000,
+                                                                                           n_obs=366)
+        return self.simulate(market_paths.asset_price, market_paths.market_time, market_paths.risk_free_rate)
+
+    def explain_stats(self,
+                      market_paths: Iterable[MarketPaths],
+                      stats: Optional[PnlExplainStats] = None) -> PnlExplainStats:
+        # P&L explain statistics over any number of blocks of paths, e.g. a generator of generate_market_paths calls.
+        # Only one block is simulated at a time and its result is dropped once added, so memory does not grow with the
+        # number of paths.
+        stats = stats if stats is not None else PnlExplainStats()
+        for paths in market_paths:
+            stats.update(self._simulate(paths.asset_price, paths.market_time, paths.risk_free_rate, True))
+        return stats
+
+
+instrumentation.register(sys.modules[__name__], 'black_scholes_greeks', 'pricing')
+instrumentation.register(BatchHedgeSimulation, 'simulate', 'simulation')
@@ -1,7 +1,17 @@
+import math
+import os
 from enum import Enum
+from typing import NamedTuple, Tuple
 
 import numpy as np
-import scipy.stats as ss
+
+# 'fast' evaluates the normal cdf with math.erfc for scalars and scipy.special.ndtr for arrays, both exact to double
+# precision in the tails. 'scipy' goes through scipy.stats.norm. Both scipy modules are only imported on first use,
+# so importing the pricing code costs no more than numpy and scalar pricing never loads scipy.
+norm_backends = ['fast', 'scipy']
+_norm_backend = os.environ.get('SOVA_NORM_BACKEND', 'fast')
+_sqrt_2 = math.sqrt(2)
+_sqrt_2_pi = math.sqrt(2 * math.pi)
 
 
 class OptionType(Enum):
@@ -9,20 +19,127 @@ class OptionType(Enum):
     PUT = -1
 
 
+class Greeks(NamedTuple):
+    price: np.ndarray
+    delta: np.ndarray
+    gamma: np.ndarray
+    vega: np.ndarray
+    theta: np.ndarray
+    rho: np.ndarray
+
+
+def set_norm_backend(name: str):
+    global _norm_backend
+    if name not in norm_backends:
+        raise ValueError(f'Normal distribution backend should be one of {norm_backends}, got {name}')
+    _norm_backend = name
+
+
+def norm_cdf(x):
+    if _norm_backend == 'scipy':
+        import scipy.stats as ss
+        return ss.norm.cdf(x)
+    elif isinstance(x, float):
+        return .5 * math.erfc(-x / _sqrt_2)
+    from scipy.special import ndtr
+    return ndtr(x)
+
+
+def norm_pdf(x):
+    if _norm_backend == 'scipy':
+        import scipy.stats as ss
+        return ss.norm.pdf(x)
+    elif isinstance(x, float):
+        return math.exp(-x * x / 2) / _sqrt_2_pi
+    return np.exp(-np.square(x) / 2) / _sqrt_2_pi
+
+
+def option_sign(option_type) -> np.ndarray:
+    # Maps OptionType (or an array of them) to +1 for calls and -1 for puts.
+    # By some reason payoff == OptionType.CALL does not work after module reloads, so compare values
+    if isinstance(option_type, Enum):
+        return float(option_type.value)
+    return np.array([o.value if isinstance(o, Enum) else o for o in np.ravel(option_type)],
+                    dtype=float).reshape(np.shape(option_type))
+
+
+def _is_float(*args) -> bool:
+    return all(isinstance(a, float) for a in args)
+
+
+def _exp(x):
+    return math.exp(x) if isinstance(x, float) else np.exp(x)
+
+
+def _d1_d2(s_0, k, t, r, sigma):
+    # Plain floats before expiry go through math, which is much cheaper than numpy scalars and errstate.
+    # At expiry d1 and d2 go to +-inf, so the closed forms degrade to the payoff
+    if _is_float(s_0, k, t, r, sigma) and t > 0 and sigma > 0 and s_0 > 0 and k > 0:
+        sigma_sqrt_t = sigma * math.sqrt(t)
+        d1 = (math.log(s_0 / k) + (r + sigma ** 2 / 2) * t) / sigma_sqrt_t
+        return d1, d1 - sigma_sqrt_t
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma_sqrt_t = sigma * np.sqrt(t)
+        d1 = (np.log(s_0 / k) + (r + sigma ** 2 / 2) * t) / sigma_sqrt_t
+    return d1, d1 - sigma_sqrt_t
+
+
+def black_scholes_greeks(sign,
+                         s_0,
+                         k,
+                         t,
+                         r,
+                         sigma) -> Greeks:
+    # All inputs broadcast against each other; sign is +1 for calls and -1 for puts.
+    # d1, d2 and the normal terms are evaluated once and shared by every greek. Vega and rho are per unit change of
+    # sigma and r, theta is the change of value per year of calendar time.
+    sign = np.asarray(sign, dtype=float)
+    s_0 = np.asarray(s_0, dtype=float)
+    k = np.asarray(k, dtype=float)
+    t = np.asarray(t, dtype=float)
+    r = np.asarray(r, dtype=float)
+    sigma = np.asarray(sigma, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sqrt_t = np.sqrt(t)
+        d1, d2 = _d1_d2(s_0, k, t, r, sigma)
+        discounted_k = k * np.exp(-r * t)
+        cdf_d1 = norm_cdf(sign * d1)
+        cdf_d2 = norm_cdf(sign * d2)
+        pdf_d1 = norm_pdf(d1)
+        live = sqrt_t > 0
+
+        price = sign * (s_0 * cdf_d1 - discounted_k * cdf_d2)
+        delta = sign * cdf_d1
+        gamma = np.where(live, pdf_d1 / (s_0 * sigma * sqrt_t), 0.)
+        vega = s_0 * pdf_d1 * sqrt_t
+        theta = np.where(live, -s_0 * pdf_d1 * sigma / (2 * sqrt_t), 0.) - sign * r * discounted_k * cdf_d2
+        rho = sign * t * discounted_k * cdf_d2
+    return Greeks(price, delta, gamma, vega, theta, rho)
+
+
 def black_scholes_price(payoff: OptionType,
                         s_0: float,
                         k: float,
                         t: float,
                         r: float,
                         sigma: float) -> float:
-    d1 = (np.log(s_0 / k) + (r + sigma ** 2 / 2) * t) / (sigma * np.sqrt(t))
-    d2 = (np.log(s_0 / k) + (r - sigma ** 2 / 2) * t) / (sigma * np.sqrt(t))
+    sign = option_sign(payoff)
+    d1, d2 = _d1_d2(s_0, k, t, r, sigma)
+    return sign * (s_0 * norm_cdf(sign * d1) - k * _exp(-r * t) * norm_cdf(sign * d2))
 
-    # By some reason payoff == OptionType.CALL does not work
-    if payoff.value == OptionType.CALL.value:
-        return s_0 * ss.norm.cdf(d1) - k * np.exp(-r * t) * ss.norm.cdf(d2)
-    else:
-        return k * np.exp(-r * t) * ss.norm.cdf(-d2) - s_0 * ss.norm.cdf(-d1)
+
+def black_scholes_price_delta(payoff: OptionType,
+                              s_0: float,
+                              k: float,
+                              t: float,
+                              r: float,
+                              sigma: float) -> Tuple[float, float]:
+    # Same values as black_scholes_price and black_scholes_delta, sharing d1 and N(d1)
+    sign = option_sign(payoff)
+    d1, d2 = _d1_d2(s_0, k, t, r, sigma)
+    cdf_d1 = norm_cdf(sign * d1)
+    return sign * (s_0 * cdf_d1 - k * _exp(-r * t) * norm_cdf(sign * d2)), cdf_d1 * sign
 
 
 def black_scholes_delta(payoff: OptionType = OptionType.CALL,
@@ -31,12 +148,8 @@ def black_scholes_delta(payoff: OptionType = OptionType.CALL,
                         t: float = 1.,
                         r: float = 0.1,
                         sigma: float = 0.2) -> float:
-    d1 = (np.log(s_0 / k) + (r + sigma ** 2 / 2) * t) / (sigma * np.sqrt(t))
-
-    if payoff == OptionType.CALL:
-        return ss.norm.cdf(d1)
-    else:
-        return ss.norm.cdf(d1) - 1
+    d1, _ = _d1_d2(s_0, k, t, r, sigma)
+    return norm_cdf(option_sign(payoff) * d1) * option_sign(payoff)
 
 
 def black_scholes_gamma(s_0: float = 100.,
@@ -44,5 +157,5 @@ def black_scholes_gamma(s_0: float = 100.,
                         t: float = 1.,
                         r: float = 0.1,
                         sigma: float = 0.2) -> float:
-    d1 = (np.log(s_0 / k) + (r + sigma ** 2 / 2) * t) / (sigma * np.sqrt(t))
-    return ss.norm.pdf(d1) / s_0 / np.sqrt(t)
+    d1, _ = _d1_d2(s_0, k, t, r, sigma)
+    return norm_pdf(d1) / (s_0 * sigma * np.sqrt(t))
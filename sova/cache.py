@@ -0,0 +1,44 @@
+from collections import OrderedDict
+from typing import Hashable, Callable
+
+
+class ValuationCache:
+    # Bounded LRU of valuations scoped to one market tick: as soon as a lookup comes with a different
+    # (stock_price, market_time, risk_free_rate) the cache is emptied, so a value can never outlive its tick.
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._tick = None
+        self._values = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @property
+    def hit_rate(self) -> float:
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.
+
+    def get(self, tick: Hashable, key: Hashable, compute: Callable[[], float]) -> float:
+        if tick != self._tick:
+            self._values.clear()
+            self._tick = tick
+
+        if key in self._values:
+            self._values.move_to_end(key)
+            self.hits += 1
+            return self._values[key]
+
+        self.misses += 1
+        value = compute()
+        self._values[key] = value
+        if len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._values.clear()
+        self._tick = None
+        self.hits = 0
+        self.misses = 0
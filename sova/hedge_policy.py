@@ -0,0 +1,80 @@
+import datetime as dt
+import math
+from abc import ABC, abstractmethod
+from typing import Union
+
+import numpy as np
+
+from sova.market_time import seconds_in_year
+
+# A hedge policy turns the book delta (and gamma, for band policies) into the stock amount to trade. Every argument is
+# either a scalar for the per-row simulation or an array over paths for the batched one, so policies only use
+# elementwise numpy operations. since_hedge is the time in years since the last rebalance, inf if there was none.
+# Proportional transaction costs are charged to the deposit leg: transaction_cost * |traded amount| * stock price.
+
+
+class HedgePolicy(ABC):
+    needs_gamma = False
+
+    def __init__(self, transaction_cost: float = 0.):
+        self.transaction_cost = transaction_cost
+
+    @abstractmethod
+    def rebalance(self, delta, gamma, stock_price, since_hedge) -> np.ndarray:
+        raise NotImplementedError
+
+    def cost(self, traded_amount, stock_price) -> np.ndarray:
+        return self.transaction_cost * abs(traded_amount) * stock_price
+
+
+def _trade_outside_band(delta, band, to_edge: bool) -> np.ndarray:
+    # Nothing is traded inside [-band, band]; outside the delta goes to zero or only back to the nearest edge.
+    # Scalars from the per-row simulation skip the ufunc overhead.
+    if isinstance(delta, float) and isinstance(band, float):
+        if abs(delta) <= band:
+            return 0.
+        return math.copysign(band, delta) - delta if to_edge else -delta
+    target = np.sign(delta) * band if to_edge else 0.
+    return np.where(np.abs(delta) > band, target - delta, 0.)
+
+
+class ThresholdPolicy(HedgePolicy):
+    # The classic rule: neutralize the delta once it leaves a fixed band
+    def __init__(self, delta_threshold: float = .005, transaction_cost: float = 0., to_edge: bool = False):
+        super().__init__(transaction_cost)
+        self.delta_threshold = delta_threshold
+        self.to_edge = to_edge
+
+    def rebalance(self, delta, gamma, stock_price, since_hedge) -> np.ndarray:
+        return _trade_outside_band(delta, self.delta_threshold, self.to_edge)
+
+
+class WhalleyWilmottPolicy(HedgePolicy):
+    # Asymptotic no-transaction band of Whalley and Wilmott (1997): the half width (3 cost S gamma^2 / 2 aversion)^1/3
+    # widens with gamma and costs. The exp(-r(T - t)) factor of the paper is close to one and is left out, as a book
+    # has no single maturity. By default the delta is only brought back to the band edge.
+    needs_gamma = True
+
+    def __init__(self, transaction_cost: float, risk_aversion: float = 1., to_edge: bool = True):
+        super().__init__(transaction_cost)
+        self.risk_aversion = risk_aversion
+        self.to_edge = to_edge
+
+    def band(self, gamma, stock_price) -> np.ndarray:
+        return np.cbrt(1.5 * self.transaction_cost * stock_price * np.square(gamma) / self.risk_aversion)
+
+    def rebalance(self, delta, gamma, stock_price, since_hedge) -> np.ndarray:
+        return _trade_outside_band(delta, self.band(gamma, stock_price), self.to_edge)
+
+
+class TimeSchedulePolicy(HedgePolicy):
+    # Neutralizes the delta once at least interval has passed since the last rebalance
+    def __init__(self, interval: Union[dt.timedelta, float], transaction_cost: float = 0.):
+        super().__init__(transaction_cost)
+        self.interval = interval.total_seconds() / seconds_in_year if isinstance(interval, dt.timedelta) \
+            else interval
+
+    def rebalance(self, delta, gamma, stock_price, since_hedge) -> np.ndarray:
+        if isinstance(since_hedge, float):
+            return -delta if since_hedge >= self.interval else 0.
+        return np.where(since_hedge >= self.interval, -delta, 0.)
@@ -0,0 +1,102 @@
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+from sova.black_scholes import black_scholes_greeks
+
+
+class ImpliedVolResult(NamedTuple):
+    sigma: np.ndarray
+    converged: np.ndarray
+    # Newton or bisection steps per option; a warm start at the answer takes none
+    iterations: np.ndarray
+    # model price - target price at the returned sigma
+    error: np.ndarray
+
+    @property
+    def n_iterations(self) -> int:
+        return int(self.iterations.max(initial=0))
+
+    @property
+    def converged_fraction(self) -> float:
+        return float(self.converged.mean()) if self.converged.size else 1.
+
+
+def _initial_guess(s_0, k, t, r) -> np.ndarray:
+    # Manaster-Koehler: the vol at the inflection point of the price in sigma, from where Newton on a call or put price
+    # converges monotonically
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(2 * np.abs(np.log(s_0 / k) + r * t) / t)
+
+
+def implied_vol(price,
+                sign,
+                s_0,
+                k,
+                t,
+                r,
+                initial_sigma=None,
+                tol: float = 1e-10,
+                sigma_tol: float = 1e-12,
+                max_iterations: int = 100,
+                sigma_bounds: Tuple[float, float] = (1e-6, 10.)) -> ImpliedVolResult:
+    # Inverts black_scholes_greeks(sign, s_0, k, t, r, sigma).price for sigma; inputs broadcast like there.
+    # Safeguarded Newton: every evaluation shrinks a bracket [lo, hi] around the root and a Newton step that leaves it
+    # (or has no usable vega) is replaced by bisection. Only unconverged options are repriced, so warm starts from the
+    # previous tick (initial_sigma) cost about one pricing call. Prices outside the no-arbitrage bounds, or options at
+    # expiry, have no implied vol and come back as nan, not converged. A vol outside sigma_bounds comes back as the
+    # nearest bound, not converged.
+    arrays = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (price, sign, s_0, k, t, r)))
+    shape = arrays[0].shape
+    price, sign, s_0, k, t, r = (a.ravel() for a in arrays)
+    n = len(price)
+
+    discounted_k = k * np.exp(-r * t)
+    lower = np.maximum(sign * (s_0 - discounted_k), 0.)
+    upper = np.where(sign > 0, s_0, discounted_k)
+    valid = (t > 0) & (price > lower) & (price < upper)
+
+    lo = np.full(n, sigma_bounds[0])
+    hi = np.full(n, sigma_bounds[1])
+    sigma = _initial_guess(s_0, k, t, r) if initial_sigma is None \
+        else np.broadcast_to(np.asarray(initial_sigma, dtype=float), shape).ravel().copy()
+    sigma = np.where(np.isfinite(sigma), np.clip(sigma, lo, hi), .5 * (lo + hi))
+
+    converged = np.zeros(n, dtype=bool)
+    iterations = np.zeros(n, dtype=np.int64)
+    error = np.full(n, np.nan)
+    priced_above = np.zeros(n, dtype=bool)
+    priced_below = np.zeros(n, dtype=bool)
+    active = np.flatnonzero(valid)
+    for iteration in range(max_iterations + 1):
+        if not len(active):
+            break
+        greeks = black_scholes_greeks(sign[active], s_0[active], k[active], t[active], r[active], sigma[active])
+        diff = greeks.price - price[active]
+        error[active] = diff
+
+        # Prices increase with sigma, so the sign of the error tells which side of the root sigma is on
+        above = diff > 0
+        hi[active] = np.where(above, sigma[active], hi[active])
+        lo[active] = np.where(above, lo[active], sigma[active])
+        priced_above[active] |= above
+        priced_below[active] |= ~above
+        # A narrow bracket only pins the root down once sigma was priced on both sides of it. One that closed onto a
+        # bound without that means the root lies outside sigma_bounds: stop there, but not as converged
+        narrow = hi[active] - lo[active] <= sigma_tol
+        converged[active] = (np.abs(diff) <= tol) | (narrow & priced_above[active] & priced_below[active])
+        done = (np.abs(diff) <= tol) | narrow
+        if iteration == max_iterations:
+            break
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = sigma[active] - diff / greeks.vega
+        inside = (newton > lo[active]) & (newton < hi[active])
+        step = np.where(inside, newton, .5 * (lo[active] + hi[active]))
+        sigma[active] = np.where(done, sigma[active], step)
+        iterations[active] += ~done
+        active = active[~done]
+
+    sigma = np.where(valid, sigma, np.nan)
+    return ImpliedVolResult(sigma.reshape(shape), converged.reshape(shape), iterations.reshape(shape),
+                            error.reshape(shape))
@@ -0,0 +1,102 @@
+import functools
+import json
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Hot functions register themselves here at import time. Nothing is wrapped until record() is entered, and the
+# originals are put back on exit, so instrumentation costs nothing while it is off.
+_hooks: List[Tuple[object, str, str, Optional[Callable[..., int]]]] = []
+_recorder: Optional['Recorder'] = None
+
+
+def register(owner, name: str, stage: str, items: Optional[Callable[..., int]] = None):
+    # owner is the module or class the hot path looks the function up on. items, called with the same arguments,
+    # counts the units of work per call (e.g. positions scanned by a valuation).
+    _hooks.append((owner, name, stage, items))
+
+
+class StageStats:
+    __slots__ = ('calls', 'total_time', 'items')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.
+        self.items = 0
+
+
+class Recorder:
+    # Call counts, cumulative wall time and work items per (stage, function). Times are inclusive: a valuation
+    # running inside a hedge decision is counted in both stages.
+    def __init__(self):
+        self.stats: Dict[Tuple[str, str], StageStats] = {}
+
+    def _wrap(self, stage: str, name: str, f: Callable, items: Optional[Callable[..., int]]) -> Callable:
+        stats = self.stats.setdefault((stage, name), StageStats())
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                stats.total_time += time.perf_counter() - start
+                stats.calls += 1
+                if items is not None:
+                    stats.items += items(*args, **kwargs)
+
+        return wrapper
+
+    def to_dict(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        result = {}
+        for (stage, name), stats in self.stats.items():
+            result.setdefault(stage, {})[name] = {
+                'calls': stats.calls,
+                'total_time': stats.total_time,
+                'mean_time': stats.total_time / stats.calls if stats.calls else 0.,
+                'items': stats.items,
+                'items_per_call': stats.items / stats.calls if stats.calls else 0.,
+            }
+        return result
+
+    def to_json(self, path: Optional[str] = None) -> str:
+        text = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_frame(self):
+        import pandas as pd
+
+        rows = [{'stage': stage, 'function': name, **values}
+                for stage, functions in self.to_dict().items()
+                for name, values in functions.items()]
+        return pd.DataFrame(rows, columns=['stage', 'function', 'calls', 'total_time', 'mean_time', 'items',
+                                           'items_per_call']).set_index(['stage', 'function'])
+
+
+@contextmanager
+def record() -> Iterator[Recorder]:
+    global _recorder
+    if _recorder is not None:
+        raise RuntimeError('Instrumentation is already recording')
+
+    recorder = Recorder()
+    patched = []
+    try:
+        for owner, name, stage, items in _hooks:
+            raw = vars(owner).get(name)
+            label = f'{owner.__name__}.{name}'
+            wrapper = recorder._wrap(stage, label, getattr(owner, name), items)
+            setattr(owner, name, staticmethod(wrapper) if isinstance(raw, staticmethod) else wrapper)
+            patched.append((owner, name, raw))
+        _recorder = recorder
+        yield recorder
+    finally:
+        _recorder = None
+        for owner, name, raw in reversed(patched):
+            if raw is not None:
+                setattr(owner, name, raw)
+            else:
+                delattr(owner, name)
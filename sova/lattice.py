@@ -0,0 +1,104 @@
+from typing import Tuple
+
+import numpy as np
+
+from sova.black_scholes import Greeks, black_scholes_greeks
+
+# American options on a Cox-Ross-Rubinstein binomial tree, many contracts per call. The arrays are laid out
+# (node, option) so every backward step works on contiguous rows for all options at once.
+# The tree starts two steps before the valuation time (Pelsser and Vorst), so the three nodes at time zero give
+# centred delta and gamma from the same backward pass as the price. The step before expiry uses the Black-Scholes
+# value of the remaining step (Broadie and Detemple), which removes most of the odd-even oscillation of plain CRR.
+default_steps = 128
+vega_bump = .01
+rho_bump = .001
+
+
+def _node_prices(s_0: np.ndarray, log_u: np.ndarray, step: int) -> np.ndarray:
+    # Node j of step i is s_0 u^(2j - i), counting steps from the root at -2 dt
+    return s_0 * np.exp((2 * np.arange(step + 1)[:, None] - step) * log_u)
+
+
+def _crr(sign: np.ndarray,
+         s_0: np.ndarray,
+         k: np.ndarray,
+         t: np.ndarray,
+         r: np.ndarray,
+         sigma: np.ndarray,
+         n_steps: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # 1-d inputs of equal length, t > 0 and n_steps >= 3; returns price, delta, gamma and theta
+    dt = t / n_steps
+    log_u = sigma * np.sqrt(dt)
+    u = np.exp(log_u)
+    growth = np.exp(r * dt)
+    p_disc = (growth - 1 / u) / (u - 1 / u) / growth
+    q_disc = 1 / growth - p_disc
+
+    # The nodes of step i are those of step i + 2 without the outermost two, so exercise values are tabulated once
+    # for the last step and once for the one before, and every other step reads a slice of the one with its parity
+    last = n_steps + 1
+    exercise = {step % 2: (step, np.maximum(sign * (_node_prices(s_0, log_u, step) - k), 0.))
+                for step in (last, last - 1)}
+    continuation = black_scholes_greeks(sign, _node_prices(s_0, log_u, last), k, dt, r, sigma).price
+    value = np.maximum(continuation, exercise[last % 2][1])
+
+    up = np.empty_like(value)
+    theta_value = value[2].copy() if last == 4 else None
+    for i in range(last - 1, 1, -1):
+        np.multiply(value[1:i + 2], p_disc, out=up[:i + 1])
+        value = value[:i + 1]
+        value *= q_disc
+        value += up[:i + 1]
+        step, table = exercise[i % 2]
+        offset = (step - i) // 2
+        np.maximum(value, table[offset:offset + i + 1], out=value)
+        if i == 4:
+            theta_value = value[2].copy()
+
+    # Step 2 is the valuation time, with nodes s_0 / u^2, s_0 and s_0 u^2; step 4 has s_0 in the middle 2 dt later
+    s_down, s_up = s_0 / (u * u), s_0 * u * u
+    v_down, v_mid, v_up = value
+    delta = (v_up - v_down) / (s_up - s_down)
+    gamma = ((v_up - v_mid) / (s_up - s_0) - (v_mid - v_down) / (s_0 - s_down)) / ((s_up - s_down) / 2)
+    theta = (theta_value - v_mid) / (2 * dt)
+    return v_mid.copy(), delta, gamma, theta
+
+
+def american_greeks(sign,
+                    s_0,
+                    k,
+                    t,
+                    r,
+                    sigma,
+                    n_steps: int = default_steps,
+                    vega_rho: bool = True) -> Greeks:
+    # Inputs broadcast like black_scholes_greeks. Price, delta, gamma and theta come from one tree; vega and rho are
+    # central differences over bumped trees batched into the same backward pass, which costs five times as much.
+    # With vega_rho=False the bumped trees are skipped and lattice priced options get nan vega and rho.
+    if n_steps < 3:
+        raise ValueError(f'The lattice needs at least 3 steps, got {n_steps}')
+    arrays = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (sign, s_0, k, t, r, sigma)))
+    shape = arrays[0].shape
+    sign, s_0, k, t, r, sigma = (a.ravel() for a in arrays)
+
+    # Without dividends an American call is never exercised early at non-negative rates, and at expiry every option
+    # is worth its payoff, so those keep the closed form
+    greeks = [np.array(g, dtype=float).ravel() for g in black_scholes_greeks(sign, s_0, k, t, r, sigma)]
+    tree = np.flatnonzero((t > 0) & ((sign < 0) | (r < 0)))
+    if len(tree):
+        args = [a[tree] for a in (sign, s_0, k, t, r, sigma)]
+        if vega_rho:
+            # Base, sigma up and down, r up and down go through one tree; the sigma bump shrinks for vols near zero
+            h = np.minimum(vega_bump, .5 * args[5])
+            shifts = [(0., 0.), (0., h), (0., -h), (rho_bump, 0.), (-rho_bump, 0.)]
+            args = [np.tile(a, len(shifts)) for a in args[:4]] + \
+                [np.concatenate([args[4] + dr for dr, _ in shifts]), np.concatenate([args[5] + ds for _, ds in shifts])]
+        price, delta, gamma, theta = (g.reshape(-1, len(tree)) for g in _crr(*args, n_steps))
+        greeks[0][tree], greeks[1][tree], greeks[2][tree], greeks[4][tree] = price[0], delta[0], gamma[0], theta[0]
+        if vega_rho:
+            greeks[3][tree] = (price[1] - price[2]) / (2 * h)
+            greeks[5][tree] = (price[3] - price[4]) / (2 * rho_bump)
+        else:
+            greeks[3][tree] = greeks[5][tree] = np.nan
+    return Greeks(*(g.reshape(shape) for g in greeks))
+
@@ -1,7 +1,147 @@
 import datetime as dt
+import math
+from collections import deque
+from dataclasses import dataclass
+from operator import mul
+from typing import TYPE_CHECKING, Optional, Union, Tuple
 
 import numpy as np
-import pandas as pd
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+Seed = Optional[Union[int, np.random.SeedSequence, np.random.Generator]]
+
+# 'antithetic' pairs every path with its mirror image, 'sobol' and 'halton' draw scrambled low-discrepancy points (one
+# dimension per step) through scipy.stats.qmc, which is only imported when one of them is chosen.
+sampling_methods = ['pseudo', 'antithetic', 'sobol', 'halton']
+
+
+def _garch_recursion(shocks: np.ndarray,
+                     a0: float,
+                     p_arr: np.ndarray,
+                     q_arr: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # GARCH(p, q) variance recursion over Python floats: the last p squared returns and q variances live in
+    # ring buffers, so every step is O(p + q) instead of re-copying the whole history.
+    # Lags before the start of the path are taken equal to the initial values of 1.
+    n_obs = len(shocks) + 1
+    p_list = [float(p) for p in np.ravel(p_arr)]
+    q_list = [float(q) for q in np.ravel(q_arr)]
+    eps2_lags = deque([1.] * len(p_list), maxlen=len(p_list))
+    sigma_lags = deque([1.] * len(q_list), maxlen=len(q_list))
+
+    sigma_arr = [1.] * n_obs
+    eps_arr = [1.] * n_obs
+    for i, shock in enumerate(shocks.tolist(), 1):
+        sigma = a0 + (sum(map(mul, p_list, eps2_lags)) + sum(map(mul, q_list, sigma_lags)))
+        eps = shock * math.sqrt(sigma)
+        eps2_lags.append(eps * eps)
+        sigma_lags.append(sigma)
+        sigma_arr[i] = sigma
+        eps_arr[i] = eps
+
+    return np.array(sigma_arr), np.array(eps_arr)
+
+
+def _garch_recursion_paths(shocks: np.ndarray,
+                           a0: float,
+                           p_arr: np.ndarray,
+                           q_arr: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Same recursion as _garch_recursion evolved for all paths at once. Shocks are (n_paths, n_steps), results are
+    # time-major (n_obs, n_paths) so every step reads its lags as a contiguous window of rows.
+    n_paths, n_steps = shocks.shape
+    p_vec = np.ravel(p_arr).astype(float)
+    q_vec = np.ravel(q_arr).astype(float)
+    n_lags = max(len(p_vec), len(q_vec))
+
+    sigma_arr = np.ones((n_lags + n_steps + 1, n_paths))
+    eps_arr = np.ones((n_lags + n_steps + 1, n_paths))
+    eps2_arr = np.ones((n_lags + n_steps + 1, n_paths))
+    for i in range(n_lags + 1, n_lags + n_steps + 1):
+        sigma = a0 + (p_vec @ eps2_arr[i - len(p_vec):i] + q_vec @ sigma_arr[i - len(q_vec):i])
+        eps = shocks[:, i - n_lags - 1] * np.sqrt(sigma)
+        sigma_arr[i] = sigma
+        eps_arr[i] = eps
+        eps2_arr[i] = eps * eps
+
+    return sigma_arr[n_lags:], eps_arr[n_lags:]
+
+
+def _standard_normal_shocks(n_paths: int,
+                            n_steps: int,
+                            sampling: str,
+                            n_scrambles: int,
+                            rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    # Returns (n_paths, n_steps) N(0, 1) shocks and the independent sample every path belongs to: the two legs of an
+    # antithetic pair, or all paths of one scramble, are a single sample when estimating standard errors
+    if sampling not in sampling_methods:
+        raise ValueError(f'Sampling should be one of {sampling_methods}, got {sampling}')
+    if sampling == 'pseudo':
+        return rng.standard_normal((n_paths, n_steps)), np.arange(n_paths)
+    if sampling == 'antithetic':
+        if n_paths % 2:
+            raise ValueError(f'Antithetic sampling needs an even number of paths, got {n_paths}')
+        shocks = rng.standard_normal((n_paths // 2, n_steps))
+        return np.concatenate([shocks, -shocks]), np.tile(np.arange(n_paths // 2), 2)
+
+    try:
+        from scipy.stats import qmc
+    except ImportError:
+        raise ImportError(f'{sampling} sampling needs scipy.stats.qmc (scipy >= 1.7)')
+    from scipy.special import ndtri
+    engine = qmc.Sobol if sampling == 'sobol' else qmc.Halton
+    # Paths are split into n_scrambles blocks, each an independent randomization of the same point set. Setting up a
+    # scrambled engine is costly in hundreds of dimensions, so the points are scrambled once and every block gets its
+    # own uniform random shift modulo 1, which keeps each point uniform on the cube.
+    blocks = np.array_split(np.arange(n_paths), max(min(n_scrambles, n_paths), 1))
+    points = engine(n_steps, scramble=True, seed=rng).random(len(blocks[0]))
+    uniforms = np.concatenate([(points[:len(block)] + rng.random(n_steps)) % 1. for block in blocks])
+    path_group = np.repeat(np.arange(len(blocks)), [len(block) for block in blocks])
+    # Scrambled points are never exactly 0, but a coarse Sobol sample can be; keep the shocks finite
+    return ndtri(np.clip(uniforms, np.finfo(float).tiny, 1 - np.finfo(float).epsneg)), path_group
+
+
+def _asset_prices(eps_arr: np.ndarray, axis: int = -1) -> np.ndarray:
+    # Price at step i is driven by the return drawn at step i - 1
+    eps_arr = np.moveaxis(eps_arr, axis, -1)
+    asset_arr = np.ones_like(eps_arr)
+    np.cumprod(np.exp(eps_arr[..., :-1]), axis=-1, out=asset_arr[..., 1:])
+    return np.moveaxis(asset_arr, -1, axis)
+
+
+def _market_time(n_obs: int, offset: int) -> 'pd.DatetimeIndex':
+    import pandas as pd
+
+    market_start_date = dt.datetime(2020, 1, 1)
+    return pd.date_range(market_start_date + dt.timedelta(days=offset),
+                         periods=max(n_obs - offset, 0),
+                         freq='D',
+                         name='market_time')
+
+
+@dataclass
+class MarketPaths:
+    market_time: 'pd.DatetimeIndex'
+    asset_volatility: np.ndarray
+    asset_return: np.ndarray
+    asset_price: np.ndarray
+    risk_free_rate: float
+    # Paths sharing a group are one independent sample (see _standard_normal_shocks)
+    path_group: Optional[np.ndarray] = None
+
+    @property
+    def n_paths(self) -> int:
+        return self.asset_price.shape[0]
+
+    def path(self, i: int) -> 'pd.DataFrame':
+        import pandas as pd
+
+        return pd.DataFrame(data={
+            'asset_volatility': self.asset_volatility[i],
+            'asset_return': self.asset_return[i],
+            'asset_price': self.asset_price[i],
+            'risk_free_rate': self.risk_free_rate
+        }, index=self.market_time)
 
 
 def generate_market_data(a0: float,
@@ -9,31 +149,44 @@ def generate_market_data(a0: float,
                          q_arr: np.ndarray,
                          n_obs: int = 1000,
                          offset: int = 10,
-                         risk_free_rate: float = 0.01) -> pd.DataFrame:
-    market_start_date = dt.datetime(2020, 1, 1)
-
-    p = len(p_arr)
-    q = len(q_arr)
-    p_arr = np.array([p_arr])
-    q_arr = np.array([q_arr])
-
-    eps_arr = np.array([1])
-    sigma_arr = np.array([1])
-    asset_arr = np.array([1])
+                         risk_free_rate: float = 0.01,
+                         seed: Seed = None) -> 'pd.DataFrame':
+    import pandas as pd
 
-    for i in range(1, n_obs):
-        sigma = a0 + np.sum(p_arr * eps_arr[-p:] ** 2 + q_arr * sigma_arr[-q:])
-        eps = np.random.normal(0, 1, 1)[0] * np.sqrt(sigma)
-        asset = np.exp(eps_arr[-1]) * asset_arr[-1]
-
-        sigma_arr = np.append(sigma_arr, sigma)
-        eps_arr = np.append(eps_arr, eps)
-        asset_arr = np.append(asset_arr, asset)
+    rng = np.random.default_rng(seed)
+    shocks = rng.standard_normal(n_obs - 1)
+    sigma_arr, eps_arr = _garch_recursion(shocks, a0, p_arr, q_arr)
+    asset_arr = _asset_prices(eps_arr)
 
     return pd.DataFrame(data={
         'asset_volatility': np.sqrt(sigma_arr[offset:]),
         'asset_return': eps_arr[offset:],
         'asset_price': asset_arr[offset:],
-        'market_time': [market_start_date + dt.timedelta(days=d) for d in range(offset, n_obs)],
+        'market_time': _market_time(n_obs, offset),
         'risk_free_rate': risk_free_rate
     }).set_index('market_time')
+
+
+def generate_market_paths(a0: float,
+                          p_arr: np.ndarray,
+                          q_arr: np.ndarray,
+                          n_paths: int = 1000,
+                          n_obs: int = 1000,
+                          offset: int = 10,
+                          risk_free_rate: float = 0.01,
+                          seed: Seed = None,
+                          sampling: str = 'pseudo',
+                          n_scrambles: int = 8) -> MarketPaths:
+    # n_scrambles only applies to quasi-random sampling
+    rng = np.random.default_rng(seed)
+    shocks, path_group = _standard_normal_shocks(n_paths, n_obs - 1, sampling, n_scrambles, rng)
+    sigma_arr, eps_arr = _garch_recursion_paths(shocks, a0, p_arr, q_arr)
+    asset_arr = _asset_prices(eps_arr, axis=0)
+
+    # Arrays are handed out as (n_paths, n_times) views of the time-major buffers, without copying
+    return MarketPaths(market_time=_market_time(n_obs, offset),
+                       asset_volatility=np.sqrt(sigma_arr[offset:], out=sigma_arr[offset:]).T,
+                       asset_return=eps_arr[offset:].T,
+                       asset_price=asset_arr[offset:].T,
+                       risk_free_rate=risk_free_rate,
+                       path_group=path_group)
@@ -0,0 +1,53 @@
+import datetime as dt
+from typing import Union, Dict
+
+import numpy as np
+
+# Simulations run on int64 ns since the epoch; datetimes are still accepted everywhere a market time is
+MarketTime = Union[dt.datetime, int]
+
+seconds_in_year = 60 * 60 * 24 * 365
+
+_epoch = dt.datetime(1970, 1, 1)
+_microsecond = dt.timedelta(microseconds=1)
+
+
+def to_ns(market_time) -> int:
+    # Nanoseconds since the epoch for datetimes, pandas Timestamps, numpy datetime64 and ints (taken as ns already)
+    if isinstance(market_time, (int, np.integer)):
+        return int(market_time)
+    elif isinstance(market_time, np.datetime64):
+        return int(market_time.astype('datetime64[ns]').astype(np.int64))
+    elif market_time.tzinfo is not None:
+        market_time = market_time.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return (market_time - _epoch) // _microsecond * 1000 + getattr(market_time, 'nanosecond', 0)
+
+
+def from_ns(ns: int) -> dt.datetime:
+    # Naive UTC datetime, truncated to whole microseconds: the inverse of to_ns for naive datetimes only
+    return _epoch + dt.timedelta(microseconds=int(ns) // 1000)
+
+
+def to_ns_array(market_time) -> np.ndarray:
+    return np.asarray(market_time, dtype='datetime64[ns]').view(np.int64)
+
+
+def year_fraction(start_ns, end_ns):
+    # Same rounding as timedelta.total_seconds() / seconds_in_year for whole microseconds
+    return (end_ns - start_ns) / 1e9 / seconds_in_year
+
+
+class TimeGrid:
+    # The market time axis of one run as int64 ns, with time to maturity vectors cached per expiry
+    def __init__(self, market_time):
+        self.ns = to_ns_array(market_time)
+        self._time_to_maturity: Dict[int, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.ns)
+
+    def time_to_maturity(self, expiry: MarketTime) -> np.ndarray:
+        expiry_ns = to_ns(expiry)
+        if expiry_ns not in self._time_to_maturity:
+            self._time_to_maturity[expiry_ns] = year_fraction(self.ns, expiry_ns)
+        return self._time_to_maturity[expiry_ns]
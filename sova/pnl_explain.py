@@ -0,0 +1,122 @@
+import math
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# Per-step P&L explain of a hedged book. Row i covers the move from tick i - 1 to tick i of the book as it was held
+# after the rebalance at i - 1, using only the greeks and positions already known at i - 1:
+#   delta_pnl = hedged delta * dS, gamma_pnl = gamma dS^2 / 2, theta_pnl = theta dt,
+#   carry_pnl = risk_free_rate * deposit * dt, slippage = -transaction cost of the rebalance at i.
+# Simulated deposits do not accrue interest, so pnl is the change of the pv after rebalancing costs plus the carry,
+# the P&L of the same book with its deposit financed at risk_free_rate. unexplained_pnl is what the greeks miss:
+# higher order terms, rate moves and trades booked after the first tick, which enter the pv without any greek behind
+# them. Every argument is a scalar for the per-row simulation or an array over paths for the batched one.
+explain_columns = ['pnl', 'delta_pnl', 'gamma_pnl', 'theta_pnl', 'carry_pnl', 'slippage', 'unexplained_pnl']
+
+
+def first_step_explain(hedge_cost) -> Tuple:
+    # Nothing was held before the first tick, so only its rebalance costs something
+    zero = 0. * hedge_cost
+    return -hedge_cost, zero, zero, zero, zero, -hedge_cost, zero
+
+
+def explain_step(pv,
+                 hedge_cost,
+                 asset_move,
+                 dt,
+                 previous_pv,
+                 previous_delta,
+                 previous_gamma,
+                 previous_theta,
+                 previous_deposit,
+                 previous_rate) -> Tuple:
+    # pv is valued before the rebalance at this tick; every previous_ quantity is taken after the one at the last
+    # tick, previous_pv net of its cost
+    delta_pnl = previous_delta * asset_move
+    gamma_pnl = .5 * previous_gamma * asset_move * asset_move
+    theta_pnl = previous_theta * dt
+    carry_pnl = previous_rate * previous_deposit * dt
+    unexplained_pnl = pv - previous_pv - delta_pnl - gamma_pnl - theta_pnl
+    pnl = pv - hedge_cost - previous_pv + carry_pnl
+    return pnl, delta_pnl, gamma_pnl, theta_pnl, carry_pnl, -hedge_cost, unexplained_pnl
+
+
+class _Moments:
+    # Count, mean and sum of squared deviations along the first axis of every sample added, combined batch by batch
+    # with the pairwise update of Chan, Golub and LeVeque
+    def __init__(self):
+        self.count = 0
+        self.mean: Optional[np.ndarray] = None
+        self.m2: Optional[np.ndarray] = None
+
+    def add(self, samples: np.ndarray):
+        if len(samples):
+            mean = samples.mean(axis=0)
+            self.combine(len(samples), mean, np.square(samples - mean).sum(axis=0))
+
+    def combine(self, count: int, mean: np.ndarray, m2: np.ndarray):
+        if count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = count, mean.copy(), m2.copy()
+            return
+        if mean.shape != self.mean.shape:
+            raise ValueError(f'Samples of shape {mean.shape} could not be added to moments of shape {self.mean.shape}')
+        total = self.count + count
+        shift = mean - self.mean
+        self.mean += shift * (count / total)
+        self.m2 += m2 + np.square(shift) * (self.count * count / total)
+        self.count = total
+
+    def variance(self) -> np.ndarray:
+        return self.m2 / (self.count - 1) if self.count > 1 else np.full_like(self.m2, math.nan)
+
+
+class PnlExplainStats:
+    # Mean and standard deviation across paths of every explain column, per step and summed over the steps of a path.
+    # Paths are added in batches of any size and statistics from several workers can be merged, so memory only grows
+    # with the number of steps.
+    def __init__(self):
+        self._steps = _Moments()
+        self._totals = _Moments()
+
+    @property
+    def count(self) -> int:
+        return self._steps.count
+
+    def update(self, explain) -> 'PnlExplainStats':
+        # explain maps every explain column to (n_steps,) for one path or (n_paths, n_steps), like a simulation result
+        values = np.stack([np.atleast_2d(np.asarray(explain[c], dtype=float)) for c in explain_columns], axis=1)
+        self._steps.add(values)
+        self._totals.add(values.sum(axis=2))
+        return self
+
+    def merge(self, other: 'PnlExplainStats') -> 'PnlExplainStats':
+        for moments, other_moments in ((self._steps, other._steps), (self._totals, other._totals)):
+            if other_moments.count:
+                moments.combine(other_moments.count, other_moments.mean, other_moments.m2)
+        return self
+
+    @staticmethod
+    def _by_column(values: Optional[np.ndarray]) -> Dict[str, np.ndarray]:
+        if values is None:
+            raise ValueError('No paths were added to the P&L explain statistics')
+        return dict(zip(explain_columns, values))
+
+    @property
+    def step_mean(self) -> Dict[str, np.ndarray]:
+        return self._by_column(self._steps.mean)
+
+    @property
+    def step_std(self) -> Dict[str, np.ndarray]:
+        return self._by_column(None if self._steps.mean is None else np.sqrt(self._steps.variance()))
+
+    @property
+    def total_mean(self) -> Dict[str, float]:
+        return {c: float(v) for c, v in self._by_column(self._totals.mean).items()}
+
+    @property
+    def total_std(self) -> Dict[str, float]:
+        return {c: float(v) for c, v in
+                self._by_column(None if self._totals.mean is None else np.sqrt(self._totals.variance())).items()}
+
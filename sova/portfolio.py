@@ -1,8 +1,17 @@
 import datetime as dt
+from bisect import bisect_right
 from dataclasses import dataclass
-from typing import List, Tuple, Callable, Optional
+from typing import List, Tuple, Callable, Optional, Dict, Hashable, NamedTuple, Sequence, Iterator, Union, Mapping
 
-from sova.asset import AbstractAsset, Deposit, Stock
+import numpy as np
+
+from sova import instrumentation
+from sova.asset import AbstractAsset, AmericanStockOption, Deposit, Stock, StockOption
+from sova.black_scholes import Greeks, OptionType, black_scholes_greeks
+from sova.cache import ValuationCache
+from sova.hedge_policy import HedgePolicy, ThresholdPolicy
+from sova.lattice import american_greeks
+from sova.market_time import MarketTime, to_ns, from_ns, year_fraction
 
 
 @dataclass
@@ -12,47 +21,644 @@ class Trade:
     asset: AbstractAsset
 
 
+def _exact_time(market_time) -> bool:
+    # Naive datetimes are the only market times from_ns gives back unchanged
+    return type(market_time) is dt.datetime and market_time.tzinfo is None
+
+
+class TradeBlotter:
+    # Append-only trade log backed by a numpy structured array that doubles its capacity when full.
+    # Deposits, stocks and options are rebuilt from their columns when read back, so they come back as equal copies.
+    # Trade times come back as the type they were given: naive datetimes, int ns or naive pandas Timestamps, rebuilt
+    # from the trade_time column by their time_kind. Anything the columns would not give back exactly is kept as an
+    # object on the side and returned as is: assets of other classes, options with a valuation cache or an expiry that
+    # is not a naive datetime, and other trade times (timezone aware or numpy datetime64).
+    DEPOSIT, STOCK, STOCK_OPTION, OTHER = range(4)
+    DATETIME_TIME, NS_TIME, TIMESTAMP_TIME, OTHER_TIME = range(4)
+
+    dtype = np.dtype([('trade_time', np.int64),
+                      ('time_kind', np.int8),
+                      ('stock_price', np.float64),
+                      ('kind', np.int8),
+                      ('amount', np.float64),
+                      ('expiry', np.int64),
+                      ('strike', np.float64),
+                      ('sigma', np.float64),
+                      ('option_type', np.int8),
+                      ('underlying', np.int32)])
+
+    def __init__(self, capacity: int = 16):
+        self._rows = np.zeros(max(capacity, 1), dtype=self.dtype)
+        self._size = 0
+        self._other_assets = {}
+        self._other_times = {}
+        # The underlying column holds codes into this list; 0 is the default underlying None
+        self.underlyings: List[Hashable] = [None]
+        self._underlying_codes: Dict[Hashable, int] = {None: 0}
+
+    def _underlying_code(self, underlying: Hashable) -> int:
+        if underlying not in self._underlying_codes:
+            self._underlying_codes[underlying] = len(self.underlyings)
+            self.underlyings.append(underlying)
+        return self._underlying_codes[underlying]
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self._rows[:self._size]
+
+    @property
+    def nbytes(self) -> int:
+        return self._rows.nbytes
+
+    @classmethod
+    def _time_kind(cls, trade_time: MarketTime) -> int:
+        if _exact_time(trade_time):
+            return cls.DATETIME_TIME
+        elif isinstance(trade_time, (int, np.integer)):
+            return cls.NS_TIME
+        # pandas Timestamps are the datetimes with a nanosecond field
+        elif isinstance(trade_time, dt.datetime) and trade_time.tzinfo is None and hasattr(trade_time, 'nanosecond'):
+            return cls.TIMESTAMP_TIME
+        return cls.OTHER_TIME
+
+    def trade_time(self, i: int) -> MarketTime:
+        time_kind = self._rows[i]['time_kind']
+        ns = int(self._rows[i]['trade_time'])
+        if time_kind == self.DATETIME_TIME:
+            return from_ns(ns)
+        elif time_kind == self.NS_TIME:
+            return ns
+        elif time_kind == self.TIMESTAMP_TIME:
+            import pandas as pd
+
+            return pd.Timestamp(ns)
+        return self._other_times[i]
+
+    def append(self, trade_time: MarketTime, stock_price: float, asset: AbstractAsset):
+        if self._size == len(self._rows):
+            rows = np.zeros(2 * len(self._rows), dtype=self.dtype)
+            rows[:self._size] = self._rows
+            self._rows = rows
+
+        row = self._rows[self._size]
+        row['trade_time'] = to_ns(trade_time)
+        row['time_kind'] = self._time_kind(trade_time)
+        if row['time_kind'] == self.OTHER_TIME:
+            self._other_times[self._size] = trade_time
+        row['stock_price'] = stock_price
+        row['amount'] = asset.amount
+        if type(asset) is Deposit:
+            row['kind'] = self.DEPOSIT
+        elif type(asset) is Stock:
+            row['kind'] = self.STOCK
+            row['underlying'] = self._underlying_code(asset.underlying)
+        elif type(asset) is StockOption and asset.cache is None and _exact_time(asset.expiry):
+            row['kind'] = self.STOCK_OPTION
+            row['expiry'] = asset.expiry_ns
+            row['strike'] = asset.strike
+            row['sigma'] = asset.sigma
+            row['option_type'] = asset.option_type.value
+            row['underlying'] = self._underlying_code(asset.underlying)
+        else:
+            row['kind'] = self.OTHER
+            self._other_assets[self._size] = asset
+        self._size += 1
+
+    def asset(self, i: int) -> AbstractAsset:
+        row = self._rows[i]
+        kind = row['kind']
+        if kind == self.DEPOSIT:
+            return Deposit(float(row['amount']))
+        elif kind == self.STOCK:
+            return Stock(float(row['amount']), self.underlyings[row['underlying']])
+        elif kind == self.STOCK_OPTION:
+            return StockOption(amount=float(row['amount']),
+                               expiry=from_ns(row['expiry']),
+                               strike=float(row['strike']),
+                               sigma=float(row['sigma']),
+                               option_type=OptionType(int(row['option_type'])),
+                               underlying=self.underlyings[row['underlying']])
+        return self._other_assets[i]
+
+    def trade(self, i: int) -> Trade:
+        return Trade(self.trade_time(i), float(self._rows[i]['stock_price']), self.asset(i))
+
+
+class TradeView(Sequence):
+    # Read-through list of Trade objects over a blotter, materialized only when accessed. The trades are snapshots of
+    # the log: changing one, or its asset, does not change the log or the book, which only change through append.
+    def __init__(self, portfolio: 'Portfolio'):
+        self._portfolio = portfolio
+
+    def __len__(self) -> int:
+        return len(self._portfolio.blotter)
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Trade, List[Trade]]:
+        if isinstance(i, slice):
+            return [self._portfolio.blotter.trade(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('trade index out of range')
+        return self._portfolio.blotter.trade(i)
+
+    def __iter__(self) -> Iterator[Trade]:
+        return (self._portfolio.blotter.trade(i) for i in range(len(self)))
+
+    def append(self, trade: Trade):
+        self._portfolio.trade(trade.trade_time, trade.stock_price, trade.asset)
+
+
+class _Position(NamedTuple):
+    # Netted holdings after every trade up to some time. Deposit and stock on the default underlying are plain sums,
+    # stock on named underlyings is summed per name, other contracts are kept as unit asset and net amount. The lines
+    # dict is shared between positions until a trade in one of those contracts arrives, so hedging never touches it.
+    deposit: float
+    stock: float
+    lines: Dict[Hashable, Tuple[AbstractAsset, float]]
+    stocks: Dict[Hashable, float]
+
+    @property
+    def all_stock(self) -> float:
+        # Stock over all underlyings, for valuations that see the book as a single name
+        return self.stock + sum(self.stocks.values()) if self.stocks else self.stock
+
+    def add(self, *assets: AbstractAsset) -> '_Position':
+        deposit, stock, lines, stocks = self.deposit, self.stock, None, None
+        for asset in assets:
+            if type(asset) is Deposit:
+                deposit += asset.amount
+            elif type(asset) is Stock and asset.underlying is None:
+                stock += asset.amount
+            elif type(asset) is Stock:
+                stocks = dict(self.stocks) if stocks is None else stocks
+                stocks[asset.underlying] = stocks.get(asset.underlying, 0) + asset.amount
+            else:
+                lines = dict(self.lines) if lines is None else lines
+                key = asset.contract_key
+                unit_asset, amount = lines.get(key, (None, 0))
+                lines[key] = (asset.unit() if unit_asset is None else unit_asset, amount + asset.amount)
+        return _Position(deposit, stock,
+                         self.lines if lines is None else lines,
+                         self.stocks if stocks is None else stocks)
+
+
+_no_position = _Position(0, 0, {}, {})
+
+
+class _OptionBook(NamedTuple):
+    # Column view of the StockOption lines of a position, valued with one black_scholes_greeks call
+    index: np.ndarray
+    amount: np.ndarray
+    sign: np.ndarray
+    expiry_ns: np.ndarray
+    strike: np.ndarray
+    sigma: np.ndarray
+
+    option_class = StockOption
+
+    @staticmethod
+    def _pricer(sign, s_0, k, t, r, sigma, vega_rho: bool) -> Greeks:
+        return black_scholes_greeks(sign, s_0, k, t, r, sigma)
+
+    @classmethod
+    def from_lines(cls, lines: Sequence[Tuple[AbstractAsset, float]]) -> '_OptionBook':
+        options = [(i, unit_asset, amount) for i, (unit_asset, amount) in enumerate(lines)
+                   if type(unit_asset) is cls.option_class]
+        return cls(index=np.array([i for i, _, _ in options], dtype=int),
+                   amount=np.array([amount for _, _, amount in options], dtype=float),
+                   sign=np.array([a.option_type.value for _, a, _ in options], dtype=float),
+                   expiry_ns=np.array([a.expiry_ns for _, a, _ in options], dtype=np.int64),
+                   strike=np.array([a.strike for _, a, _ in options], dtype=float),
+                   sigma=np.array([a.sigma for _, a, _ in options], dtype=float))
+
+    def greeks(self, stock_price, market_time_ns: int, risk_free_rate: float, vol_shock=0.,
+               line_spot: bool = False, vega_rho: bool = True) -> Greeks:
+        # Greeks of every line times its amount; stock_price and vol_shock broadcast against the line axis,
+        # which is the first one, unless line_spot says stock_price holds one spot per line.
+        # Options past expiry are worth nothing, as in StockOption. Valuations that only need price, delta and gamma
+        # pass vega_rho=False, which spares pricers that bump for vega and rho.
+        shape = (-1,) + (1,) * (np.ndim(vol_shock) if line_spot else max(np.ndim(stock_price), np.ndim(vol_shock)))
+        if line_spot:
+            stock_price = np.reshape(stock_price, shape)
+        live = (self.expiry_ns >= market_time_ns).reshape(shape)
+        amount = self.amount.reshape(shape)
+        t = np.maximum(year_fraction(market_time_ns, self.expiry_ns), 0.).reshape(shape)
+        greeks = self._pricer(self.sign.reshape(shape), stock_price, self.strike.reshape(shape), t, risk_free_rate,
+                              self.sigma.reshape(shape) + vol_shock, vega_rho)
+        return Greeks(*(np.where(live, amount * g, 0.) for g in greeks))
+
+
+class _AmericanBook(_OptionBook):
+    # The AmericanStockOption lines, all valued on one batched lattice
+    option_class = AmericanStockOption
+
+    @staticmethod
+    def _pricer(sign, s_0, k, t, r, sigma, vega_rho: bool) -> Greeks:
+        return american_greeks(sign, s_0, k, t, r, sigma, vega_rho=vega_rho)
+
+
+_option_books = (_OptionBook, _AmericanBook)
+_option_classes = tuple(book.option_class for book in _option_books)
+
+
+class _LineBook:
+    # Array view of the lines of a position for valuation against one spot per underlying: options are priced with
+    # a single call on their gathered spots and the results summed per underlying with bincount
+    def __init__(self, lines: Dict[Hashable, Tuple[AbstractAsset, float]]):
+        values = list(lines.values())
+        self.codes: Dict[Hashable, int] = {}
+        line_underlying = np.array([self.codes.setdefault(getattr(a, 'underlying', None), len(self.codes))
+                                    for a, _ in values], dtype=int)
+        self.options = _OptionBook.from_lines(values)
+        self.option_underlying = line_underlying[self.options.index]
+        self.american = _AmericanBook.from_lines(values)
+        self.american_underlying = line_underlying[self.american.index]
+        self.others = [(line_underlying[i], a, amount) for i, (a, amount) in enumerate(values)
+                       if type(a) not in _option_classes]
+
+
+class BookRisk(NamedTuple):
+    # Valuation of a multi-underlying book: total price, and delta and gamma per underlying
+    underlyings: List[Hashable]
+    spot: np.ndarray
+    price: float
+    delta: np.ndarray
+    gamma: np.ndarray
+
+
 class Portfolio:
-    def __init__(self, trades: List[Trade], delta_threshold: float = .005):
+    def __init__(self,
+                 trades: List[Trade],
+                 delta_threshold: float = .005,
+                 valuation_cache: Optional[ValuationCache] = None,
+                 hedge_policy: Optional[HedgePolicy] = None,
+                 trade_log: bool = True):
+        # trade_log=False only keeps the netted positions and not the trades behind them, so the memory of a
+        # portfolio that is compacted as it goes does not grow with the number of hedges
+        self.trade_log = trade_log
         self.trades = trades
-        self.delta_threshold = delta_threshold
+        self._delta_threshold = delta_threshold
+        self.valuation_cache = valuation_cache
+        self.hedge_policy = hedge_policy if hedge_policy is not None else ThresholdPolicy(delta_threshold)
+        # Last rebalance time per underlying
+        self._last_hedge_ns: Dict[Hashable, int] = {}
+
+    @property
+    def delta_threshold(self) -> float:
+        # The band of a ThresholdPolicy, read from and written through to the policy (a policy shared between
+        # portfolios changes for all of them). Other policies have no threshold and keep the value as is.
+        if isinstance(self.hedge_policy, ThresholdPolicy):
+            return self.hedge_policy.delta_threshold
+        return self._delta_threshold
+
+    @delta_threshold.setter
+    def delta_threshold(self, delta_threshold: float):
+        self._delta_threshold = delta_threshold
+        if isinstance(self.hedge_policy, ThresholdPolicy):
+            self.hedge_policy.delta_threshold = delta_threshold
+
+    @property
+    def trades(self) -> TradeView:
+        # The trades given to the portfolio are copied into its blotter, so hedge trades show up here and never in
+        # the caller's list
+        if not self.trade_log:
+            raise ValueError('The portfolio was built with trade_log=False and does not keep its trades')
+        return TradeView(self)
+
+    @trades.setter
+    def trades(self, trades: List[Trade]):
+        self.blotter = TradeBlotter(len(trades) if self.trade_log else 0)
+        # Time-ordered index over the trade log: distinct trade times (ns) and the netted position after each of them
+        self._times = []
+        self._positions = []
+        # Positions before this time were dropped by compact
+        self._horizon_ns: Optional[int] = None
+        # Book compiled from the lines of the last position valued
+        self._line_book_cache: Optional[Tuple[Dict, _LineBook]] = None
+        for t in trades:
+            self.trade(t.trade_time, t.stock_price, t.asset)
+
+    def trade(self, trade_time: MarketTime, stock_price: float, asset: AbstractAsset):
+        if self.trade_log:
+            self.blotter.append(trade_time, stock_price, asset)
+        self._index_trades(to_ns(trade_time), [asset])
+
+    def _trade_all(self, trade_time: MarketTime, trades: Sequence[Tuple[float, AbstractAsset]]):
+        # Several trades at one time are netted into the positions in a single pass
+        if self.trade_log:
+            for stock_price, asset in trades:
+                self.blotter.append(trade_time, stock_price, asset)
+        if trades:
+            self._index_trades(to_ns(trade_time), [asset for _, asset in trades])
+
+    def _check_horizon(self, market_time_ns: int):
+        if self._horizon_ns is not None and market_time_ns < self._horizon_ns:
+            raise ValueError(f'The portfolio was compacted up to {from_ns(self._horizon_ns)} and holds no positions '
+                             f'before it')
+
+    def compact(self, market_time: MarketTime):
+        # Forgets the positions before market_time, keeping the one in force at it, so a book that only moves forward
+        # in time holds a bounded index. Valuing or trading before market_time raises afterwards.
+        horizon_ns = to_ns(market_time)
+        self._check_horizon(horizon_ns)
+        i = bisect_right(self._times, horizon_ns) - 1
+        if i > 0:
+            del self._times[:i]
+            del self._positions[:i]
+        self._horizon_ns = horizon_ns
+
+    def _index_trades(self, trade_time: int, assets: Sequence[AbstractAsset]):
+        self._check_horizon(trade_time)
+        i = bisect_right(self._times, trade_time)
+        if i == 0 or self._times[i - 1] != trade_time:
+            self._times.insert(i, trade_time)
+            self._positions.insert(i, self._positions[i - 1] if i > 0 else _no_position)
+        else:
+            i -= 1
+        # Trades normally arrive in time order, so only the last position is touched
+        for j in range(i, len(self._positions)):
+            self._positions[j] = self._positions[j].add(*assets)
+
+    def _position(self, market_time: MarketTime) -> _Position:
+        market_time_ns = to_ns(market_time)
+        self._check_horizon(market_time_ns)
+        i = bisect_right(self._times, market_time_ns)
+        return self._positions[i - 1] if i > 0 else _no_position
 
-    def trade(self, trade_time: dt.datetime, stock_price: float, asset: AbstractAsset):
-        self.trades.append(Trade(trade_time, stock_price, asset))
+    def _line_book(self, position: _Position) -> _LineBook:
+        # Positions that only differ in deposit and stock share their lines dict, and so the compiled book. Valuations
+        # move forward in time, so only the latest one is kept.
+        cached = self._line_book_cache
+        if cached is None or cached[0] is not position.lines:
+            cached = self._line_book_cache = position.lines, _LineBook(position.lines)
+        return cached[1]
 
-    def _apply_function(self, market_time: dt.datetime, f: Callable[[Trade], float]) -> float:
-        return sum(map(f, filter(lambda t: t.trade_time <= market_time, self.trades)))
+    def _american_greeks(self,
+                         position: _Position,
+                         stock_price: float,
+                         market_time: MarketTime,
+                         risk_free_rate: float) -> Optional[Greeks]:
+        # Without a valuation cache the AmericanStockOption lines are valued together on one lattice, which is far
+        # cheaper than a tree per line. Vega and rho are not computed.
+        book = self._line_book(position).american
+        if not len(book.index):
+            return None
+        greeks = book.greeks(stock_price, to_ns(market_time), risk_free_rate, vega_rho=False)
+        return Greeks(*(float(g.sum()) for g in greeks))
+
+    def _apply_function(self,
+                        position: _Position,
+                        name: str,
+                        stock_price: float,
+                        market_time: MarketTime,
+                        risk_free_rate: float,
+                        f: Callable[[AbstractAsset], float]) -> float:
+        if self.valuation_cache is None:
+            american = self._american_greeks(position, stock_price, market_time, risk_free_rate)
+            if american is None:
+                return sum(amount * f(unit_asset) for unit_asset, amount in position.lines.values())
+            return getattr(american, name) + sum(amount * f(unit_asset)
+                                                 for unit_asset, amount in position.lines.values()
+                                                 if type(unit_asset) is not AmericanStockOption)
+
+        # Price and delta of a line share the entry current_price_delta fills, so valuing the book for both at one
+        # tick, in any order, prices every line once
+        tick = (stock_price, market_time, risk_free_rate)
+        i = 0 if name == 'price' else 1
+        return sum(amount * self.valuation_cache.get(tick, (key, 'price_delta'),
+                                                     lambda a=unit_asset: a.current_price_delta(*tick))[i]
+                   for key, (unit_asset, amount) in position.lines.items())
 
     def current_price(self,
                       stock_price: float,
-                      market_time: dt.datetime,
+                      market_time: MarketTime,
                       risk_free_rate: float = .01) -> float:
-        return self._apply_function(market_time, lambda t: t.asset.current_price(stock_price=stock_price,
-                                                                                 market_time=market_time,
-                                                                                 risk_free_rate=risk_free_rate))
+        position = self._position(market_time)
+        return position.deposit + position.all_stock * stock_price + \
+            self._apply_function(position, 'price', stock_price, market_time, risk_free_rate,
+                                 lambda a: a.current_price(stock_price=stock_price,
+                                                           market_time=market_time,
+                                                           risk_free_rate=risk_free_rate))
 
     def current_delta(self,
                       stock_price: float,
-                      market_time: dt.datetime,
+                      market_time: MarketTime,
                       risk_free_rate: float = .01) -> float:
-        return self._apply_function(market_time, lambda t: t.asset.current_delta(stock_price=stock_price,
-                                                                                 market_time=market_time,
-                                                                                 risk_free_rate=risk_free_rate))
+        position = self._position(market_time)
+        return position.all_stock + \
+            self._apply_function(position, 'delta', stock_price, market_time, risk_free_rate,
+                                 lambda a: a.current_delta(stock_price=stock_price,
+                                                           market_time=market_time,
+                                                           risk_free_rate=risk_free_rate))
+
+    def current_price_delta(self,
+                            stock_price: float,
+                            market_time: MarketTime,
+                            risk_free_rate: float = .01) -> Tuple[float, float]:
+        # current_price and current_delta from a single valuation of every line
+        position = self._position(market_time)
+        price, delta = 0, 0
+        american = None if self.valuation_cache is not None else \
+            self._american_greeks(position, stock_price, market_time, risk_free_rate)
+        if american is not None:
+            price, delta = american.price, american.delta
+        for key, (unit_asset, amount) in position.lines.items():
+            if american is not None and type(unit_asset) is AmericanStockOption:
+                continue
+            if self.valuation_cache is None:
+                unit_price, unit_delta = unit_asset.current_price_delta(stock_price, market_time, risk_free_rate)
+            else:
+                unit_price, unit_delta = self.valuation_cache.get(
+                    (stock_price, market_time, risk_free_rate), (key, 'price_delta'),
+                    lambda a=unit_asset: a.current_price_delta(stock_price, market_time, risk_free_rate))
+            price += amount * unit_price
+            delta += amount * unit_delta
+        return position.deposit + position.all_stock * stock_price + price, position.all_stock + delta
 
     def hedge_delta(self,
                     stock_price: float,
-                    market_time: dt.datetime,
-                    risk_free_rate: float = .01) -> Optional[Tuple[AbstractAsset, AbstractAsset]]:
-        delta = self.current_delta(stock_price, market_time, risk_free_rate)
-        if abs(delta) > self.delta_threshold:
-            hedge_deposit = Trade(trade_time=market_time,
-                                  stock_price=stock_price,
-                                  asset=Deposit(delta * stock_price))
-            hedge_asset = Trade(trade_time=market_time,
-                                stock_price=stock_price,
-                                asset=Stock(-1 * delta))
-            self.trades.append(hedge_deposit)
-            self.trades.append(hedge_asset)
-            return hedge_deposit.asset, hedge_asset.asset
+                    market_time: MarketTime,
+                    risk_free_rate: float = .01,
+                    delta: Optional[float] = None,
+                    gamma: Optional[float] = None) -> Optional[Tuple[AbstractAsset, AbstractAsset]]:
+        # delta, and gamma for policies that need it, may be passed in when the caller has just valued the book at
+        # this tick. Otherwise the book is valued here, without the vega and rho the policies never look at.
+        policy = self.hedge_policy
+        if not policy.needs_gamma:
+            gamma = 0.
+        elif gamma is None:
+            _, greeks = self.position_risk(stock_price, market_time, risk_free_rate, vega_rho=False)
+            gamma = float(greeks.gamma.sum())
+            delta = delta if delta is not None else float(greeks.delta.sum())
+        if delta is None:
+            delta = self.current_delta(stock_price, market_time, risk_free_rate)
+        market_time_ns = to_ns(market_time)
+        last_hedge_ns = self._last_hedge_ns.get(None)
+        since_hedge = np.inf if last_hedge_ns is None else year_fraction(last_hedge_ns, market_time_ns)
+
+        amount = float(policy.rebalance(delta, gamma, stock_price, since_hedge))
+        if amount != 0:
+            hedge_deposit = Deposit(-amount * stock_price - float(policy.cost(amount, stock_price)))
+            hedge_asset = Stock(amount)
+            self.trade(market_time, stock_price, hedge_deposit)
+            self.trade(market_time, stock_price, hedge_asset)
+            self._last_hedge_ns[None] = market_time_ns
+            return hedge_deposit, hedge_asset
 
         return Deposit(0), Stock(0)
+
+    def book_risk(self,
+                  spots: Mapping[Hashable, float],
+                  market_time: MarketTime,
+                  risk_free_rate: float = .01) -> BookRisk:
+        # Values a book spanning several underlyings against the spot of each; the scalar methods above treat the
+        # book as a single name. Stock and options with no underlying are priced at spots[None].
+        position = self._position(market_time)
+        book = self._line_book(position)
+        codes = book.codes
+        missing = [u for u in position.stocks if u not in codes] + \
+            ([None] if position.stock != 0 and None not in codes else [])
+        if missing:
+            codes = dict(codes)
+            for underlying in missing:
+                codes[underlying] = len(codes)
+        underlyings = list(codes)
+        spot = np.array([spots[u] for u in underlyings], dtype=float)
+        n = len(underlyings)
+
+        price = position.deposit
+        delta = np.zeros(n)
+        gamma = np.zeros(n)
+        for underlying, amount in position.stocks.items():
+            price += amount * spot[codes[underlying]]
+            delta[codes[underlying]] += amount
+        if position.stock != 0:
+            price += position.stock * spot[codes[None]]
+            delta[codes[None]] += position.stock
+        for options, option_underlying in ((book.options, book.option_underlying),
+                                           (book.american, book.american_underlying)):
+            if not len(options.index):
+                continue
+            greeks = options.greeks(spot[option_underlying], to_ns(market_time), risk_free_rate, line_spot=True,
+                                    vega_rho=False)
+            price += float(greeks.price.sum())
+            delta += np.bincount(option_underlying, weights=greeks.delta, minlength=n)
+            gamma += np.bincount(option_underlying, weights=greeks.gamma, minlength=n)
+        for i, unit_asset, amount in book.others:
+            greeks = unit_asset.risk(spot[i], market_time, risk_free_rate)
+            price += amount * greeks.price
+            delta[i] += amount * greeks.delta
+            gamma[i] += amount * greeks.gamma
+        return BookRisk(underlyings, spot, float(price), delta, gamma)
+
+    def hedge_book(self,
+                   spots: Mapping[Hashable, float],
+                   market_time: MarketTime,
+                   risk_free_rate: float = .01,
+                   book_risk: Optional[BookRisk] = None) -> Dict[Hashable, Tuple[Deposit, Stock]]:
+        # hedge_delta for every underlying at once: the policy sees the delta vector and the stock of each name is
+        # traded against the deposit. book_risk may be passed in when the book was just valued at this tick.
+        risk = book_risk if book_risk is not None else self.book_risk(spots, market_time, risk_free_rate)
+        market_time_ns = to_ns(market_time)
+        since_hedge = np.array([year_fraction(self._last_hedge_ns[u], market_time_ns) if u in self._last_hedge_ns
+                                else np.inf for u in risk.underlyings])
+        amounts = self.hedge_policy.rebalance(risk.delta, risk.gamma, risk.spot, since_hedge)
+        costs = self.hedge_policy.cost(amounts, risk.spot)
+
+        hedges = {}
+        trades = []
+        for underlying, amount, stock_price, cost in zip(risk.underlyings, amounts.tolist(), risk.spot.tolist(),
+                                                         costs.tolist()):
+            if amount == 0:
+                hedges[underlying] = Deposit(0), Stock(0, underlying)
+                continue
+            hedges[underlying] = Deposit(-amount * stock_price - cost), Stock(amount, underlying)
+            trades.extend((stock_price, asset) for asset in hedges[underlying])
+            self._last_hedge_ns[underlying] = market_time_ns
+        self._trade_all(market_time, trades)
+        return hedges
+
+    def position_risk(self,
+                      stock_price: float,
+                      market_time: MarketTime,
+                      risk_free_rate: float = .01,
+                      vega_rho: bool = True) -> Tuple[List[Hashable], Greeks]:
+        # Contract keys and greeks per netted position: the deposit, then the stock of the default underlying and of
+        # every named one, then the other lines. StockOption lines are valued in a single vectorized pass,
+        # AmericanStockOption lines on one batched lattice, any other asset through its own risk(). vega_rho=False
+        # leaves vega and rho of the lattice lines nan and spares their bumped trees. Like the other scalar methods
+        # this sees the book as a single name: every row, named underlyings included, is valued at stock_price.
+        # book_risk values each underlying at its own spot.
+        position = self._position(market_time)
+        stocks = [(None, position.stock)] + list(position.stocks.items())
+        keys = [Deposit(0).contract_key] + [Stock(0, underlying).contract_key for underlying, _ in stocks] + \
+            list(position.lines)
+        lines = list(position.lines.values())
+        first_line = 1 + len(stocks)
+        greeks = np.zeros((len(Greeks._fields), len(keys)))
+        greeks[0, 0] = position.deposit
+        greeks[1, 1:first_line] = [amount for _, amount in stocks]
+        greeks[0, 1:first_line] = greeks[1, 1:first_line] * stock_price
+
+        for book in (option_book.from_lines(lines) for option_book in _option_books):
+            if len(book.index):
+                greeks[:, book.index + first_line] = book.greeks(stock_price, to_ns(market_time), risk_free_rate,
+                                                                 vega_rho=vega_rho)
+        for i, (unit_asset, amount) in enumerate(lines):
+            if type(unit_asset) not in _option_classes:
+                greeks[:, i + first_line] = amount * np.array(unit_asset.risk(stock_price, market_time,
+                                                                              risk_free_rate))
+        return keys, Greeks(*greeks)
+
+    def risk(self,
+             stock_price: float,
+             market_time: MarketTime,
+             risk_free_rate: float = .01) -> Greeks:
+        _, greeks = self.position_risk(stock_price, market_time, risk_free_rate)
+        return Greeks(*(float(g.sum()) for g in greeks))
+
+    def risk_scenarios(self,
+                       stock_price: float,
+                       market_time: MarketTime,
+                       risk_free_rate: float = .01,
+                       spot_shocks: Sequence[float] = (-.1, -.05, 0., .05, .1),
+                       vol_shocks: Sequence[float] = (-.05, 0., .05)) -> Greeks:
+        # Book greeks on a grid of relative spot shocks (rows) and absolute volatility shocks (columns).
+        # Volatility shocks only move StockOption and AmericanStockOption lines; other assets are revalued per spot.
+        position = self._position(market_time)
+        spots = stock_price * (1 + np.asarray(spot_shocks, dtype=float))[:, None]
+        vol_shocks = np.asarray(vol_shocks, dtype=float)[None, :]
+        shape = (spots.shape[0], vol_shocks.shape[1])
+        greeks = np.zeros((len(Greeks._fields),) + shape)
+        greeks[0] = position.deposit + position.all_stock * spots
+        greeks[1] = position.all_stock
+
+        lines = list(position.lines.values())
+        for book in (option_book.from_lines(lines) for option_book in _option_books):
+            if len(book.index):
+                greeks += np.sum(book.greeks(spots, to_ns(market_time), risk_free_rate, vol_shocks), axis=1)
+        for unit_asset, amount in lines:
+            if type(unit_asset) not in _option_classes:
+                greeks += amount * np.array([unit_asset.risk(s, market_time, risk_free_rate)
+                                             for s in spots[:, 0]]).T[:, :, None]
+        return Greeks(*greeks)
+
+
+def _lines_valued(portfolio: Portfolio, stock_price: float, market_time: MarketTime,
+                  *args, **kwargs) -> int:
+    return len(portfolio._position(market_time).lines)
+
+
+instrumentation.register(Portfolio, 'current_price', 'valuation', _lines_valued)
+instrumentation.register(Portfolio, 'current_delta', 'valuation', _lines_valued)
+instrumentation.register(Portfolio, 'current_price_delta', 'valuation', _lines_valued)
+instrumentation.register(Portfolio, 'hedge_delta', 'hedge_decision')
+instrumentation.register(Portfolio, 'trade', 'trade_append')
+instrumentation.register(Portfolio, 'position_risk', 'valuation', _lines_valued)
+instrumentation.register(Portfolio, 'risk_scenarios', 'valuation', _lines_valued)
+instrumentation.register(Portfolio, 'book_risk', 'valuation', _lines_valued)
+instrumentation.register(Portfolio, 'hedge_book', 'hedge_decision')
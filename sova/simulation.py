@@ -1,56 +1,200 @@
-import datetime as dt
-from typing import Optional, Dict
+from typing import TYPE_CHECKING, Optional, Dict, Iterable, Iterator, List, Tuple, AsyncIterable, AsyncIterator, Union
 
 import numpy as np
-import pandas as pd
 
+from sova import instrumentation
 from sova.asset import StockOption
 from sova.market_data import generate_market_data
+from sova.market_time import MarketTime, TimeGrid, to_ns, year_fraction
+from sova.pnl_explain import explain_columns, explain_step, first_step_explain
 from sova.portfolio import Portfolio, Trade
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+# (market_time, asset_price, risk_free_rate)
+Tick = Tuple[MarketTime, float, float]
+
+
+# Columns of a simulation result, in the order _hedge_step returns them
+result_columns = ['asset_price', 'porfolio_pv', 'portfolio_delta', 'portfolio_hedged_delta', 'hedge_asset_amount',
+                  'hedge_deposit_amount']
+
 
 class HedgeSimulation:
-    def __init__(self, portfolio: Optional[Portfolio] = None):
+    def __init__(self, portfolio: Optional[Portfolio] = None, explain: bool = False):
+        # With explain every row also has the per-step P&L explain columns of sova.pnl_explain, built from the greeks
+        # of the previous tick; the book is then valued with its gamma and theta instead of price and delta only
         self.portfolio = portfolio
+        self.explain = explain
+        # (market_time ns, asset_price, risk_free_rate, pv net of hedge cost, hedged delta, gamma, theta, deposit)
+        # after the rebalance at the last tick
+        self._previous: Optional[Tuple[float, ...]] = None
+
+    @property
+    def columns(self) -> List[str]:
+        return result_columns + explain_columns if self.explain else result_columns
+
+    def _hedge_step(self, market_time: MarketTime, asset_price: float, risk_free_rate: float) -> Tuple[float, ...]:
+        if self.explain:
+            return self._explained_hedge_step(market_time, asset_price, risk_free_rate)
+        # The book is valued once per tick: hedging only trades stock, whose delta is its amount, so the delta after
+        # the hedge follows from the one before it
+        if self.portfolio.hedge_policy.needs_gamma:
+            # position_risk gives the pv and delta along with the gamma
+            _, greeks = self.portfolio.position_risk(asset_price, market_time, risk_free_rate, vega_rho=False)
+            curr_pv, curr_delta, gamma = float(greeks.price.sum()), float(greeks.delta.sum()), float(greeks.gamma.sum())
+        else:
+            curr_pv, curr_delta = self.portfolio.current_price_delta(asset_price, market_time, risk_free_rate)
+            gamma = None
+        hedge_deposit, hedge_asset = self.portfolio.hedge_delta(asset_price,
+                                                                market_time,
+                                                                risk_free_rate,
+                                                                curr_delta,
+                                                                gamma)
+        return (asset_price, curr_pv, curr_delta, curr_delta + hedge_asset.amount, hedge_asset.amount,
+                hedge_deposit.amount)
+
+    def _explained_hedge_step(self,
+                              market_time: MarketTime,
+                              asset_price: float,
+                              risk_free_rate: float) -> Tuple[float, ...]:
+        # Deposit and stock come first in position_risk, and hedging only trades those, so the greeks after the
+        # rebalance follow from the ones before it
+        _, greeks = self.portfolio.position_risk(asset_price, market_time, risk_free_rate, vega_rho=False)
+        deposit = float(greeks.price[0])
+        curr_pv, curr_delta, gamma, _, theta, _ = (float(g.sum()) for g in greeks)
+        hedge_deposit, hedge_asset = self.portfolio.hedge_delta(asset_price,
+                                                                market_time,
+                                                                risk_free_rate,
+                                                                curr_delta,
+                                                                gamma)
+        hedged_delta = curr_delta + hedge_asset.amount
+        hedge_cost = -hedge_deposit.amount - hedge_asset.amount * asset_price
+
+        market_time_ns = to_ns(market_time)
+        if self._previous is None:
+            explained = first_step_explain(hedge_cost)
+        else:
+            previous_ns, previous_price, previous_rate, *previous_book = self._previous
+            explained = explain_step(curr_pv, hedge_cost, asset_price - previous_price,
+                                     year_fraction(previous_ns, market_time_ns), *previous_book, previous_rate)
+        self._previous = (market_time_ns, asset_price, risk_free_rate, curr_pv - hedge_cost, hedged_delta, gamma, theta,
+                          deposit + hedge_deposit.amount)
+        return (asset_price, curr_pv, curr_delta, hedged_delta, hedge_asset.amount, hedge_deposit.amount) + explained
+
+    def _make_result_row(self, market_time: MarketTime, asset_price: float, risk_free_rate: float) -> Dict:
+        return dict(zip(self.columns, self._hedge_step(market_time, asset_price, risk_free_rate)))
+
+    def _check_portfolio(self):
+        if self.portfolio is None:
+            raise ValueError('Simulation needs a portfolio, '
+                             'the default one is only built by run_simulation from single underlying market data')
 
-    def _make_result_dt_row(self, curr_mkt_time: dt.datetime, curr_mkt: pd.Series) -> Dict:
-        curr_pv = self.portfolio.current_price(curr_mkt.asset_price,
-                                               curr_mkt_time,
-                                               curr_mkt.risk_free_rate)
-        curr_delta = self.portfolio.current_delta(curr_mkt.asset_price,
-                                                  curr_mkt_time,
-                                                  curr_mkt.risk_free_rate)
-        hedge_deposit, hedge_asset = self.portfolio.hedge_delta(curr_mkt.asset_price,
-                                                                curr_mkt_time,
-                                                                curr_mkt.risk_free_rate)
-        hedged_delta = self.portfolio.current_delta(curr_mkt.asset_price,
-                                                    curr_mkt_time,
-                                                    curr_mkt.risk_free_rate)
-        return {
-            'asset_price': curr_mkt.asset_price,
-            'porfolio_pv': curr_pv,
-            'portfolio_delta': curr_delta,
-            'portfolio_hedged_delta': hedged_delta,
-            'hedge_asset_amount': hedge_asset.amount,
-            'hedge_deposit_amount': hedge_deposit.amount
-        }
-
-    def run_simulation(self, market_data: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    def stream(self, ticks: Iterable[Tick], compact: bool = True) -> Iterator[Tuple[MarketTime, Dict]]:
+        # Hedges tick by tick and yields (market_time, result row) as soon as the row is computed.
+        # Nothing but the portfolio state, and the greeks of the last tick for the explain, is kept between ticks.
+        # With compact the portfolio forgets its positions before each tick once the tick is done, and with a
+        # portfolio built with trade_log=False memory stays constant however long the feed runs.
+        self._check_portfolio()
+        self._previous = None
+        for market_time, asset_price, risk_free_rate in ticks:
+            row = self._make_result_row(market_time, asset_price, risk_free_rate)
+            if compact:
+                self.portfolio.compact(market_time)
+            yield market_time, row
+
+    async def astream(self,
+                      ticks: AsyncIterable[Tick],
+                      compact: bool = True) -> AsyncIterator[Tuple[MarketTime, Dict]]:
+        self._check_portfolio()
+        self._previous = None
+        async for market_time, asset_price, risk_free_rate in ticks:
+            row = self._make_result_row(market_time, asset_price, risk_free_rate)
+            if compact:
+                self.portfolio.compact(market_time)
+            yield market_time, row
+
+    def run_simulation(self,
+                       market_data: Optional['pd.DataFrame'] = None,
+                       return_arrays: bool = False) -> Union['pd.DataFrame', Dict[str, np.ndarray]]:
+        # With return_arrays the result columns come back as numpy arrays aligned with market_data.index
         market_data = market_data if market_data is not None else generate_market_data(a0=1e-4,
                                                                                        p_arr=np.array([.01]),
                                                                                        q_arr=np.array([.02]),
                                                                                        n_obs=366)
-        curr_mkt = market_data.iloc[0]
-        curr_mkt_time = curr_mkt.name.to_pydatetime()
+        asset_price = market_data['asset_price'].to_numpy(dtype=float)
+        risk_free_rate = market_data['risk_free_rate'].to_numpy(dtype=float)
 
         if self.portfolio is None:
             opt = StockOption(amount=1,
                               expiry=market_data.index[-1].to_pydatetime(),
-                              strike=curr_mkt.asset_price / np.exp(-curr_mkt.risk_free_rate))
+                              strike=asset_price[0] / np.exp(-risk_free_rate[0]))
             initial_assets = [opt]
-            self.portfolio = Portfolio(list(map(lambda a: Trade(curr_mkt_time, curr_mkt.asset_price, a),
+            curr_mkt_time = market_data.index[0].to_pydatetime()
+            self.portfolio = Portfolio(list(map(lambda a: Trade(curr_mkt_time, asset_price[0], a),
                                                 initial_assets)))
 
-        hedge_result_dict = {curr_mkt_time: self._make_result_dt_row(curr_mkt_time.to_pydatetime(), curr_mkt)
-                             for curr_mkt_time, curr_mkt in market_data.iterrows()}
-        return pd.DataFrame.from_dict(hedge_result_dict, orient='index')
+        # Assets and portfolio work on int64 ns and plain floats, so nothing pandas is touched per row
+        time_grid = TimeGrid(market_data.index)
+        columns = self.columns
+        values = np.empty((len(time_grid), len(columns)), order='F')
+        self._previous = None
+        for i, (curr_mkt_ns, curr_asset_price, curr_risk_free_rate) in enumerate(zip(time_grid.ns.tolist(),
+                                                                                     asset_price.tolist(),
+                                                                                     risk_free_rate.tolist())):
+            values[i] = self._hedge_step(curr_mkt_ns, curr_asset_price, curr_risk_free_rate)
+
+        if return_arrays:
+            return dict(zip(columns, values.T))
+        return self._make_result_frame(market_data.index, values, columns)
+
+    def run_book_simulation(self,
+                            asset_prices: 'pd.DataFrame',
+                            risk_free_rate: Union[float, 'pd.Series'] = .01) -> 'pd.DataFrame':
+        # Hedges a multi-underlying book with one column of spots per underlying in asset_prices. Result columns are
+        # (result column, underlying); the book pv is the single column ('porfolio_pv', ''). The P&L explain is
+        # only produced for single underlying runs.
+        import pandas as pd
+
+        self._check_portfolio()
+        underlyings = list(asset_prices.columns)
+        columns = {u: j for j, u in enumerate(underlyings)}
+        prices = asset_prices.to_numpy(dtype=float)
+        rates = np.broadcast_to(np.asarray(risk_free_rate, dtype=float), len(prices))
+        time_grid = TimeGrid(asset_prices.index)
+
+        pv = np.empty(len(prices))
+        per_name = {c: np.zeros(prices.shape) for c in result_columns[2:]}
+        for i, (curr_mkt_ns, curr_prices, curr_risk_free_rate) in enumerate(zip(time_grid.ns.tolist(),
+                                                                                prices.tolist(),
+                                                                                rates.tolist())):
+            spots = dict(zip(underlyings, curr_prices))
+            risk = self.portfolio.book_risk(spots, curr_mkt_ns, curr_risk_free_rate)
+            hedges = self.portfolio.hedge_book(spots, curr_mkt_ns, curr_risk_free_rate, risk)
+            j = [columns[u] for u in risk.underlyings]
+            hedge_asset = np.array([hedges[u][1].amount for u in risk.underlyings], dtype=float)
+            pv[i] = risk.price
+            per_name['portfolio_delta'][i, j] = risk.delta
+            per_name['portfolio_hedged_delta'][i, j] = risk.delta + hedge_asset
+            per_name['hedge_asset_amount'][i, j] = hedge_asset
+            per_name['hedge_deposit_amount'][i, j] = [hedges[u][0].amount for u in risk.underlyings]
+
+        index = pd.DatetimeIndex(asset_prices.index.to_numpy())
+        frames = {'asset_price': pd.DataFrame(prices, index=index, columns=underlyings),
+                  'porfolio_pv': pd.DataFrame({'': pv}, index=index)}
+        frames.update((c, pd.DataFrame(v, index=index, columns=underlyings)) for c, v in per_name.items())
+        return pd.concat(frames, axis=1)
+
+    @staticmethod
+    def _make_result_frame(market_time: 'pd.DatetimeIndex',
+                           values: np.ndarray,
+                           columns: List[str] = result_columns) -> 'pd.DataFrame':
+        import pandas as pd
+
+        return pd.DataFrame(values, index=pd.DatetimeIndex(market_time.to_numpy()), columns=columns)
+
+
+instrumentation.register(HedgeSimulation, 'run_simulation', 'simulation')
+instrumentation.register(HedgeSimulation, '_hedge_step', 'hedge_row')
+instrumentation.register(HedgeSimulation, '_make_result_frame', 'result_assembly')
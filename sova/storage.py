@@ -0,0 +1,130 @@
+import json
+import os
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from sova.batch_simulation import BatchSimulationResult
+from sova.market_data import MarketPaths
+from sova.market_time import to_ns, to_ns_array
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# A store is a directory with one .npy file per column, the shared market_time axis as int64 ns and a meta.json.
+# Columns are 1-D (n_times,) for a single path or 2-D (n_paths, n_times); the last axis is always time.
+_meta_file = 'meta.json'
+_time_file = 'market_time.npy'
+
+path_columns = ['asset_volatility', 'asset_return', 'asset_price']
+
+
+def _column_file(path: str, column: str) -> str:
+    return os.path.join(path, f'{column}.npy')
+
+
+def _write_meta(path: str, columns: List[str], attrs: Dict):
+    with open(os.path.join(path, _meta_file), 'w') as f:
+        json.dump({'columns': columns, 'attrs': attrs}, f, indent=2)
+
+
+def save_columns(path: str, market_time, columns: Dict[str, np.ndarray], attrs: Optional[Dict] = None):
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, _time_file), to_ns_array(market_time))
+    for column, values in columns.items():
+        np.save(_column_file(path, column), np.asarray(values))
+    _write_meta(path, list(columns), attrs or {})
+
+
+def save_market_data(market_data: 'pd.DataFrame', path: str):
+    save_columns(path, market_data.index, {c: market_data[c].values for c in market_data.columns})
+
+
+def save_market_paths(market_paths: MarketPaths, path: str):
+    save_columns(path, market_paths.market_time, {c: getattr(market_paths, c) for c in path_columns},
+                 {'risk_free_rate': market_paths.risk_free_rate})
+
+
+def save_simulation_result(result: Union['pd.DataFrame', BatchSimulationResult], path: str):
+    if isinstance(result, BatchSimulationResult):
+        save_columns(path, result.market_time, result.columns)
+    else:
+        save_market_data(result, path)
+
+
+def write_market_paths(path: str, blocks: Iterable[MarketPaths], n_paths: int):
+    # Writes a scenario set block by block straight into preallocated .npy files, so the whole set never has to
+    # fit in memory. Blocks must share one market_time axis and add up to n_paths paths.
+    os.makedirs(path, exist_ok=True)
+    files = None
+    start = 0
+    risk_free_rate = None
+    for block in blocks:
+        if files is None:
+            np.save(os.path.join(path, _time_file), to_ns_array(block.market_time))
+            shape = (n_paths, len(block.market_time))
+            files = {c: np.lib.format.open_memmap(_column_file(path, c), mode='w+', dtype=np.float64, shape=shape)
+                     for c in path_columns}
+            risk_free_rate = block.risk_free_rate
+        for column, values in files.items():
+            values[start:start + block.n_paths] = getattr(block, column)
+        start += block.n_paths
+
+    if files is None or start != n_paths:
+        raise ValueError(f'Blocks hold {start} paths, expected {n_paths}')
+    for values in files.values():
+        values.flush()
+    _write_meta(path, path_columns, {'risk_free_rate': risk_free_rate})
+
+
+class ColumnStore:
+    # Read side of a store. Columns are opened as read-only np.memmap, so any number of processes can share one copy
+    # in the page cache, and only the pages of the selected column, time slice and paths are ever read.
+    def __init__(self, path: str, mmap_mode: Optional[str] = 'r'):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(path, _meta_file)) as f:
+            meta = json.load(f)
+        self.columns = meta['columns']
+        self.attrs = meta['attrs']
+        self._time_ns = np.load(os.path.join(path, _time_file), mmap_mode=mmap_mode)
+
+    def _time_slice(self, start=None, end=None) -> slice:
+        # Inclusive on both ends, like DataFrame.loc
+        i = 0 if start is None else int(np.searchsorted(self._time_ns, to_ns(start), side='left'))
+        j = len(self._time_ns) if end is None else int(np.searchsorted(self._time_ns, to_ns(end), side='right'))
+        return slice(i, j)
+
+    def market_time(self, start=None, end=None) -> 'pd.DatetimeIndex':
+        import pandas as pd
+
+        return pd.DatetimeIndex(self._time_ns[self._time_slice(start, end)].astype('datetime64[ns]'),
+                                name='market_time')
+
+    def read(self, column: str, start=None, end=None, paths=None) -> np.ndarray:
+        if column not in self.columns:
+            raise KeyError(f'No column {column} in {self.path}')
+        values = np.load(_column_file(self.path, column), mmap_mode=self.mmap_mode)
+        time_slice = self._time_slice(start, end)
+        if values.ndim == 1:
+            return values[time_slice]
+        return values[slice(None) if paths is None else paths, time_slice]
+
+    def to_frame(self, columns: Optional[List[str]] = None, start=None, end=None, path: Optional[int] = None) \
+            -> 'pd.DataFrame':
+        # Builds a pandas frame for one path (or a 1-D store); unlike read this copies the selected data
+        columns = columns if columns is not None else self.columns
+        data = {}
+        for column in columns:
+            values = self.read(column, start, end)
+            data[column] = values if values.ndim == 1 else values[path if path is not None else 0]
+        if 'risk_free_rate' in self.attrs and 'risk_free_rate' not in data:
+            data['risk_free_rate'] = self.attrs['risk_free_rate']
+        import pandas as pd
+
+        return pd.DataFrame(data=data, index=self.market_time(start, end))
+
+    def to_market_paths(self, start=None, end=None, paths=None) -> MarketPaths:
+        return MarketPaths(market_time=self.market_time(start, end),
+                           risk_free_rate=self.attrs.get('risk_free_rate', .01),
+                           **{c: self.read(c, start, end, paths) for c in path_columns})
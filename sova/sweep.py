@@ -0,0 +1,129 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import TYPE_CHECKING, Dict, Sequence, Optional, List, Tuple
+
+import numpy as np
+
+from sova.asset import StockOption
+from sova.batch_simulation import BatchHedgeSimulation
+from sova.market_data import generate_market_paths
+from sova.monte_carlo import black_scholes_controls, estimate
+from sova.portfolio import Portfolio, Trade
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+default_parameters = {
+    'delta_threshold': .3,
+    'otm_multiplier': 1.05,
+    'sigma': .1,
+    'a0': 1e-5,
+    'p_arr': (.001,),
+    'q_arr': (.002,),
+    'risk_free_rate': .01,
+}
+
+seed_policies = ['common', 'independent']
+
+
+def _grid(param_grid: Dict[str, Sequence]) -> List[Dict]:
+    unknown = set(param_grid) - set(default_parameters)
+    if unknown:
+        raise ValueError(f'Unknown sweep parameters: {sorted(unknown)}')
+    names = list(param_grid)
+    return [{**default_parameters, **dict(zip(names, values))} for values in product(*param_grid.values())]
+
+
+def _run_task(task: Tuple[int, Dict, np.random.SeedSequence, int, int, int, int, str, int]) -> Tuple[int, np.ndarray]:
+    grid_index, params, seed_sequence, n_paths, n_obs, offset, first_path, sampling, n_scrambles = task
+    paths = generate_market_paths(a0=params['a0'],
+                                  p_arr=np.array(params['p_arr']),
+                                  q_arr=np.array(params['q_arr']),
+                                  n_paths=n_paths,
+                                  n_obs=n_obs,
+                                  offset=offset,
+                                  risk_free_rate=params['risk_free_rate'],
+                                  seed=seed_sequence,
+                                  sampling=sampling,
+                                  n_scrambles=n_scrambles)
+
+    # Every path is simulated in units of its initial price, so one option book with strike otm_multiplier serves
+    # all of them. Prices are homogeneous in (spot, strike) and deltas are scale free, so the threshold decisions
+    # are the same as in absolute terms and PVs only need rescaling.
+    initial_price = paths.asset_price[:, :1]
+    start = paths.market_time[0].to_pydatetime()
+    opt = StockOption(amount=1,
+                      expiry=paths.market_time[-1].to_pydatetime(),
+                      strike=params['otm_multiplier'],
+                      sigma=params['sigma'])
+    portfolio = Portfolio([Trade(start, 1., opt)], params['delta_threshold'])
+    simulation = BatchHedgeSimulation(portfolio)
+    unit_price = paths.asset_price / initial_price
+    result = simulation.simulate(unit_price, paths.market_time, params['risk_free_rate'])
+    # Both control terms are homogeneous of degree one in the price scale, like the PVs
+    controls = black_scholes_controls(unit_price, paths.asset_volatility,
+                                      *simulation.option_delta_gamma(unit_price, paths.market_time,
+                                                                     params['risk_free_rate'])) * initial_price
+
+    # Path groups are made unique across tasks by the index of the first path of the block
+    pv = result['porfolio_pv'] * initial_price
+    stats = np.column_stack([pv[:, -1],
+                             np.std(np.diff(pv, axis=1), axis=1),
+                             np.count_nonzero(result['hedge_asset_amount'], axis=1),
+                             pv[:, -1] - pv[:, 0],
+                             controls,
+                             first_path + paths.path_group])
+    return grid_index, stats
+
+
+def run_sweep(param_grid: Dict[str, Sequence],
+              n_paths: int = 100,
+              n_obs: int = 366,
+              offset: int = 10,
+              seed: int = 0,
+              seed_policy: str = 'common',
+              paths_per_task: int = 100,
+              max_workers: Optional[int] = None,
+              chunksize: int = 1,
+              sampling: str = 'pseudo',
+              n_scrambles: int = 8,
+              use_controls: bool = True) -> 'pd.DataFrame':
+    if seed_policy not in seed_policies:
+        raise ValueError(f'Seed policy should be one of {seed_policies}, got {seed_policy}')
+
+    # Tasks are (grid point, block of paths). Seeds depend only on the seed policy and task coordinates, never on
+    # which worker runs a task, and tasks ship parameters rather than market data in both directions.
+    grid = _grid(param_grid)
+    tasks = []
+    for grid_index, params in enumerate(grid):
+        for block, block_start in enumerate(range(0, n_paths, paths_per_task)):
+            spawn_key = (block,) if seed_policy == 'common' else (grid_index, block)
+            tasks.append((grid_index, params, np.random.SeedSequence(seed, spawn_key=spawn_key),
+                          min(paths_per_task, n_paths - block_start), n_obs, offset, block_start, sampling,
+                          n_scrambles))
+
+    if max_workers == 1:
+        results = list(map(_run_task, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_run_task, tasks, chunksize=chunksize))
+
+    stats = [[] for _ in grid]
+    for grid_index, task_stats in results:
+        stats[grid_index].append(task_stats)
+
+    rows = []
+    for params, grid_stats in zip(grid, stats):
+        grid_stats = np.concatenate(grid_stats)
+        pnl = estimate(grid_stats[:, 3], grid_stats[:, 6], grid_stats[:, 4:6] if use_controls else None)
+        rows.append({**{name: params[name] for name in param_grid},
+                     'n_paths': len(grid_stats),
+                     'final_pv_mean': grid_stats[:, 0].mean(),
+                     'final_pv_std': grid_stats[:, 0].std(),
+                     'hedge_error_std': grid_stats[:, 1].mean(),
+                     'n_rebalances_mean': grid_stats[:, 2].mean(),
+                     'pnl_mean': pnl.mean,
+                     'pnl_stderr': pnl.stderr})
+    import pandas as pd
+
+    return pd.DataFrame(rows)
@@ -0,0 +1,49 @@
+import os
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sova.asset import StockOption
+from sova.black_scholes import OptionType
+from sova.portfolio import Portfolio, Trade
+
+simulation_data_path = os.path.join(os.path.dirname(__file__), os.pardir, 'simulation_data.pickle')
+
+
+def assert_frame_close(actual, expected, rtol: float = 1e-7, atol: float = 0.):
+    # Column by column, as pd.testing.assert_frame_equal only takes rtol and atol from pandas 1.1 on. Index names,
+    # freq and column dtypes are not compared.
+    assert list(actual.columns) == list(expected.columns)
+    np.testing.assert_array_equal(actual.index.to_numpy(), expected.index.to_numpy())
+    for column in expected.columns:
+        np.testing.assert_allclose(actual[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                                   rtol=rtol, atol=atol, err_msg=column)
+
+
+@pytest.fixture(scope='session')
+def market_data() -> pd.DataFrame:
+    return pd.read_pickle(simulation_data_path)
+
+
+@pytest.fixture
+def notebook_portfolio(market_data) -> Callable[..., Portfolio]:
+    # The book of the original notebook: one option bought on the first day of the market data, expiring on its last,
+    # struck at strike_multiplier times the first price. md defaults to simulation_data.pickle.
+    def make(md: Optional[pd.DataFrame] = None,
+             delta_threshold: float = .05,
+             strike_multiplier: float = 1.05,
+             option_class=StockOption,
+             option_type: OptionType = OptionType.CALL,
+             sigma: float = .1,
+             **kwargs) -> Portfolio:
+        md = market_data if md is None else md
+        opt = option_class(amount=1,
+                           expiry=md.index[-1].to_pydatetime(),
+                           strike=strike_multiplier * md.asset_price.iloc[0],
+                           sigma=sigma,
+                           option_type=option_type)
+        return Portfolio([Trade(md.index[0].to_pydatetime(), md.asset_price.iloc[0], opt)], delta_threshold, **kwargs)
+
+    return make
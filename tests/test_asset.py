@@ -4,8 +4,9 @@ from itertools import product
 import numpy as np
 import pytest
 
-from sova.asset import StockOption, Stock, Deposit
+from sova.asset import AmericanStockOption, StockOption, Stock, Deposit
 from sova.black_scholes import OptionType
+from sova.market_time import to_ns
 
 precision = 1e-5
 
@@ -142,3 +143,70 @@ def test_deposit_delta(mult):
     delta = deposit.current_delta(asset_price, market_time)
 
     assert pytest.approx(0, precision) == delta
+
+
+@pytest.mark.parametrize('option_type, mult', test_parameters)
+def test_option_accepts_ns_market_time(option_type, mult):
+    opt = StockOption(amount=amount,
+                      expiry=expiry,
+                      strike=strike,
+                      sigma=sigma,
+                      option_type=option_type)
+    market_time_ns = to_ns(market_time)
+
+    assert opt.current_price(mult * strike, market_time_ns) == opt.current_price(mult * strike, market_time)
+    assert opt.current_delta(mult * strike, market_time_ns) == opt.current_delta(mult * strike, market_time)
+    assert opt.current_price(mult * strike, to_ns(expiry) + 1) == 0
+
+
+@pytest.mark.parametrize('option_type, mult', test_parameters)
+def test_option_risk_matches_price_and_delta(option_type, mult):
+    opt = StockOption(amount=3 * amount,
+                      expiry=expiry,
+                      strike=strike,
+                      sigma=sigma,
+                      option_type=option_type)
+    risk = opt.risk(mult * strike, market_time)
+
+    assert pytest.approx(opt.current_price(mult * strike, market_time), precision) == risk.price
+    assert pytest.approx(opt.current_delta(mult * strike, market_time), precision) == risk.delta
+    assert risk.gamma > 0 and risk.vega > 0
+    assert opt.risk(mult * strike, expiry + dt.timedelta(days=1)) == (0,) * 6
+
+
+@pytest.mark.parametrize('mult', mults)
+def test_linear_assets_risk(mult):
+    assert Stock(2).risk(mult * strike, market_time) == (2 * mult * strike, 2, 0, 0, 0, 0)
+    assert Deposit(2).risk(mult * strike, market_time) == (2, 0, 0, 0, 0, 0)
+
+
+@pytest.mark.parametrize('option_type, mult', test_parameters)
+def test_american_option_against_european(option_type, mult):
+    american = AmericanStockOption(amount=2 * amount, expiry=expiry, strike=strike, sigma=sigma,
+                                   option_type=option_type)
+    european = StockOption(amount=2 * amount, expiry=expiry, strike=strike, sigma=sigma, option_type=option_type)
+    asset_price = mult * strike
+    price, delta = american.current_price_delta(asset_price, market_time, .05)
+
+    assert price == american.current_price(asset_price, market_time, .05)
+    assert delta == american.current_delta(asset_price, market_time, .05)
+    if option_type == OptionType.CALL:
+        assert pytest.approx(european.current_price(asset_price, market_time, .05), precision) == price
+    else:
+        assert price >= european.current_price(asset_price, market_time, .05)
+        assert price >= 2 * amount * (strike - asset_price)
+    assert american.contract_key != european.contract_key
+
+
+@pytest.mark.parametrize('mult', mults)
+def test_american_option_risk(mult):
+    american = AmericanStockOption(amount=3 * amount, expiry=expiry, strike=strike, sigma=sigma,
+                                   option_type=OptionType.PUT)
+    risk = american.risk(mult * strike, market_time, .05)
+
+    assert pytest.approx(american.current_price(mult * strike, market_time, .05), precision) == risk.price
+    assert pytest.approx(american.current_delta(mult * strike, market_time, .05), precision) == risk.delta
+    # Deep in the money the put sits in the exercise region, where only rounding is left of gamma, vega and rho
+    assert min(risk.gamma, risk.vega, -risk.rho) > -1e-10
+    assert american.risk(mult * strike, expiry + dt.timedelta(days=1)) == (0,) * 6
+    assert american.current_price_delta(mult * strike, expiry + dt.timedelta(days=1)) == (0, 0)
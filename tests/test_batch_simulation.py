@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from conftest import assert_frame_close
+from sova.asset import StockOption, Stock, Deposit
+from sova.batch_simulation import BatchHedgeSimulation
+from sova.black_scholes import OptionType
+from sova.hedge_policy import ThresholdPolicy, WhalleyWilmottPolicy
+from sova.market_data import generate_market_paths
+from sova.pnl_explain import explain_columns
+from sova.portfolio import Portfolio, Trade
+from sova.simulation import HedgeSimulation
+
+@pytest.mark.parametrize('delta_threshold, option_type', [(.3, OptionType.CALL),
+                                                          (.05, OptionType.PUT),
+                                                          (0., OptionType.CALL)])
+def test_batch_simulation_matches_per_row_simulation(delta_threshold, option_type, market_data, notebook_portfolio):
+    expected = HedgeSimulation(notebook_portfolio(delta_threshold=delta_threshold, option_type=option_type)) \
+        .run_simulation(market_data)
+    result = BatchHedgeSimulation(notebook_portfolio(delta_threshold=delta_threshold, option_type=option_type)) \
+        .simulate(market_data.asset_price.values, market_data.index, market_data.risk_free_rate.values)
+
+    assert_frame_close(result.path(0), expected, atol=1e-10)
+
+
+def test_batch_simulation_matches_default_per_row_simulation(market_data):
+    expected = HedgeSimulation().run_simulation(market_data)
+    result = BatchHedgeSimulation().simulate(market_data.asset_price.values, market_data.index)
+
+    assert_frame_close(result.path(0), expected, atol=1e-10)
+
+
+def test_batch_simulation_matches_per_row_simulation_on_many_paths():
+    paths = generate_market_paths(1e-5, np.array([.01]), np.array([.002]), n_paths=4, n_obs=120, seed=3)
+    time = paths.market_time[0].to_pydatetime()
+    expiry = paths.market_time[60].to_pydatetime()
+
+    def portfolio():
+        return Portfolio([Trade(time, 1, StockOption(1, expiry, strike=2.7, sigma=.1)),
+                          Trade(time, 1, StockOption(-2, expiry, strike=2.8, sigma=.15, option_type=OptionType.PUT)),
+                          Trade(time, 1, Stock(.5)),
+                          Trade(time, 1, Deposit(-1.))], delta_threshold=.1)
+
+    result = BatchHedgeSimulation(portfolio()).run_simulation(paths)
+
+    assert result.n_paths == 4
+    for i in range(paths.n_paths):
+        expected = HedgeSimulation(portfolio()).run_simulation(paths.path(i))
+        assert_frame_close(result.path(i), expected, atol=1e-10)
+
+
+@pytest.mark.parametrize('hedge_policy', [ThresholdPolicy(.05, transaction_cost=.001),
+                                          WhalleyWilmottPolicy(transaction_cost=.002)])
+def test_batch_pnl_explain_matches_per_row_explain(hedge_policy, market_data, notebook_portfolio):
+    def portfolio():
+        return notebook_portfolio(option_type=OptionType.PUT, hedge_policy=hedge_policy)
+
+    expected = HedgeSimulation(portfolio(), explain=True).run_simulation(market_data)
+    result = BatchHedgeSimulation(portfolio(), explain=True) \
+        .simulate(market_data.asset_price.values, market_data.index, market_data.risk_free_rate.values)
+
+    assert list(result.columns) == list(expected.columns)
+    assert_frame_close(result.path(0), expected, atol=1e-10)
+
+
+def test_explain_stats_stream_blocks_of_paths():
+    def blocks():
+        for seed in range(3):
+            yield generate_market_paths(1e-5, np.array([.01]), np.array([.002]), n_paths=20, n_obs=60, offset=1,
+                                        seed=seed)
+
+    def portfolio():
+        paths = next(blocks())
+        opt = StockOption(1, paths.market_time[-1].to_pydatetime(), strike=2.8, sigma=.1)
+        return Portfolio([Trade(paths.market_time[0].to_pydatetime(), 1., opt)], .1)
+
+    simulation = BatchHedgeSimulation(portfolio())
+    stats = simulation.explain_stats(blocks())
+    results = [BatchHedgeSimulation(portfolio(), explain=True).run_simulation(paths) for paths in blocks()]
+
+    assert 'pnl' not in simulation.run_simulation(next(blocks())).columns
+    assert stats.count == 60
+    for column in explain_columns:
+        values = np.concatenate([r[column] for r in results])
+        np.testing.assert_allclose(stats.step_mean[column], values.mean(axis=0), atol=1e-14)
+        np.testing.assert_allclose(stats.step_std[column], values.std(axis=0, ddof=1), atol=1e-14)
+        assert stats.total_mean[column] == pytest.approx(values.sum(axis=1).mean(), abs=1e-14)
+    assert stats.total_std['gamma_pnl'] > 0
@@ -0,0 +1,25 @@
+from benchmarks.suite import benchmarks, run, compare, save, load
+
+
+def _results(**best):
+    return {'meta': {}, 'results': {name: {'best': t} for name, t in best.items()}}
+
+
+def test_compare_flags_only_slowdowns_beyond_tolerance():
+    baseline = _results(a=1., b=1., c=1.)
+    current = _results(a=1.1, b=1.5, c=.5, d=10.)
+
+    assert compare(current, baseline, tolerance=.2) == {'b': 1.5}
+    assert compare(current, baseline, tolerance=.05) == {'a': 1.1, 'b': 1.5}
+
+
+def test_run_writes_machine_readable_results(tmp_path):
+    selected = [b for b in benchmarks if b.name in ('black_scholes_price', 'portfolio_current_delta[n_trades=10]')]
+    results = run(selected, repeat=2, min_time=1e-3)
+    path = str(tmp_path / 'results.json')
+    save(results, path)
+    loaded = load(path)
+
+    assert set(loaded['results']) == {b.name for b in selected}
+    assert all(r['best'] > 0 for r in loaded['results'].values())
+    assert compare(loaded, loaded) == {}
@@ -0,0 +1,141 @@
+import subprocess
+import sys
+from itertools import product
+
+import numpy as np
+import pytest
+
+from sova.black_scholes import OptionType, black_scholes_greeks, black_scholes_price, black_scholes_delta, \
+    black_scholes_gamma, black_scholes_price_delta, option_sign, set_norm_backend, norm_cdf, norm_pdf
+
+precision = 1e-8
+
+rng = np.random.default_rng(1)
+n = 200
+s_arr = rng.uniform(.5, 1.5, n)
+k_arr = rng.uniform(.5, 1.5, n)
+t_arr = rng.uniform(.01, 3, n)
+r_arr = rng.uniform(0, .1, n)
+sigma_arr = rng.uniform(.05, .6, n)
+types = [OptionType.CALL if c else OptionType.PUT for c in rng.uniform(size=n) > .5]
+
+
+def test_batched_price_and_delta_match_scalar():
+    greeks = black_scholes_greeks(option_sign(types), s_arr, k_arr, t_arr, r_arr, sigma_arr)
+
+    for i in range(n):
+        args = (types[i], s_arr[i], k_arr[i], t_arr[i], r_arr[i], sigma_arr[i])
+        assert pytest.approx(black_scholes_price(*args), abs=precision) == greeks.price[i]
+        assert pytest.approx(black_scholes_delta(*args), abs=precision) == greeks.delta[i]
+        assert pytest.approx(black_scholes_gamma(*args[1:]), abs=precision) == greeks.gamma[i]
+
+
+def test_batched_call_put_parity():
+    call = black_scholes_greeks(1, s_arr, k_arr, t_arr, r_arr, sigma_arr)
+    put = black_scholes_greeks(-1, s_arr, k_arr, t_arr, r_arr, sigma_arr)
+
+    np.testing.assert_allclose(call.price - put.price, s_arr - k_arr * np.exp(-r_arr * t_arr), atol=precision)
+    np.testing.assert_allclose(call.delta - put.delta, 1, atol=precision)
+    np.testing.assert_allclose(call.gamma, put.gamma, atol=precision)
+    np.testing.assert_allclose(call.vega, put.vega, atol=precision)
+
+
+@pytest.mark.parametrize('sign', [1, -1])
+def test_greeks_match_finite_differences(sign):
+    h = 1e-5
+    greeks = black_scholes_greeks(sign, s_arr, k_arr, t_arr, r_arr, sigma_arr)
+
+    def price(s=s_arr, t=t_arr, sigma=sigma_arr):
+        return black_scholes_greeks(sign, s, k_arr, t, r_arr, sigma).price
+
+    np.testing.assert_allclose(greeks.delta, (price(s=s_arr + h) - price(s=s_arr - h)) / (2 * h), atol=1e-6)
+    np.testing.assert_allclose(greeks.gamma,
+                               (price(s=s_arr + h) - 2 * price() + price(s=s_arr - h)) / h ** 2,
+                               rtol=1e-3, atol=1e-3)
+    np.testing.assert_allclose(greeks.vega,
+                               (price(sigma=sigma_arr + h) - price(sigma=sigma_arr - h)) / (2 * h),
+                               atol=1e-6)
+    np.testing.assert_allclose(greeks.theta, -(price(t=t_arr + h) - price(t=t_arr - h)) / (2 * h), atol=1e-6)
+
+
+def test_greeks_at_expiry_are_payoff():
+    s = np.array([.8, 1.2])
+    greeks = black_scholes_greeks(np.array([1, -1]), s, 1., 0., .01, .2)
+
+    np.testing.assert_allclose(greeks.price, [0, 0])
+    np.testing.assert_allclose(greeks.delta, [0, 0])
+    np.testing.assert_allclose(greeks.gamma, [0, 0])
+
+    greeks = black_scholes_greeks(np.array([1, -1]), s[::-1], 1., 0., .01, .2)
+
+    np.testing.assert_allclose(greeks.price, [.2, .2])
+    np.testing.assert_allclose(greeks.delta, [1, -1])
+
+
+@pytest.fixture
+def scipy_backend():
+    set_norm_backend('scipy')
+    yield
+    set_norm_backend('fast')
+
+
+moneyness = [.2, .5, .8, .99, 1., 1.01, 1.2, 2., 5.]
+near_expiry = [1e-8, 1e-5, 1 / 365, .1, 2.]
+accuracy_parameters = list(product(moneyness, near_expiry, [.05, .3, 1.]))
+
+
+def _prices(m, t, sigma):
+    greeks = black_scholes_greeks(np.array([1., -1.]), m, 1., t, .02, sigma)
+    scalar = [black_scholes_price(o, m, 1., t, .02, sigma) for o in [OptionType.CALL, OptionType.PUT]] + \
+             [black_scholes_delta(o, m, 1., t, .02, sigma) for o in [OptionType.CALL, OptionType.PUT]] + \
+             [black_scholes_gamma(m, 1., t, .02, sigma)]
+    return np.concatenate([np.ravel(g) for g in greeks] + [scalar])
+
+
+def test_fast_backend_matches_scipy_stats(scipy_backend):
+    expected = np.array([_prices(*p) for p in accuracy_parameters])
+    set_norm_backend('fast')
+    actual = np.array([_prices(*p) for p in accuracy_parameters])
+
+    np.testing.assert_allclose(actual, expected, rtol=1e-12, atol=1e-15)
+
+
+def test_fast_backend_tails():
+    x = np.array([-30., -20., -8., 0., 8., 20.])
+    expected = [4.9067e-198, 2.7536e-89, 6.2210e-16, .5, 1., 1.]
+
+    np.testing.assert_allclose(norm_cdf(x), expected, rtol=1e-4)
+    np.testing.assert_allclose([norm_cdf(float(v)) for v in x], expected, rtol=1e-4)
+    np.testing.assert_allclose([norm_pdf(float(v)) for v in x], norm_pdf(x), rtol=1e-14)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        set_norm_backend('numba')
+
+
+def test_fast_backend_does_not_import_scipy_stats():
+    code = 'import sys, sova.black_scholes as bs; bs.black_scholes_price(bs.OptionType.CALL, 1., 1., 1., .01, .2); ' \
+           'print("scipy.stats" in sys.modules)'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+
+    assert output.strip() == 'False'
+
+
+@pytest.mark.parametrize('sign', [1, -1])
+def test_rho_matches_finite_differences(sign):
+    h = 1e-6
+    greeks = black_scholes_greeks(sign, s_arr, k_arr, t_arr, r_arr, sigma_arr)
+    up = black_scholes_greeks(sign, s_arr, k_arr, t_arr, r_arr + h, sigma_arr).price
+    down = black_scholes_greeks(sign, s_arr, k_arr, t_arr, r_arr - h, sigma_arr).price
+
+    np.testing.assert_allclose(greeks.rho, (up - down) / (2 * h), atol=1e-6)
+
+
+@pytest.mark.parametrize('m, t, sigma', accuracy_parameters[::7] + [(1., 0., .2), (1.1, 0., .2)])
+def test_price_delta_matches_separate_functions(m, t, sigma):
+    for o in [OptionType.CALL, OptionType.PUT]:
+        price, delta = black_scholes_price_delta(o, m, 1., t, .02, sigma)
+
+        np.testing.assert_equal((price, delta), (black_scholes_price(o, m, 1., t, .02, sigma),
+                                                 black_scholes_delta(o, m, 1., t, .02, sigma)))
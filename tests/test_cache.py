@@ -0,0 +1,92 @@
+import datetime as dt
+
+import pandas as pd
+import pytest
+
+from sova.asset import StockOption
+from sova.cache import ValuationCache
+from sova.portfolio import Portfolio, Trade
+from sova.simulation import HedgeSimulation
+
+precision = 1e-10
+
+expiry = dt.datetime(2021, 1, 1, 0, 0)
+market_time = dt.datetime(2020, 1, 1, 0, 0)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ValuationCache(maxsize=2)
+    tick = (1., market_time, .01)
+    cache.get(tick, 'a', lambda: 1)
+    cache.get(tick, 'b', lambda: 2)
+    cache.get(tick, 'a', lambda: 0)
+    cache.get(tick, 'c', lambda: 3)
+
+    assert len(cache) == 2
+    assert cache.get(tick, 'a', lambda: 0) == 1
+    assert cache.get(tick, 'b', lambda: 0) == 0
+    assert cache.hits == 2
+    assert cache.misses == 4
+
+
+def test_cache_is_scoped_to_one_tick():
+    cache = ValuationCache()
+    cache.get((1., market_time, .01), 'a', lambda: 1)
+
+    assert cache.get((1.1, market_time, .01), 'a', lambda: 2) == 2
+    assert cache.get((1., market_time, .01), 'a', lambda: 3) == 3
+    assert cache.hits == 0
+
+
+def test_option_cache_shares_unit_values_between_amounts():
+    cache = ValuationCache()
+    opt1 = StockOption(amount=1, expiry=expiry, strike=1., sigma=.1, cache=cache)
+    opt2 = StockOption(amount=3, expiry=expiry, strike=1., sigma=.1, cache=cache)
+
+    price1 = opt1.current_price(1.05, market_time)
+    price2 = opt2.current_price(1.05, market_time)
+
+    assert pytest.approx(3 * price1, precision) == price2
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_option_price_and_delta_share_one_valuation():
+    cache = ValuationCache()
+    opt = StockOption(amount=2, expiry=expiry, strike=1., sigma=.1, cache=cache)
+    uncached = StockOption(amount=2, expiry=expiry, strike=1., sigma=.1)
+
+    assert pytest.approx(uncached.current_price(1.05, market_time), precision) == opt.current_price(1.05, market_time)
+    assert pytest.approx(uncached.current_delta(1.05, market_time), precision) == opt.current_delta(1.05, market_time)
+    assert opt.current_price_delta(1.05, market_time) == (opt.current_price(1.05, market_time),
+                                                          opt.current_delta(1.05, market_time))
+    assert cache.misses == 1
+    assert cache.hits == 4
+
+
+def test_portfolio_price_and_delta_share_one_valuation():
+    cache = ValuationCache()
+    trades = [Trade(market_time, 1., StockOption(amount=a, expiry=expiry, strike=k, sigma=.1))
+              for a, k in [(1, 1.), (-2, 1.1), (3, 1.)]]
+    portfolio = Portfolio(trades, valuation_cache=cache)
+    expected = Portfolio(trades)
+
+    assert pytest.approx(expected.current_delta(1.05, market_time), precision) == \
+        portfolio.current_delta(1.05, market_time)
+    assert pytest.approx(expected.current_price(1.05, market_time), precision) == \
+        portfolio.current_price(1.05, market_time)
+    assert portfolio.current_price_delta(1.05, market_time) == (portfolio.current_price(1.05, market_time),
+                                                                portfolio.current_delta(1.05, market_time))
+    assert cache.misses == 2
+    assert cache.hits == 8
+
+
+def test_cached_simulation_matches_uncached(market_data, notebook_portfolio):
+    cache = ValuationCache()
+    expected = HedgeSimulation(notebook_portfolio()).run_simulation(market_data)
+    actual = HedgeSimulation(notebook_portfolio(valuation_cache=cache)).run_simulation(market_data)
+
+    pd.testing.assert_frame_equal(expected, actual)
+    # The simulation values every line once per tick, so the cache has nothing to share there
+    assert (actual.hedge_asset_amount != 0).any()
+    assert cache.misses == len(market_data)
@@ -0,0 +1,138 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from conftest import assert_frame_close
+from sova import portfolio as portfolio_module
+from sova.asset import AmericanStockOption, StockOption
+from sova.black_scholes import OptionType
+from sova.batch_simulation import BatchHedgeSimulation
+from sova.hedge_policy import ThresholdPolicy, WhalleyWilmottPolicy, TimeSchedulePolicy
+from sova.market_data import generate_market_paths
+from sova.portfolio import Portfolio, Trade
+from sova.simulation import HedgeSimulation
+
+deltas = np.array([-.5, -.1, 0., .05, .3])
+gammas = np.array([2., 0., 1., 10., .5])
+stock_prices = np.array([1., 1.1, .9, 1., 1.2])
+
+
+def _policies():
+    return [ThresholdPolicy(.1),
+            ThresholdPolicy(.1, transaction_cost=.002, to_edge=True),
+            WhalleyWilmottPolicy(transaction_cost=.002, risk_aversion=.5),
+            WhalleyWilmottPolicy(transaction_cost=.01, to_edge=False),
+            TimeSchedulePolicy(dt.timedelta(days=7), transaction_cost=.001)]
+
+
+@pytest.mark.parametrize('policy', _policies())
+def test_scalar_and_array_rebalance_agree(policy):
+    since_hedge = np.array([np.inf, 1 / 365, 7 / 365, .5, 0.])
+    expected = policy.rebalance(deltas, gammas, stock_prices, since_hedge)
+
+    assert expected.shape == deltas.shape
+    for i in range(len(deltas)):
+        assert policy.rebalance(float(deltas[i]), float(gammas[i]), float(stock_prices[i]), float(since_hedge[i])) \
+            == pytest.approx(expected[i], abs=1e-15)
+
+
+def test_threshold_policy_rebalances_to_zero_or_band_edge():
+    np.testing.assert_allclose(ThresholdPolicy(.1).rebalance(deltas, 0., 1., np.inf), [.5, 0, 0, 0, -.3])
+    np.testing.assert_allclose(ThresholdPolicy(.1, to_edge=True).rebalance(deltas, 0., 1., np.inf),
+                               [.4, 0, 0, 0, -.2])
+
+
+def test_whalley_wilmott_band_widens_with_gamma_and_cost():
+    policy = WhalleyWilmottPolicy(transaction_cost=.002, risk_aversion=.5)
+    band = policy.band(gammas, stock_prices)
+    trade = policy.rebalance(deltas, gammas, stock_prices, np.inf)
+
+    np.testing.assert_allclose(band, np.cbrt(1.5 * .002 * stock_prices * gammas ** 2 / .5))
+    assert np.all(WhalleyWilmottPolicy(transaction_cost=.004, risk_aversion=.5).band(gammas, stock_prices) >= band)
+    np.testing.assert_allclose(np.abs(deltas + trade), np.minimum(np.abs(deltas), band))
+
+
+def test_time_schedule_policy_waits_for_interval():
+    policy = TimeSchedulePolicy(dt.timedelta(days=7))
+    since_hedge = np.array([np.inf, 6 / 365, 7 / 365, 8 / 365, 0.])
+
+    np.testing.assert_allclose(policy.rebalance(deltas, 0., 1., since_hedge), [.5, 0, 0, -.05, 0])
+
+
+def test_portfolio_charges_transaction_cost_to_deposit(market_data):
+    time = market_data.index[0].to_pydatetime()
+    opt = StockOption(amount=1, expiry=market_data.index[-1].to_pydatetime(), strike=1.05, sigma=.1)
+    portfolio = Portfolio([Trade(time, 1., opt)], hedge_policy=ThresholdPolicy(0., transaction_cost=.01))
+    delta = portfolio.current_delta(1., time)
+    price = portfolio.current_price(1., time)
+
+    hedge_deposit, hedge_asset = portfolio.hedge_delta(1., time)
+
+    assert hedge_asset.amount == pytest.approx(-delta)
+    assert hedge_deposit.amount == pytest.approx(delta - .01 * delta)
+    assert portfolio.current_price(1., time) == pytest.approx(price - .01 * delta)
+    assert portfolio.current_delta(1., time) == pytest.approx(0)
+
+
+def test_delta_threshold_writes_through_to_threshold_policy(market_data):
+    time = market_data.index[0].to_pydatetime()
+    opt = StockOption(amount=1, expiry=market_data.index[-1].to_pydatetime(), strike=1.05, sigma=.1)
+    portfolio = Portfolio([Trade(time, 1., opt)], delta_threshold=.9)
+    assert portfolio.hedge_delta(1., time)[1].amount == 0
+
+    portfolio.delta_threshold = .01
+
+    assert portfolio.hedge_policy.delta_threshold == .01
+    assert portfolio.hedge_delta(1., time)[1].amount != 0
+    policy = WhalleyWilmottPolicy(.002)
+    band_portfolio = Portfolio([], delta_threshold=.2, hedge_policy=policy)
+    band_portfolio.delta_threshold = .3
+    assert band_portfolio.delta_threshold == .3 and band_portfolio.hedge_policy is policy
+
+
+def test_gamma_policy_hedge_values_the_book_without_vega_and_rho(monkeypatch, market_data):
+    calls = []
+    american_greeks = portfolio_module.american_greeks
+
+    def recorded(*args, **kwargs):
+        calls.append(kwargs.get('vega_rho', True))
+        return american_greeks(*args, **kwargs)
+
+    monkeypatch.setattr(portfolio_module, 'american_greeks', recorded)
+    time = market_data.index[0].to_pydatetime()
+    put = AmericanStockOption(amount=1, expiry=market_data.index[-1].to_pydatetime(), strike=1.05, sigma=.1,
+                              option_type=OptionType.PUT)
+    portfolio = Portfolio([Trade(time, 1., put)], hedge_policy=WhalleyWilmottPolicy(.002))
+
+    _, hedge_asset = portfolio.hedge_delta(1., time)
+    assert calls == [False]
+    assert hedge_asset.amount != 0
+    # With delta and gamma passed in nothing is valued, and the given delta is the one hedged
+    portfolio.hedge_delta(1., time, delta=.5, gamma=0.)
+    assert calls == [False]
+    assert portfolio.current_delta(1., time) == pytest.approx(put.current_delta(1., time) + hedge_asset.amount - .5)
+
+
+@pytest.mark.parametrize('policy', _policies())
+def test_batch_policy_matches_per_row_simulation(policy, notebook_portfolio):
+    paths = generate_market_paths(1e-4, np.array([.01]), np.array([.02]), n_paths=3, n_obs=100, seed=5)
+    result = BatchHedgeSimulation(hedge_policy=policy).simulate(paths.asset_price, paths.market_time,
+                                                                paths.risk_free_rate)
+
+    for i in range(paths.n_paths):
+        md = paths.path(i)
+        # The book BatchHedgeSimulation hedges when it is given no portfolio
+        book = notebook_portfolio(md, strike_multiplier=1 / np.exp(-md.risk_free_rate.iloc[0]), sigma=.2,
+                                  hedge_policy=policy)
+        expected = HedgeSimulation(book).run_simulation(md)
+        assert_frame_close(result.path(i), expected, atol=1e-10)
+
+
+def test_bands_trade_less_than_threshold_hedging():
+    paths = generate_market_paths(1e-4, np.array([.01]), np.array([.02]), n_paths=200, n_obs=200, seed=7)
+    full = BatchHedgeSimulation(hedge_policy=ThresholdPolicy(0.)).run_simulation(paths)
+    band = BatchHedgeSimulation(hedge_policy=WhalleyWilmottPolicy(.005)).run_simulation(paths)
+
+    assert np.abs(band['hedge_asset_amount']).sum() < np.abs(full['hedge_asset_amount']).sum()
+    assert np.count_nonzero(band['hedge_asset_amount']) < np.count_nonzero(full['hedge_asset_amount'])
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from sova.black_scholes import OptionType, black_scholes_greeks, black_scholes_price, option_sign
+from sova.implied_vol import implied_vol
+
+rng = np.random.default_rng(2)
+n = 2000
+sign = np.where(rng.uniform(size=n) > .5, 1., -1.)
+s_arr = rng.uniform(.7, 1.3, n)
+k_arr = rng.uniform(.7, 1.3, n)
+t_arr = rng.uniform(.05, 3, n)
+r_arr = rng.uniform(0, .05, n)
+sigma_arr = rng.uniform(.05, 1., n)
+greeks = black_scholes_greeks(sign, s_arr, k_arr, t_arr, r_arr, sigma_arr)
+# Options whose price barely moves with the vol do not pin it down
+identified = greeks.vega > 1e-4
+
+
+def test_recovers_vol_from_prices():
+    result = implied_vol(greeks.price, sign, s_arr, k_arr, t_arr, r_arr)
+
+    assert result.converged[identified].all()
+    np.testing.assert_allclose(result.sigma[identified], sigma_arr[identified], atol=1e-6)
+    assert np.abs(result.error[result.converged]).max() <= 1e-10
+    assert result.n_iterations < 50
+
+
+def test_warm_start_converges_in_two_steps():
+    cold = implied_vol(greeks.price, sign, s_arr, k_arr, t_arr, r_arr)
+    next_price = black_scholes_greeks(sign, s_arr * 1.002, k_arr, t_arr - 1 / 365, r_arr, sigma_arr * 1.01).price
+    warm = implied_vol(next_price, sign, s_arr * 1.002, k_arr, t_arr - 1 / 365, r_arr, initial_sigma=cold.sigma)
+
+    assert warm.converged[identified].all()
+    assert np.median(warm.iterations[identified]) <= 2
+    np.testing.assert_allclose(warm.sigma[identified], 1.01 * sigma_arr[identified], atol=1e-6)
+    assert implied_vol(greeks.price, sign, s_arr, k_arr, t_arr, r_arr,
+                       initial_sigma=sigma_arr).iterations[identified].max() <= 1
+
+
+@pytest.mark.parametrize('option_type', [OptionType.CALL, OptionType.PUT])
+def test_matches_scalar_pricer_and_broadcasts(option_type):
+    strikes = np.array([[.8, 1.], [1.2, 1.5]])
+    prices = np.array([[black_scholes_price(option_type, 1., k, .5, .01, .3) for k in row] for row in strikes])
+    result = implied_vol(prices, option_sign(option_type), 1., strikes, .5, .01)
+
+    assert result.sigma.shape == (2, 2)
+    np.testing.assert_allclose(result.sigma, .3, atol=1e-8)
+
+
+def test_prices_without_implied_vol_are_flagged():
+    # Below intrinsic, above the spot, and at expiry
+    result = implied_vol(np.array([.1, 1.5, .1]), 1., 1., np.array([.8, 1., 1.]), np.array([1., 1., 0.]), 0.)
+
+    assert np.isnan(result.sigma).all()
+    assert not result.converged.any()
+    assert (result.iterations == 0).all()
+
+
+def test_bad_warm_start_falls_back_to_bracket():
+    result = implied_vol(greeks.price, sign, s_arr, k_arr, t_arr, r_arr, initial_sigma=np.nan)
+    far = implied_vol(greeks.price, sign, s_arr, k_arr, t_arr, r_arr, initial_sigma=50.)
+
+    np.testing.assert_allclose(result.sigma[identified], sigma_arr[identified], atol=1e-6)
+    np.testing.assert_allclose(far.sigma[identified], sigma_arr[identified], atol=1e-6)
+
+
+@pytest.mark.parametrize('true_sigma, sigma_bounds, expected', [(1.5, (1e-6, 1.), 1.), (.05, (.1, 10.), .1)])
+def test_vol_outside_bounds_is_not_converged(true_sigma, sigma_bounds, expected):
+    price = black_scholes_price(OptionType.CALL, 1., 1., 1., .01, true_sigma)
+    result = implied_vol(price, 1., 1., 1., 1., .01, sigma_bounds=sigma_bounds)
+
+    assert result.sigma == pytest.approx(expected)
+    assert not result.converged
+    assert abs(result.error) > 1e-3
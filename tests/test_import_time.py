@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+from typing import Dict
+
+import pytest
+
+# Importing the pricing code may cost this much on top of numpy, in microseconds. pandas or scipy.special alone take
+# a few hundred milliseconds, so pulling either back in at import time breaks the budget.
+import_budget_us = 150_000
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _import_times(module: str) -> Dict[str, int]:
+    # Cumulative import time per module from python -X importtime, in a fresh interpreter
+    env = dict(os.environ, PYTHONPATH=_root)
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], env=env, cwd=_root,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize('module', ['sova.black_scholes', 'sova.portfolio', 'sova.simulation',
+                                    'sova.batch_simulation'])
+def test_pricing_imports_only_numpy(module):
+    times = _import_times(module)
+
+    assert module in times
+    assert not {'pandas', 'scipy'} & set(times)
+
+
+@pytest.mark.parametrize('module', ['sova.black_scholes', 'sova.simulation'])
+def test_import_time_stays_within_budget(module):
+    # Best of three runs, so a busy machine does not fail the test
+    own_time = min(times[module] - times.get('numpy', 0) for times in (_import_times(module) for _ in range(3)))
+
+    assert own_time < import_budget_us
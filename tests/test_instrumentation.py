@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+import pytest
+
+import sova.asset
+from sova import instrumentation
+from sova.market_data import generate_market_data
+from sova.portfolio import Portfolio
+from sova.simulation import HedgeSimulation
+
+market_data = generate_market_data(1e-5, np.array([.01]), np.array([.002]), n_obs=60, seed=0)
+
+
+def test_recording_counts_calls_per_stage():
+    with instrumentation.record() as recorder:
+        result = HedgeSimulation().run_simulation(market_data)
+    stats = recorder.to_dict()
+    n_rows = len(market_data)
+    n_hedges = (result.hedge_asset_amount != 0).sum()
+
+    assert stats['simulation']['HedgeSimulation.run_simulation']['calls'] == 1
+    assert stats['hedge_row']['HedgeSimulation._hedge_step']['calls'] == n_rows
+    assert stats['result_assembly']['HedgeSimulation._make_result_frame']['calls'] == 1
+    assert stats['valuation']['Portfolio.current_price_delta']['calls'] == n_rows
+    assert stats['valuation']['Portfolio.current_price_delta']['items_per_call'] == 1
+    # The delta after a hedge follows from the one before it, so the book is not valued again
+    assert n_hedges > 0
+    assert stats['valuation']['Portfolio.current_delta']['calls'] == 0
+    assert stats['pricing']['sova.asset.black_scholes_price_delta']['calls'] == n_rows
+    assert stats['pricing']['sova.asset.black_scholes_delta']['calls'] == 0
+    assert stats['hedge_decision']['Portfolio.hedge_delta']['total_time'] > 0
+    assert json.loads(recorder.to_json()) == stats
+    assert recorder.to_frame().loc[('valuation', 'Portfolio.current_price_delta'), 'calls'] == n_rows
+
+
+def test_recording_restores_original_functions():
+    originals = (vars(Portfolio)['current_price'], vars(HedgeSimulation)['_make_result_frame'],
+                 sova.asset.black_scholes_price)
+
+    with instrumentation.record():
+        assert vars(Portfolio)['current_price'] is not originals[0]
+
+    assert (vars(Portfolio)['current_price'], vars(HedgeSimulation)['_make_result_frame'],
+            sova.asset.black_scholes_price) == originals
+    assert isinstance(vars(HedgeSimulation)['_make_result_frame'], staticmethod)
+
+
+def test_recording_does_not_nest():
+    with instrumentation.record():
+        with pytest.raises(RuntimeError):
+            with instrumentation.record():
+                pass
@@ -0,0 +1,113 @@
+from itertools import product
+
+import numpy as np
+import pytest
+
+from sova.black_scholes import black_scholes_greeks
+from sova.lattice import american_greeks
+
+spots = [30., 36., 40., 44., 50.]
+maturities = [.1, 1., 2.]
+
+
+def _plain_crr_put(s_0, k, t, r, sigma, n_steps):
+    # Textbook CRR tree without the smoothing and extension of sova.lattice
+    dt = t / n_steps
+    u = np.exp(sigma * np.sqrt(dt))
+    p = (np.exp(r * dt) - 1 / u) / (u - 1 / u)
+    value = np.maximum(k - s_0 * u ** (2 * np.arange(n_steps + 1) - n_steps), 0.)
+    for i in range(n_steps - 1, -1, -1):
+        value = np.exp(-r * dt) * (p * value[1:] + (1 - p) * value[:-1])
+        value = np.maximum(value, k - s_0 * u ** (2 * np.arange(i + 1) - i))
+    return value[0]
+
+
+@pytest.mark.parametrize('s_0', [36., 40., 44.])
+def test_american_put_matches_fine_plain_tree(s_0):
+    expected = _plain_crr_put(s_0, 40., 1., .06, .2, 4000)
+
+    assert pytest.approx(expected, abs=2e-3) == float(american_greeks(-1., s_0, 40., 1., .06, .2).price)
+
+
+@pytest.mark.parametrize('s_0, t', list(product(spots, maturities)))
+def test_american_put_is_worth_at_least_european_and_exercise(s_0, t):
+    american = float(american_greeks(-1., s_0, 40., t, .06, .2).price)
+    european = float(black_scholes_greeks(-1., s_0, 40., t, .06, .2).price)
+
+    # Up to the discretization error of the tree far out of the money
+    assert american >= european - 2e-5
+    assert american >= 40. - s_0 - 1e-12
+
+
+@pytest.mark.parametrize('s_0, t', list(product(spots, maturities)))
+def test_american_call_without_dividends_is_european(s_0, t):
+    american = american_greeks(1., s_0, 40., t, .06, .2)
+    european = black_scholes_greeks(1., s_0, 40., t, .06, .2)
+
+    np.testing.assert_allclose(np.array(american, dtype=float), np.array(european, dtype=float), rtol=1e-12)
+
+
+@pytest.mark.parametrize('s_0', spots)
+def test_put_at_zero_rate_is_close_to_european(s_0):
+    american = american_greeks(-1., s_0, 40., 1., 0., .2)
+    european = black_scholes_greeks(-1., s_0, 40., 1., 0., .2)
+
+    assert pytest.approx(float(european.price), abs=5e-3) == float(american.price)
+    assert pytest.approx(float(european.delta), abs=2e-3) == float(american.delta)
+    assert pytest.approx(float(european.gamma), abs=2e-3) == float(american.gamma)
+    assert pytest.approx(float(european.vega), rel=1e-2) == float(american.vega)
+    assert pytest.approx(float(european.theta), abs=2e-2) == float(american.theta)
+
+
+@pytest.mark.parametrize('s_0', [34., 38., 42., 46.])
+def test_greeks_match_finite_differences(s_0):
+    def price(s=s_0, t=1., r=.06, sigma=.2):
+        return float(american_greeks(-1., s, 40., t, r, sigma, n_steps=512).price)
+
+    greeks = american_greeks(-1., s_0, 40., 1., .06, .2, n_steps=512)
+    h = .02 * s_0
+
+    assert pytest.approx((price(s_0 + h) - price(s_0 - h)) / (2 * h), abs=2e-3) == float(greeks.delta)
+    assert pytest.approx((price(s_0 + h) - 2 * price() + price(s_0 - h)) / h ** 2, abs=2e-3) == float(greeks.gamma)
+    assert pytest.approx((price(t=.98) - price(t=1.02)) / .04, abs=2e-2) == float(greeks.theta)
+    assert greeks.vega > 0 and greeks.rho < 0
+
+
+def test_batch_matches_single_options():
+    rng = np.random.default_rng(0)
+    s_0 = rng.uniform(30, 50, 20)
+    k = rng.uniform(35, 45, 20)
+    t = rng.uniform(0., 2., 20)
+    sign = rng.choice([-1., 1.], 20)
+    batch = american_greeks(sign, s_0, k, t, .03, .25)
+
+    for i in range(20):
+        single = american_greeks(sign[i], s_0[i], k[i], t[i], .03, .25)
+        np.testing.assert_allclose([g[i] for g in batch], np.array(single, dtype=float), rtol=1e-10, atol=1e-12)
+
+
+def test_inputs_broadcast():
+    greeks = american_greeks(-1., np.array([36., 40.])[:, None], np.array([38., 40., 42.]), 1., .06, .2)
+
+    assert all(g.shape == (2, 3) for g in greeks)
+    assert pytest.approx(float(american_greeks(-1., 40., 42., 1., .06, .2).price)) == greeks.price[1, 2]
+
+
+def test_skipping_vega_rho_keeps_spot_greeks():
+    full = american_greeks(-1., 38., 40., 1., .06, .2)
+    spot_only = american_greeks(-1., 38., 40., 1., .06, .2, vega_rho=False)
+
+    assert full[:3] == pytest.approx(spot_only[:3], abs=1e-14)
+    assert np.isnan(spot_only.vega) and np.isnan(spot_only.rho)
+
+
+def test_expired_option_is_worth_its_payoff():
+    greeks = american_greeks(-1., np.array([36., 44.]), 40., 0., .06, .2)
+
+    np.testing.assert_allclose(greeks.price, [4., 0.])
+    np.testing.assert_allclose(greeks.delta, [-1., 0.])
+
+
+def test_lattice_needs_three_steps():
+    with pytest.raises(ValueError):
+        american_greeks(-1., 40., 40., 1., .06, .2, n_steps=2)
@@ -1,9 +1,131 @@
+import datetime as dt
+
 import numpy as np
+import pytest
 
-from sova.market_data import generate_market_data
+from conftest import assert_frame_close
+from sova.market_data import generate_market_data, generate_market_paths, _garch_recursion
 
 
 def test_market_data_generator():
     md = generate_market_data(.01, np.array([.1]), np.array([.2]))
 
     print(md.head())
+
+
+def _reference_market_data(a0, p_arr, q_arr, shocks, n_obs, offset):
+    # The original np.append based recursion, fed with the given shocks instead of fresh draws
+    p = len(p_arr)
+    q = len(q_arr)
+    p_arr = np.array([p_arr])
+    q_arr = np.array([q_arr])
+
+    eps_arr = np.array([1])
+    sigma_arr = np.array([1])
+    asset_arr = np.array([1])
+
+    for i in range(1, n_obs):
+        sigma = a0 + np.sum(p_arr * eps_arr[-p:] ** 2 + q_arr * sigma_arr[-q:])
+        eps = shocks[i - 1] * np.sqrt(sigma)
+        asset = np.exp(eps_arr[-1]) * asset_arr[-1]
+
+        sigma_arr = np.append(sigma_arr, sigma)
+        eps_arr = np.append(eps_arr, eps)
+        asset_arr = np.append(asset_arr, asset)
+
+    return np.sqrt(sigma_arr[offset:]), eps_arr[offset:], asset_arr[offset:]
+
+
+@pytest.mark.parametrize('p_arr, q_arr', [([.01], [.02]), ([.1, .05], [.2, .1])])
+def test_market_data_matches_reference_recursion(p_arr, q_arr):
+    n_obs = 300
+    offset = 10
+    seed = 7
+    md = generate_market_data(1e-4, np.array(p_arr), np.array(q_arr), n_obs=n_obs, offset=offset, seed=seed)
+    shocks = np.random.default_rng(seed).standard_normal(n_obs - 1)
+    vol, ret, price = _reference_market_data(1e-4, np.array(p_arr), np.array(q_arr), shocks, n_obs, offset)
+
+    np.testing.assert_allclose(md.asset_volatility.values, vol, rtol=1e-12)
+    np.testing.assert_allclose(md.asset_return.values, ret, rtol=1e-12)
+    np.testing.assert_allclose(md.asset_price.values, price, rtol=1e-12)
+    assert md.index[0] == dt.datetime(2020, 1, 1) + dt.timedelta(days=offset)
+    assert len(md) == n_obs - offset
+
+
+def test_market_data_is_pinned_for_seed():
+    md = generate_market_data(1e-4, np.array([.01]), np.array([.02]), n_obs=50, seed=42)
+    rows = md.iloc[[0, 17, -1]]
+
+    np.testing.assert_allclose(rows.asset_price.values, [2.738363905092127, 2.773996355296739, 2.91917724314849],
+                               rtol=1e-12)
+    np.testing.assert_allclose(rows.asset_volatility.values,
+                               [0.01010164187423335, 0.010107984320341348, 0.010104837678224128], rtol=1e-12)
+    np.testing.assert_allclose(rows.asset_return.values,
+                               [-0.008617144259337758, 0.005380572901146922, 0.006860311352386276], rtol=1e-12)
+    assert list(rows.index) == [dt.datetime(2020, 1, 11), dt.datetime(2020, 1, 28), dt.datetime(2020, 2, 19)]
+
+
+def test_market_data_is_reproducible_for_seed():
+    md1 = generate_market_data(1e-4, np.array([.01]), np.array([.02]), n_obs=100, seed=3)
+    md2 = generate_market_data(1e-4, np.array([.01]), np.array([.02]), n_obs=100, seed=3)
+    md3 = generate_market_data(1e-4, np.array([.01]), np.array([.02]), n_obs=100, seed=4)
+
+    assert md1.equals(md2)
+    assert not md1.equals(md3)
+
+
+@pytest.mark.parametrize('p_arr, q_arr', [([.01], [.02]), ([.1, .05], [.2, .1]), ([.1], [.2, .1])])
+def test_market_paths_match_single_path_generator(p_arr, q_arr):
+    n_paths = 5
+    n_obs = 200
+    paths = generate_market_paths(1e-4, np.array(p_arr), np.array(q_arr), n_paths=n_paths, n_obs=n_obs, seed=11)
+    rng = np.random.default_rng(11)
+    seeds = rng.standard_normal((n_paths, n_obs - 1))
+
+    assert paths.asset_price.shape == (n_paths, n_obs - 10)
+    assert paths.n_paths == n_paths
+    for i in range(n_paths):
+        sigma_arr, eps_arr = _garch_recursion(seeds[i], 1e-4, np.array(p_arr), np.array(q_arr))
+        np.testing.assert_allclose(paths.asset_volatility[i], np.sqrt(sigma_arr[10:]), rtol=1e-12)
+        np.testing.assert_allclose(paths.asset_return[i], eps_arr[10:], rtol=1e-12)
+
+
+def test_single_market_path_matches_generate_market_data():
+    md = generate_market_data(1e-4, np.array([.01]), np.array([.02]), n_obs=100, seed=5)
+    paths = generate_market_paths(1e-4, np.array([.01]), np.array([.02]), n_paths=1, n_obs=100, seed=5)
+
+    assert_frame_close(paths.path(0), md, rtol=1e-12)
+
+
+def test_antithetic_paths_mirror_their_pair():
+    paths = generate_market_paths(1e-4, np.array([.01]), np.array([.02]), n_paths=6, n_obs=50, seed=2,
+                                  sampling='antithetic')
+
+    np.testing.assert_allclose(paths.asset_return[3:], -paths.asset_return[:3], rtol=1e-12)
+    np.testing.assert_allclose(paths.asset_volatility[3:], paths.asset_volatility[:3], rtol=1e-12)
+    assert list(paths.path_group) == [0, 1, 2, 0, 1, 2]
+    with pytest.raises(ValueError):
+        generate_market_paths(1e-4, np.array([.01]), np.array([.02]), n_paths=5, sampling='antithetic')
+
+
+@pytest.mark.parametrize('sampling', ['sobol', 'halton'])
+def test_quasi_random_paths_have_normal_shocks(sampling):
+    # requirements.txt pins scipy 1.4.1, and scipy.stats.qmc only came with 1.7
+    pytest.importorskip('scipy.stats.qmc')
+    paths = generate_market_paths(1e-4, np.array([.0]), np.array([.0]), n_paths=256, n_obs=30, offset=1, seed=3,
+                                  sampling=sampling, n_scrambles=4)
+    shocks = paths.asset_return[:, 1:] / paths.asset_volatility[:, 1:]
+    again = generate_market_paths(1e-4, np.array([.0]), np.array([.0]), n_paths=256, n_obs=30, offset=1, seed=3,
+                                  sampling=sampling, n_scrambles=4)
+
+    assert np.isfinite(shocks).all()
+    # Low discrepancy points match the first two moments closer than 256 pseudo-random draws typically do
+    assert np.abs(shocks.mean(axis=0)).max() < .08
+    assert np.abs(shocks.std(axis=0) - 1).max() < .05
+    assert list(np.bincount(paths.path_group)) == [64] * 4
+    np.testing.assert_array_equal(paths.asset_price, again.asset_price)
+
+
+def test_market_paths_reject_unknown_sampling():
+    with pytest.raises(ValueError):
+        generate_market_paths(1e-4, np.array([.01]), np.array([.02]), sampling='lattice')
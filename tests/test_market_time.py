@@ -0,0 +1,36 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sova.market_time import TimeGrid, to_ns, from_ns, year_fraction, seconds_in_year
+
+market_time = dt.datetime(2020, 3, 4, 5, 6, 7, 123456)
+
+
+@pytest.mark.parametrize('t', [market_time, pd.Timestamp(market_time), np.datetime64(market_time),
+                               to_ns(market_time)])
+def test_to_ns_accepts_all_time_types(t):
+    assert to_ns(t) == 1583298367123456000
+    assert from_ns(to_ns(t)) == market_time
+
+
+@pytest.mark.parametrize('days, seconds', [(0, 0), (1, 0), (365, 17), (1000, 86399)])
+def test_year_fraction_matches_datetime_arithmetic(days, seconds):
+    expiry = market_time + dt.timedelta(days=days, seconds=seconds)
+
+    assert year_fraction(to_ns(market_time), to_ns(expiry)) == (expiry - market_time).total_seconds() / \
+        seconds_in_year
+
+
+def test_time_grid_caches_time_to_maturity_per_expiry():
+    index = pd.date_range('2020-01-01', periods=10, freq='D')
+    grid = TimeGrid(index)
+    expiry = dt.datetime(2020, 1, 5)
+
+    ttm = grid.time_to_maturity(expiry)
+
+    assert len(grid) == 10
+    assert grid.time_to_maturity(to_ns(expiry)) is ttm
+    np.testing.assert_array_equal(ttm, [(expiry - t).total_seconds() / seconds_in_year for t in index])
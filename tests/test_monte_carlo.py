@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from sova.batch_simulation import BatchHedgeSimulation
+from sova.market_data import generate_market_paths
+from sova.monte_carlo import estimate, black_scholes_controls, hedge_pnl_estimate
+
+
+def _paths(sampling, n_paths=512, seed=1):
+    return generate_market_paths(1e-5, np.array([.001]), np.array([.002]), n_paths=n_paths, n_obs=366, offset=1,
+                                 seed=seed, sampling=sampling)
+
+
+@pytest.fixture
+def book_simulation(notebook_portfolio):
+    # offset=1 starts every path at the same price, so the book of the first path fits them all
+    return lambda paths: BatchHedgeSimulation(notebook_portfolio(paths.path(0)))
+
+
+def test_estimate_without_groups_is_the_sample_mean():
+    values = np.random.default_rng(0).standard_normal(100)
+    result = estimate(values)
+
+    assert pytest.approx(values.mean(), abs=1e-14) == result.mean
+    assert pytest.approx(values.std(ddof=1) / 10, abs=1e-14) == result.stderr
+    assert (result.n_paths, result.n_samples, result.control_r2) == (100, 100, 0.)
+    assert pytest.approx(result.mean + 1.96 * result.stderr) == result.interval()[1]
+
+
+def test_estimate_averages_groups_first():
+    values = np.array([1., 3., 2., 6.])
+    result = estimate(values, path_group=np.array([0, 0, 5, 5]))
+
+    assert result.mean == 3.
+    assert result.n_samples == 2
+    assert pytest.approx(np.std([2., 4.], ddof=1) / np.sqrt(2)) == result.stderr
+
+
+def test_estimate_removes_the_control_variance():
+    rng = np.random.default_rng(1)
+    control = rng.standard_normal(1000)
+    noise = .1 * rng.standard_normal(1000)
+    plain = estimate(3. + 2. * control + noise)
+    controlled = estimate(3. + 2. * control + noise, controls=control)
+
+    assert controlled.stderr < plain.stderr / 10
+    assert controlled.control_r2 > .99
+    assert abs(controlled.mean - 3.) < 3 * controlled.stderr
+    assert controlled.paths_for_stderr(controlled.stderr) == 1000
+    assert plain.paths_for_stderr(controlled.stderr) > 100 * 1000
+
+
+def test_black_scholes_controls_have_zero_mean(book_simulation):
+    paths = _paths('pseudo', n_paths=2000, seed=5)
+    simulation = book_simulation(paths)
+    controls = black_scholes_controls(paths.asset_price, paths.asset_volatility,
+                                      *simulation.option_delta_gamma(paths.asset_price, paths.market_time,
+                                                                     paths.risk_free_rate))
+
+    assert controls.shape == (2000, 2)
+    for column in controls.T:
+        control_estimate = estimate(column)
+        assert abs(control_estimate.mean) < 4 * control_estimate.stderr
+
+
+def test_option_delta_gamma_matches_simulated_delta(book_simulation):
+    paths = _paths('pseudo', n_paths=3)
+    simulation = book_simulation(paths)
+    result = simulation.run_simulation(paths)
+    delta, gamma = simulation.option_delta_gamma(paths.asset_price, paths.market_time, paths.risk_free_rate)
+    stock = np.cumsum(result['hedge_asset_amount'], axis=1)
+
+    np.testing.assert_allclose(delta + stock, result['portfolio_hedged_delta'], atol=1e-12)
+    assert (gamma >= 0).all()
+
+
+def test_variance_reduction_keeps_the_estimate_and_shrinks_the_error(book_simulation):
+    pseudo = _paths('pseudo')
+    plain = hedge_pnl_estimate(book_simulation(pseudo), pseudo, use_controls=False)
+    antithetic = _paths('antithetic')
+    reduced = hedge_pnl_estimate(book_simulation(antithetic), antithetic)
+
+    assert reduced.n_samples == 256
+    assert reduced.control_r2 > 0
+    assert reduced.stderr < plain.stderr / 2
+    assert abs(reduced.mean - plain.mean) < 4 * np.hypot(reduced.stderr, plain.stderr)
+
+
+@pytest.mark.parametrize('sampling', ['sobol', 'halton'])
+def test_quasi_random_estimate_counts_scrambles(sampling, book_simulation):
+    # requirements.txt pins scipy 1.4.1, and scipy.stats.qmc only came with 1.7
+    pytest.importorskip('scipy.stats.qmc')
+    paths = _paths(sampling, n_paths=256)
+    result = hedge_pnl_estimate(book_simulation(paths), paths, use_controls=False)
+
+    assert result.n_samples == 8
+    assert np.isfinite(result.stderr)
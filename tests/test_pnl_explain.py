@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from sova.pnl_explain import PnlExplainStats, explain_columns, explain_step, first_step_explain
+
+
+def _explain(n_paths, n_steps, seed=0):
+    rng = np.random.default_rng(seed)
+    return {c: rng.normal(i, 1 + i, (n_paths, n_steps)) for i, c in enumerate(explain_columns)}
+
+
+def test_explain_step_reconciles_with_the_financed_pv_change():
+    previous_pv, pv, hedge_cost, rate, deposit, dt = 1.2, 1.25, .003, .02, -.7, 1 / 365
+    explained = dict(zip(explain_columns, explain_step(pv, hedge_cost, .1, dt, previous_pv, .4, 2., -.3, deposit,
+                                                       rate)))
+
+    assert explained['delta_pnl'] == pytest.approx(.04)
+    assert explained['gamma_pnl'] == pytest.approx(.01)
+    assert explained['theta_pnl'] == pytest.approx(-.3 * dt)
+    assert explained['carry_pnl'] == pytest.approx(rate * deposit * dt)
+    assert explained['slippage'] == -hedge_cost
+    assert explained['pnl'] == pytest.approx(pv - hedge_cost - previous_pv + rate * deposit * dt)
+    assert explained['pnl'] == pytest.approx(sum(v for c, v in explained.items() if c != 'pnl'))
+
+
+def test_first_step_only_pays_the_rebalance():
+    explained = np.array(first_step_explain(np.array([0., .01])))
+
+    np.testing.assert_array_equal(explained[:, 0], 0.)
+    np.testing.assert_array_equal(explained[[0, 5], 1], -.01)
+    assert np.count_nonzero(explained) == 2
+
+
+@pytest.mark.parametrize('batch_sizes', [[40], [1] * 5 + [35], [13, 0, 27], [39, 1]])
+def test_streaming_stats_match_numpy(batch_sizes):
+    explain = _explain(sum(batch_sizes), 6)
+    stats = PnlExplainStats()
+    start = 0
+    for size in batch_sizes:
+        stats.update({c: v[start:start + size] for c, v in explain.items()})
+        start += size
+
+    assert stats.count == 40
+    for c, v in explain.items():
+        np.testing.assert_allclose(stats.step_mean[c], v.mean(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(stats.step_std[c], v.std(axis=0, ddof=1), rtol=1e-12)
+        assert stats.total_mean[c] == pytest.approx(v.sum(axis=1).mean(), rel=1e-12)
+        assert stats.total_std[c] == pytest.approx(v.sum(axis=1).std(ddof=1), rel=1e-12)
+
+
+def test_merged_stats_match_one_pass():
+    explain = _explain(30, 4, seed=1)
+    expected = PnlExplainStats().update(explain)
+    merged = PnlExplainStats().update({c: v[:7] for c, v in explain.items()}) \
+        .merge(PnlExplainStats().update({c: v[7:] for c, v in explain.items()})) \
+        .merge(PnlExplainStats())
+
+    assert merged.count == 30
+    for c in explain_columns:
+        np.testing.assert_allclose(merged.step_mean[c], expected.step_mean[c], rtol=1e-12)
+        np.testing.assert_allclose(merged.step_std[c], expected.step_std[c], rtol=1e-12)
+
+
+def test_single_path_stats():
+    explain = {c: v[0] for c, v in _explain(1, 5).items()}
+    stats = PnlExplainStats().update(explain)
+
+    assert stats.count == 1
+    np.testing.assert_array_equal(stats.step_mean['pnl'], explain['pnl'])
+    assert np.isnan(stats.step_std['pnl']).all()
+
+
+def test_stats_reject_other_step_counts_and_empty_results():
+    stats = PnlExplainStats()
+    with pytest.raises(ValueError):
+        stats.step_mean
+    stats.update(_explain(3, 5))
+    with pytest.raises(ValueError):
+        stats.update(_explain(3, 6))
@@ -1,10 +1,13 @@
 import datetime as dt
 
+import numpy as np
+import pandas as pd
 import pytest
 
-from sova.asset import StockOption, Deposit, Stock
+from sova.asset import AmericanStockOption, StockOption, Deposit, Stock
 from sova.black_scholes import OptionType
-from sova.portfolio import Portfolio, Trade
+from sova.cache import ValuationCache
+from sova.portfolio import Portfolio, Trade, TradeBlotter
 
 precision = 1e-5
 
@@ -82,3 +85,323 @@ def test_portfolio_hedges_has_corresponding_amounts(mult):
     deposit_hedge, stock_hedge = portfolio.hedge_delta(stock_price, market_time)
 
     assert pytest.approx(-1 * deposit_hedge.amount / stock_price, precision) == stock_hedge.amount
+
+
+def test_portfolio_nets_identical_contracts():
+    n = 50
+    trades = [Trade(market_time, 1., StockOption(amount=amount, expiry=expiry, strike=strike, sigma=sigma))
+              for _ in range(n)]
+    portfolio = Portfolio(trades=trades + [Trade(market_time, 1., Stock(1)), Trade(market_time, 1., Deposit(2))])
+    position = portfolio._position(market_time)
+
+    assert len(position.lines) == 1
+    assert pytest.approx(n * opt.current_price(1., market_time) + 3, precision) == portfolio.current_price(
+        1., market_time)
+    assert len(portfolio.trades) == n + 2
+
+
+def test_portfolio_respects_trade_time_cutoff():
+    later = market_time + dt.timedelta(days=10)
+    portfolio = Portfolio(trades=[Trade(later, 1., Stock(5)), Trade(market_time, 1., opt)])
+    portfolio.trade(later + dt.timedelta(days=1), 1., Deposit(3))
+    portfolio.trade(market_time - dt.timedelta(days=1), 1., Deposit(-1))
+
+    assert pytest.approx(-1, precision) == portfolio.current_price(1., market_time - dt.timedelta(hours=1))
+    assert pytest.approx(opt.current_price(1., market_time) - 1, precision) == portfolio.current_price(
+        1., market_time)
+    assert pytest.approx(opt.current_delta(1., later) + 5, precision) == portfolio.current_delta(1., later)
+    assert pytest.approx(0, precision) == portfolio.current_price(1., market_time - dt.timedelta(days=2))
+
+
+def test_portfolio_picks_up_trades_appended_to_log():
+    portfolio = Portfolio(trades=[Trade(market_time, 1., Stock(1))])
+    assert pytest.approx(1, precision) == portfolio.current_delta(1., market_time)
+
+    portfolio.trades.append(Trade(market_time, 1., Stock(2)))
+
+    assert pytest.approx(3, precision) == portfolio.current_delta(1., market_time)
+
+
+class _CustomAsset(Deposit):
+    pass
+
+
+def test_trade_blotter_round_trips_trades():
+    trades = [Trade(market_time + dt.timedelta(days=i), 1. + i, a)
+              for i, a in enumerate([opt, Deposit(3), Stock(-2), _CustomAsset(4)] * 10)]
+    portfolio = Portfolio(trades=trades)
+
+    assert len(portfolio.trades) == len(trades)
+    assert len(portfolio.blotter.rows) == len(trades)
+    for expected, actual in zip(trades, portfolio.trades):
+        assert expected.trade_time == actual.trade_time
+        assert expected.stock_price == actual.stock_price
+        assert type(expected.asset) is type(actual.asset)
+        assert expected.asset.amount == actual.asset.amount
+        assert expected.asset.contract_key == actual.asset.contract_key or type(actual.asset) is _CustomAsset
+    assert portfolio.trades[-1].asset is trades[-1].asset
+    assert [t.stock_price for t in portfolio.trades[2:4]] == [3., 4.]
+
+
+def test_trade_blotter_round_trips_times_and_caches_exactly():
+    aware = dt.datetime(2020, 1, 1, 9, 30, tzinfo=dt.timezone(dt.timedelta(hours=-5)))
+    cached = StockOption(amount=1, expiry=expiry, strike=strike, sigma=sigma, cache=ValuationCache())
+    aware_expiry = StockOption(amount=1, expiry=expiry.replace(tzinfo=dt.timezone.utc), strike=strike,
+                                sigma=sigma)
+    trades = [Trade(aware, 1., Stock(1)),
+              Trade(1577836800000000001, 1., Deposit(2)),
+              Trade(market_time, 1., cached),
+              Trade(market_time, 1., aware_expiry),
+              Trade(pd.Timestamp(1577836800000000001), 1., Deposit(1))]
+    portfolio = Portfolio(trades)
+
+    actual = list(portfolio.trades)
+    assert actual[0].trade_time is aware
+    assert type(actual[1].trade_time) is int and actual[1].trade_time == 1577836800000000001
+    assert type(actual[4].trade_time) is pd.Timestamp and actual[4].trade_time == trades[4].trade_time
+    assert list(portfolio.blotter._other_times) == [0]
+    assert actual[2].asset is cached and actual[2].asset.cache is cached.cache
+    assert actual[3].asset.expiry.tzinfo is dt.timezone.utc
+    assert portfolio.blotter.rows['kind'].tolist() == [TradeBlotter.STOCK, TradeBlotter.DEPOSIT,
+                                                       TradeBlotter.OTHER, TradeBlotter.OTHER, TradeBlotter.DEPOSIT]
+    later = market_time + dt.timedelta(days=1)
+    assert pytest.approx(2 * opt.current_price(1., later) + 4, precision) == portfolio.current_price(1., later)
+
+
+def test_trade_log_is_owned_by_the_portfolio():
+    trades = [Trade(market_time, 1., StockOption(amount=1, expiry=expiry, strike=strike, sigma=sigma))]
+    portfolio = Portfolio(trades, delta_threshold=.05)
+    portfolio.hedge_delta(1., market_time)
+
+    # Hedges go to the blotter, not to the list the portfolio was built from
+    assert len(trades) == 1
+    assert len(portfolio.trades) == 3
+    # Trades read back are snapshots, so editing them leaves the book alone
+    delta = portfolio.current_delta(1., market_time)
+    portfolio.trades[0].asset.amount = 10
+    portfolio.trades[-1].asset.amount = 10
+    assert portfolio.trades[0].asset.amount == 1
+    assert pytest.approx(delta, abs=1e-15) == portfolio.current_delta(1., market_time)
+
+
+def test_compact_drops_positions_before_horizon():
+    later = market_time + dt.timedelta(days=2)
+    portfolio = Portfolio([Trade(market_time, 1., opt)], trade_log=False)
+    for day in range(5):
+        portfolio.trade(market_time + dt.timedelta(days=day), 1., Stock(1))
+    expected = [portfolio.current_price(1., market_time + dt.timedelta(days=day, hours=1)) for day in range(2, 5)]
+
+    portfolio.compact(later + dt.timedelta(hours=1))
+
+    assert len(portfolio._positions) == 3
+    assert expected == [portfolio.current_price(1., market_time + dt.timedelta(days=day, hours=1))
+                        for day in range(2, 5)]
+    for call in [lambda: portfolio.current_price(1., later), lambda: portfolio.trade(later, 1., Stock(1)),
+                 lambda: portfolio.compact(later), lambda: portfolio.trades]:
+        with pytest.raises(ValueError):
+            call()
+
+
+def test_line_book_cache_keeps_only_the_latest_book():
+    portfolio = Portfolio([Trade(market_time, 1., opt)])
+    portfolio.trade(market_time + dt.timedelta(days=1), 1., Stock(1))
+    first = portfolio._line_book(portfolio._position(market_time))
+
+    assert first is portfolio._line_book(portfolio._position(market_time + dt.timedelta(days=1)))
+    for day in range(2, 12):
+        trade_time = market_time + dt.timedelta(days=day)
+        portfolio.trade(trade_time, 1., StockOption(amount, expiry, strike * day, sigma, OptionType.CALL))
+        portfolio.current_price(1., trade_time)
+
+        assert portfolio._line_book_cache[0] is portfolio._position(trade_time).lines
+    assert first is not portfolio._line_book(portfolio._position(market_time))
+
+
+def test_trade_blotter_grows_geometrically():
+    portfolio = Portfolio(trades=[])
+    for i in range(100):
+        portfolio.trade(market_time, 1., Stock(1))
+
+    assert len(portfolio.trades) == 100
+    assert portfolio.blotter.nbytes == 128 * portfolio.blotter.dtype.itemsize
+    assert pytest.approx(100, precision) == portfolio.current_delta(1., market_time)
+
+
+def _risk_portfolio():
+    put = StockOption(amount=-2, expiry=expiry - dt.timedelta(days=90), strike=.9 * strike, sigma=.3,
+                      option_type=OptionType.PUT)
+    expired = StockOption(amount=5, expiry=market_time - dt.timedelta(days=1), strike=strike, sigma=sigma)
+    return Portfolio([Trade(market_time, strike, a) for a in [opt, put, expired, Stock(-.3), Deposit(2),
+                                                              _CustomAsset(1), opt]])
+
+
+@pytest.mark.parametrize('mult', mults)
+def test_portfolio_risk_aggregates_positions(mult):
+    portfolio = _risk_portfolio()
+    stock_price = mult * strike
+    risk = portfolio.risk(stock_price, market_time)
+    keys, position_risk = portfolio.position_risk(stock_price, market_time)
+
+    assert pytest.approx(portfolio.current_price(stock_price, market_time), precision) == risk.price
+    assert pytest.approx(portfolio.current_delta(stock_price, market_time), precision) == risk.delta
+    assert keys[:2] == [Deposit(1).contract_key, Stock(1).contract_key] == [('Deposit',), ('Stock', None)]
+    assert len(keys) == 6
+    for field, value in zip(risk._fields, risk):
+        assert pytest.approx(value, precision) == getattr(position_risk, field).sum()
+    np.testing.assert_allclose([g[2] for g in position_risk], 2 * np.array(opt.risk(stock_price, market_time)))
+
+
+def test_portfolio_risk_scenarios_match_repricing():
+    portfolio = _risk_portfolio()
+    spot_shocks = [-.2, 0., .1]
+    vol_shocks = [-.05, 0., .1]
+    scenarios = portfolio.risk_scenarios(strike, market_time, .02, spot_shocks, vol_shocks)
+
+    assert scenarios.price.shape == (3, 3)
+    for i, spot_shock in enumerate(spot_shocks):
+        for j, vol_shock in enumerate(vol_shocks):
+            shocked = Portfolio([Trade(t.trade_time, t.stock_price, _shift_sigma(t.asset, vol_shock))
+                                 for t in portfolio.trades])
+            expected = shocked.risk(strike * (1 + spot_shock), market_time, .02)
+            np.testing.assert_allclose([g[i, j] for g in scenarios], expected, atol=1e-12)
+
+
+def _shift_sigma(asset, vol_shock):
+    if type(asset) is StockOption:
+        return StockOption(asset.amount, asset.expiry, asset.strike, asset.sigma + vol_shock, asset.option_type)
+    return asset
+
+
+@pytest.mark.parametrize('mult', mults)
+def test_portfolio_price_delta_in_one_pass(mult):
+    portfolio = _risk_portfolio()
+    stock_price = mult * strike
+
+    price, delta = portfolio.current_price_delta(stock_price, market_time)
+
+    assert price == portfolio.current_price(stock_price, market_time)
+    assert delta == portfolio.current_delta(stock_price, market_time)
+
+
+names = ['AAA', 'BBB', 'CCC']
+
+
+def _name_trades(underlying=None, scale=1.):
+    return [Trade(market_time, strike, StockOption(amount=scale, expiry=expiry, strike=strike, sigma=sigma,
+                                                   underlying=underlying)),
+            Trade(market_time, strike, StockOption(amount=-2 * scale, expiry=expiry - dt.timedelta(days=100),
+                                                   strike=1.1 * strike, sigma=.2, option_type=OptionType.PUT,
+                                                   underlying=underlying)),
+            Trade(market_time, strike, Stock(-.3 * scale, underlying)),
+            Trade(market_time, strike, Deposit(scale))]
+
+
+def test_book_risk_groups_by_underlying():
+    spots = {'AAA': .9, 'BBB': 1., 'CCC': 1.15}
+    book = Portfolio([t for i, u in enumerate(names) for t in _name_trades(u, i + 1)])
+    risk = book.book_risk(spots, market_time)
+
+    assert risk.underlyings == names
+    for i, u in enumerate(names):
+        single = Portfolio(_name_trades(scale=i + 1))
+        assert pytest.approx(single.current_delta(spots[u], market_time), precision) == risk.delta[i]
+        assert pytest.approx(single.risk(spots[u], market_time).gamma, precision) == risk.gamma[i]
+    assert pytest.approx(sum(Portfolio(_name_trades(scale=i + 1)).current_price(spots[u], market_time)
+                             for i, u in enumerate(names)), precision) == risk.price
+
+
+def test_book_risk_with_default_underlying_matches_scalar_valuation():
+    portfolio = Portfolio(_name_trades())
+    risk = portfolio.book_risk({None: 1.05}, market_time)
+
+    assert risk.underlyings == [None]
+    assert pytest.approx(portfolio.current_price(1.05, market_time), precision) == risk.price
+    assert pytest.approx(portfolio.current_delta(1.05, market_time), precision) == risk.delta[0]
+
+
+def test_position_risk_labels_the_stock_of_every_underlying():
+    trades = [t for i, u in enumerate(names) for t in _name_trades(u, i + 1)]
+    book = Portfolio(trades + [Trade(market_time, 1., Stock(2))])
+    keys, greeks = book.position_risk(1.05, market_time)
+
+    assert keys[:5] == [('Deposit',), ('Stock', None)] + [Stock(1, u).contract_key for u in names]
+    np.testing.assert_allclose(greeks.delta[1:5], [2., -.3, -.6, -.9])
+    np.testing.assert_allclose(greeks.price[1:5], 1.05 * greeks.delta[1:5])
+    assert pytest.approx(book.current_price(1.05, market_time), precision) == greeks.price.sum()
+
+
+def test_hedge_book_neutralizes_each_underlying():
+    spots = {'AAA': .9, 'BBB': 1., 'CCC': 1.15}
+    book = Portfolio([t for u in names for t in _name_trades(u)], delta_threshold=.05)
+    before = book.book_risk(spots, market_time)
+
+    hedges = book.hedge_book(spots, market_time)
+    after = book.book_risk(spots, market_time)
+
+    assert set(hedges) == set(names)
+    for i, u in enumerate(names):
+        hedge_deposit, hedge_asset = hedges[u]
+        assert hedge_asset.underlying == u
+        if abs(before.delta[i]) > .05:
+            assert pytest.approx(-before.delta[i], precision) == hedge_asset.amount
+            assert pytest.approx(-hedge_asset.amount * spots[u], precision) == hedge_deposit.amount
+        else:
+            assert hedge_asset.amount == 0
+    np.testing.assert_allclose(after.delta, np.where(np.abs(before.delta) > .05, 0, before.delta), atol=1e-12)
+    assert pytest.approx(before.price, precision) == after.price
+
+
+def test_trade_blotter_keeps_underlyings():
+    portfolio = Portfolio([t for u in names + [None] for t in _name_trades(u)])
+
+    for expected, actual in zip(portfolio.trades, [t for u in names + [None] for t in _name_trades(u)]):
+        assert expected.asset.contract_key == actual.asset.contract_key
+    assert portfolio.blotter.underlyings == [None] + names
+
+
+def test_stocks_on_different_underlyings_do_not_add():
+    assert (Stock(1, 'AAA') + Stock(2, 'AAA')).amount == 3
+    with pytest.raises(NotImplementedError):
+        Stock(1, 'AAA') + Stock(2, 'BBB')
+
+
+def _american_trades():
+    strikes = [.9, 1., 1.1]
+    return [Trade(market_time, strike, AmericanStockOption(amount=i - 1.5, expiry=expiry - dt.timedelta(days=30 * i),
+                                                           strike=k, sigma=.2, option_type=OptionType.PUT))
+            for i, k in enumerate(strikes)] + \
+        [Trade(market_time, strike, a) for a in [opt, Stock(.4), Deposit(-1), _CustomAsset(1)]]
+
+
+@pytest.mark.parametrize('mult', mults)
+def test_american_lines_are_valued_in_one_batch(mult):
+    portfolio = Portfolio(_american_trades())
+    cached = Portfolio(_american_trades(), valuation_cache=ValuationCache())
+    stock_price = mult * strike
+    lines = [t.asset for t in portfolio.trades]
+    expected_price = sum(a.current_price(stock_price, market_time, .03) for a in lines)
+    expected_delta = sum(a.current_delta(stock_price, market_time, .03) for a in lines)
+
+    for p in [portfolio, cached]:
+        price, delta = p.current_price_delta(stock_price, market_time, .03)
+        assert pytest.approx(expected_price, abs=1e-12) == price
+        assert pytest.approx(expected_delta, abs=1e-12) == delta
+        assert pytest.approx(expected_price, abs=1e-12) == p.current_price(stock_price, market_time, .03)
+        assert pytest.approx(expected_delta, abs=1e-12) == p.current_delta(stock_price, market_time, .03)
+
+
+@pytest.mark.parametrize('mult', mults)
+def test_american_lines_risk(mult):
+    portfolio = Portfolio(_american_trades())
+    stock_price = mult * strike
+    keys, position_risk = portfolio.position_risk(stock_price, market_time, .03)
+    expected = [np.array(a.risk(stock_price, market_time, .03)) for a in [t.asset for t in portfolio.trades][:3]]
+
+    np.testing.assert_allclose([g[2:5] for g in position_risk], np.transpose(expected), atol=1e-12)
+    book = portfolio.book_risk({None: stock_price}, market_time, .03)
+    risk = portfolio.risk(stock_price, market_time, .03)
+    assert pytest.approx(risk.price, abs=1e-12) == book.price
+    assert pytest.approx(risk.delta, abs=1e-12) == book.delta[0]
+    assert pytest.approx(risk.gamma, abs=1e-12) == book.gamma[0]
+    scenarios = portfolio.risk_scenarios(stock_price, market_time, .03, [0.], [0.])
+    np.testing.assert_allclose([g[0, 0] for g in scenarios], risk, atol=1e-12)
@@ -1,6 +1,21 @@
+import asyncio
+import datetime as dt
+import tracemalloc
+from itertools import islice
+
 import numpy as np
+import pandas as pd
+import pytest
 
+from conftest import assert_frame_close
+from sova import instrumentation
+from sova.asset import AmericanStockOption, StockOption
+from sova.batch_simulation import BatchHedgeSimulation
+from sova.black_scholes import OptionType
+from sova.hedge_policy import ThresholdPolicy, WhalleyWilmottPolicy
 from sova.market_data import generate_market_data
+from sova.pnl_explain import explain_columns
+from sova.portfolio import Portfolio, Trade
 from sova.simulation import HedgeSimulation
 
 
@@ -15,3 +30,211 @@ def test_simulation():
     sim_df = sim.run_simulation(md)
 
     print(sim_df.head())
+
+
+def _fake_feed(market_data):
+    for market_time, asset_price, risk_free_rate in zip(market_data.index, market_data.asset_price,
+                                                        market_data.risk_free_rate):
+        yield market_time.to_pydatetime(), asset_price, risk_free_rate
+
+
+def test_streaming_simulation_matches_run_simulation(market_data, notebook_portfolio):
+    expected = HedgeSimulation(notebook_portfolio()).run_simulation(market_data)
+    stream = HedgeSimulation(notebook_portfolio()).stream(_fake_feed(market_data))
+
+    first_time, first_row = next(stream)
+    assert first_time == market_data.index[0]
+    rows = dict([(first_time, first_row)] + list(stream))
+
+    pd.testing.assert_frame_equal(pd.DataFrame.from_dict(rows, orient='index'), expected, check_index_type=False)
+
+
+def test_async_streaming_simulation_matches_run_simulation(market_data, notebook_portfolio):
+    async def async_feed():
+        for tick in _fake_feed(market_data):
+            await asyncio.sleep(0)
+            yield tick
+
+    async def collect():
+        return {t: row async for t, row in HedgeSimulation(notebook_portfolio()).astream(async_feed())}
+
+    expected = HedgeSimulation(notebook_portfolio()).run_simulation(market_data)
+    rows = asyncio.run(collect())
+
+    pd.testing.assert_frame_equal(pd.DataFrame.from_dict(rows, orient='index'), expected, check_index_type=False)
+
+
+def test_streaming_simulation_needs_portfolio(market_data):
+    with pytest.raises(ValueError):
+        next(HedgeSimulation().stream(_fake_feed(market_data)))
+
+
+def test_run_simulation_returns_arrays(market_data, notebook_portfolio):
+    expected = HedgeSimulation(notebook_portfolio()).run_simulation(market_data)
+    arrays = HedgeSimulation(notebook_portfolio()).run_simulation(market_data, return_arrays=True)
+
+    assert list(arrays) == list(expected.columns)
+    for column, values in arrays.items():
+        np.testing.assert_array_equal(values, expected[column].values)
+    np.testing.assert_array_equal(expected.index, market_data.index)
+
+
+def test_book_simulation_matches_single_name_simulations(market_data):
+    names = ['AAA', 'BBB']
+    prices = pd.DataFrame({'AAA': market_data.asset_price.values, 'BBB': market_data.asset_price.values[::-1]},
+                          index=market_data.index)
+
+    def portfolio(underlying=None, prices_column='AAA'):
+        s_0 = prices[prices_column].iloc[0]
+        opt = StockOption(amount=1, expiry=market_data.index[-1].to_pydatetime(), strike=1.05 * s_0, sigma=.1,
+                          underlying=underlying)
+        return [Trade(market_data.index[0].to_pydatetime(), s_0, opt)]
+
+    book = Portfolio(portfolio('AAA', 'AAA') + portfolio('BBB', 'BBB'), .05)
+    result = HedgeSimulation(book).run_book_simulation(prices, market_data.risk_free_rate)
+
+    expected_pv = 0
+    for name in names:
+        single_data = market_data.assign(asset_price=prices[name].values)
+        expected = HedgeSimulation(Portfolio(portfolio(prices_column=name), .05)).run_simulation(single_data)
+        expected_pv = expected_pv + expected.porfolio_pv
+        for column in expected.columns.drop('porfolio_pv'):
+            np.testing.assert_allclose(result[column][name], expected[column], atol=1e-10)
+    np.testing.assert_allclose(result['porfolio_pv'], expected_pv, atol=1e-10)
+
+
+def test_american_call_simulation_matches_european(market_data, notebook_portfolio):
+    european = notebook_portfolio(strike_multiplier=1.)
+    american = notebook_portfolio(strike_multiplier=1., option_class=AmericanStockOption)
+    expected = HedgeSimulation(european).run_simulation(market_data)
+    result = HedgeSimulation(american).run_simulation(market_data)
+
+    assert_frame_close(result, expected, atol=1e-10)
+
+
+def test_american_put_simulation(market_data, notebook_portfolio):
+    def portfolio(option_class):
+        return notebook_portfolio(strike_multiplier=1., option_class=option_class, option_type=OptionType.PUT)
+
+    result = HedgeSimulation(portfolio(AmericanStockOption)).run_simulation(market_data)
+    european = HedgeSimulation(portfolio(StockOption)).run_simulation(market_data)
+
+    assert result.porfolio_pv.iloc[0] >= european.porfolio_pv.iloc[0]
+    assert (result.portfolio_hedged_delta.abs() <= .05 + 1e-12).all()
+    assert (result.hedge_asset_amount != 0).sum() > 0
+    with pytest.raises(NotImplementedError):
+        BatchHedgeSimulation(portfolio(AmericanStockOption)).simulate(market_data.asset_price.values, market_data.index)
+
+
+@pytest.fixture
+def costly_portfolio(notebook_portfolio):
+    # At the money books hedged at a cost, for the P&L explain
+    def make(option_class=StockOption, option_type=OptionType.CALL):
+        return notebook_portfolio(strike_multiplier=1., option_class=option_class, option_type=option_type,
+                                  hedge_policy=ThresholdPolicy(.05, transaction_cost=.001))
+
+    return make
+
+
+@pytest.mark.parametrize('option_class, option_type', [(StockOption, OptionType.CALL),
+                                                       (AmericanStockOption, OptionType.PUT)])
+def test_pnl_explain_reconciles_with_pv(option_class, option_type, market_data, costly_portfolio):
+    plain = HedgeSimulation(costly_portfolio(option_class, option_type)).run_simulation(market_data)
+    result = HedgeSimulation(costly_portfolio(option_class, option_type), explain=True).run_simulation(market_data)
+
+    assert list(result.columns) == list(plain.columns) + explain_columns
+    assert_frame_close(result[plain.columns], plain, atol=1e-12)
+    cost = -result.hedge_deposit_amount - result.hedge_asset_amount * result.asset_price
+    deposit = np.cumsum(result.hedge_deposit_amount.values)
+    dt = np.diff(result.index.values).astype(float) / 1e9 / (365 * 86400)
+    np.testing.assert_allclose(result.slippage, -cost, atol=1e-15)
+    np.testing.assert_allclose(result.carry_pnl.values[1:], market_data.risk_free_rate.values[:-1] * deposit[:-1] * dt,
+                               atol=1e-15)
+    np.testing.assert_allclose(result.pnl.cumsum(), result.porfolio_pv - cost - result.porfolio_pv.iloc[0]
+                               + result.carry_pnl.cumsum(), atol=1e-12)
+    np.testing.assert_allclose(result[explain_columns[1:]].sum(axis=1), result.pnl, atol=1e-12)
+    # Daily steps leave little to the higher order terms
+    assert result.unexplained_pnl.abs().sum() < .05 * result.pnl.abs().sum()
+
+
+def test_streaming_pnl_explain_matches_run_simulation(market_data, costly_portfolio):
+    expected = HedgeSimulation(costly_portfolio(), explain=True).run_simulation(market_data)
+    simulation = HedgeSimulation(costly_portfolio(), explain=True)
+    rows = dict(simulation.stream(_fake_feed(market_data)))
+
+    assert_frame_close(pd.DataFrame.from_dict(rows, orient='index'), expected, atol=1e-12)
+
+
+def _long_feed(n_ticks):
+    start = dt.datetime(2020, 1, 1)
+    prices = np.exp(np.cumsum(np.random.default_rng(0).normal(0., .002, n_ticks)))
+    for i, price in enumerate(prices.tolist()):
+        yield start + dt.timedelta(hours=i), price, .01
+
+
+def test_streaming_memory_stays_bounded():
+    opt = StockOption(amount=1, expiry=dt.datetime(2023, 1, 1), strike=1., sigma=.1)
+    portfolio = Portfolio([Trade(dt.datetime(2020, 1, 1), 1., opt)], delta_threshold=0., trade_log=False)
+    stream = HedgeSimulation(portfolio).stream(_long_feed(6000))
+
+    tracemalloc.start()
+    try:
+        for _ in islice(stream, 1000):
+            pass
+        before = tracemalloc.get_traced_memory()[0]
+        hedges = sum(row['hedge_asset_amount'] != 0 for _, row in stream)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    assert hedges > 4500
+    assert len(portfolio._positions) == 1
+    # Without compaction every hedge kept a position and a trade, over a hundred bytes each
+    assert after - before < 100_000
+
+
+def test_compacted_stream_matches_run_simulation(market_data, notebook_portfolio):
+    expected = HedgeSimulation(notebook_portfolio()).run_simulation(market_data)
+    rows = dict(HedgeSimulation(notebook_portfolio()).stream(_fake_feed(market_data)))
+    portfolio = notebook_portfolio()
+    uncompacted = dict(HedgeSimulation(portfolio).stream(_fake_feed(market_data), compact=False))
+
+    pd.testing.assert_frame_equal(pd.DataFrame.from_dict(rows, orient='index'), expected, check_index_type=False)
+    pd.testing.assert_frame_equal(pd.DataFrame.from_dict(uncompacted, orient='index'), expected,
+                                  check_index_type=False)
+    assert portfolio.current_price(1., market_data.index[0]) != 0
+
+
+@pytest.mark.parametrize('explain', [False, True])
+def test_gamma_policy_values_the_book_once_per_tick(explain, market_data, notebook_portfolio):
+    portfolio = notebook_portfolio()
+    portfolio.hedge_policy = WhalleyWilmottPolicy(.002)
+    with instrumentation.record() as recorder:
+        result = HedgeSimulation(portfolio, explain=explain).run_simulation(market_data)
+    valuations = recorder.to_dict()['valuation']
+
+    assert (result.hedge_asset_amount != 0).any()
+    assert valuations['Portfolio.position_risk']['calls'] == len(market_data)
+    assert sum(v['calls'] for v in valuations.values()) == len(market_data)
+
+
+@pytest.mark.parametrize('option_class, option_type', [(StockOption, OptionType.CALL),
+                                                       (AmericanStockOption, OptionType.PUT)])
+def test_threshold_policy_values_the_book_once_per_tick(option_class, option_type, market_data, notebook_portfolio):
+    with instrumentation.record() as recorder:
+        result = HedgeSimulation(notebook_portfolio(strike_multiplier=1., option_class=option_class,
+                                                    option_type=option_type)).run_simulation(market_data)
+    valuations = recorder.to_dict()['valuation']
+
+    assert (result.hedge_asset_amount != 0).sum() > 10
+    assert valuations['Portfolio.current_price_delta']['calls'] == len(market_data)
+    assert sum(v['calls'] for v in valuations.values()) == len(market_data)
+
+
+def test_simulation_hedges_need_no_side_objects_in_the_trade_log(market_data, notebook_portfolio):
+    portfolio = notebook_portfolio()
+    HedgeSimulation(portfolio).run_simulation(market_data)
+
+    assert len(portfolio.trades) > 1
+    assert not portfolio.blotter._other_times
+    assert all(type(t.trade_time) is int for t in portfolio.trades[1:])
@@ -0,0 +1,75 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from conftest import assert_frame_close
+from sova.batch_simulation import BatchHedgeSimulation
+from sova.market_data import generate_market_paths
+from sova.simulation import HedgeSimulation
+from sova.storage import ColumnStore, save_market_data, save_market_paths, save_simulation_result, \
+    write_market_paths
+
+def _paths(n_paths, seed):
+    return generate_market_paths(1e-5, np.array([.01]), np.array([.002]), n_paths=n_paths, n_obs=60, seed=seed)
+
+
+def test_market_data_round_trip(tmp_path, market_data):
+    save_market_data(market_data, str(tmp_path))
+    store = ColumnStore(str(tmp_path))
+
+    assert_frame_close(store.to_frame(), market_data, rtol=0)
+    assert isinstance(store.read('asset_price'), np.memmap)
+
+
+def test_market_data_time_slice_is_inclusive(tmp_path, market_data):
+    save_market_data(market_data, str(tmp_path))
+    store = ColumnStore(str(tmp_path))
+    start = dt.datetime(2020, 3, 1)
+    end = dt.datetime(2020, 3, 31)
+
+    prices = store.read('asset_price', start, end)
+
+    np.testing.assert_array_equal(prices, market_data.loc[start:end].asset_price.values)
+    assert_frame_close(store.to_frame(['asset_price'], start, end), market_data.loc[start:end, ['asset_price']], rtol=0)
+
+
+def test_market_paths_round_trip_and_selection(tmp_path):
+    paths = _paths(6, 1)
+    save_market_paths(paths, str(tmp_path))
+    store = ColumnStore(str(tmp_path))
+    loaded = store.to_market_paths()
+
+    np.testing.assert_array_equal(loaded.asset_price, paths.asset_price)
+    assert loaded.risk_free_rate == paths.risk_free_rate
+    assert (loaded.market_time == paths.market_time).all()
+
+    selected = store.read('asset_return', paths.market_time[5], paths.market_time[9], paths=slice(2, 4))
+    assert isinstance(selected, np.memmap)
+    np.testing.assert_array_equal(selected, paths.asset_return[2:4, 5:10])
+    assert_frame_close(store.to_frame(path=3), paths.path(3), rtol=0)
+
+
+def test_market_paths_written_in_blocks(tmp_path):
+    blocks = [_paths(3, seed) for seed in range(4)]
+    write_market_paths(str(tmp_path), iter(blocks), 12)
+    store = ColumnStore(str(tmp_path))
+
+    np.testing.assert_array_equal(store.read('asset_price'), np.concatenate([b.asset_price for b in blocks]))
+
+    with pytest.raises(ValueError):
+        write_market_paths(str(tmp_path / 'short'), iter(blocks), 13)
+
+
+def test_simulation_results_round_trip(tmp_path):
+    paths = _paths(3, 2)
+    batch_result = BatchHedgeSimulation().run_simulation(paths)
+    sim_df = HedgeSimulation().run_simulation(paths.path(0))
+    save_simulation_result(batch_result, str(tmp_path / 'batch'))
+    save_simulation_result(sim_df, str(tmp_path / 'single'))
+
+    batch_store = ColumnStore(str(tmp_path / 'batch'))
+    single_store = ColumnStore(str(tmp_path / 'single'))
+
+    np.testing.assert_array_equal(batch_store.read('porfolio_pv'), batch_result['porfolio_pv'])
+    assert_frame_close(single_store.to_frame(), sim_df, rtol=0)
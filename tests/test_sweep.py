@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sova.asset import StockOption
+from sova.market_data import generate_market_paths
+from sova.portfolio import Portfolio, Trade
+from sova.simulation import HedgeSimulation
+from sova.sweep import run_sweep
+
+param_grid = {'delta_threshold': [.05, .3], 'sigma': [.1, .2]}
+
+
+def test_sweep_is_deterministic_for_any_worker_count():
+    sweep1 = run_sweep(param_grid, n_paths=30, n_obs=60, seed=1, paths_per_task=8, max_workers=1)
+    sweep2 = run_sweep(param_grid, n_paths=30, n_obs=60, seed=1, paths_per_task=8, max_workers=2, chunksize=3)
+
+    pd.testing.assert_frame_equal(sweep1, sweep2)
+    assert len(sweep1) == 4
+    assert (sweep1.n_paths == 30).all()
+
+
+def test_sweep_lower_threshold_rebalances_more():
+    sweep = run_sweep({'delta_threshold': [.01, .3]}, n_paths=20, n_obs=60, max_workers=1)
+
+    assert sweep.n_rebalances_mean[0] > sweep.n_rebalances_mean[1]
+
+
+def test_sweep_matches_per_row_simulation():
+    params = {'delta_threshold': .1, 'otm_multiplier': 1.02, 'sigma': .15, 'a0': 1e-4, 'p_arr': (.01,),
+              'q_arr': (.02,)}
+    sweep = run_sweep({k: [v] for k, v in params.items()}, n_paths=1, n_obs=80, seed=4, max_workers=1)
+
+    paths = generate_market_paths(1e-4, np.array([.01]), np.array([.02]), n_paths=1, n_obs=80,
+                                  seed=np.random.SeedSequence(4, spawn_key=(0,)))
+    md = paths.path(0)
+    opt = StockOption(amount=1, expiry=md.index[-1].to_pydatetime(), strike=1.02 * md.asset_price.iloc[0], sigma=.15)
+    portfolio = Portfolio([Trade(md.index[0].to_pydatetime(), md.asset_price.iloc[0], opt)], .1)
+    sim_df = HedgeSimulation(portfolio).run_simulation(md)
+
+    assert pytest.approx(sim_df.porfolio_pv.iloc[-1], abs=1e-10) == sweep.final_pv_mean[0]
+    assert pytest.approx(np.std(np.diff(sim_df.porfolio_pv)), abs=1e-10) == sweep.hedge_error_std[0]
+    assert np.count_nonzero(sim_df.hedge_asset_amount) == sweep.n_rebalances_mean[0]
+
+
+def test_sweep_rejects_unknown_parameters():
+    with pytest.raises(ValueError):
+        run_sweep({'strike': [1.]}, max_workers=1)
+
+
+def test_sweep_reports_variance_reduced_pnl():
+    plain = run_sweep({'delta_threshold': [.05]}, n_paths=200, n_obs=120, paths_per_task=50, use_controls=False,
+                      max_workers=1)
+    reduced = run_sweep({'delta_threshold': [.05]}, n_paths=200, n_obs=120, paths_per_task=50, sampling='antithetic',
+                        max_workers=1)
+
+    assert np.isfinite(plain.pnl_stderr[0])
+    assert reduced.pnl_stderr[0] < plain.pnl_stderr[0]
+    assert abs(reduced.pnl_mean[0] - plain.pnl_mean[0]) < 4 * np.hypot(reduced.pnl_stderr[0], plain.pnl_stderr[0])